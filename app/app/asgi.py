@@ -3,6 +3,10 @@ ASGI config for app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Django 4.0 iterates streaming responses, such as topic exports, on the
+event loop, blocking it while each chunk is read. Serve those from the
+WSGI workers (app.wsgi) when running this callable.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 """
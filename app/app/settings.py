@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,6 +49,7 @@ INSTALLED_APPS = [
     'core',
     'user',
     'smmart',
+    'payments',
 
     # third party
     'rest_framework',
@@ -105,6 +107,57 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Cached tokens, entitlements and catalog versions are evicted through
+# the cache, so it must be shared by every process: the uwsgi workers
+# and the job workers. The default is a directory, which the compose
+# files mount in every container; deployments across hosts set
+# CACHE_BACKEND to Redis or Memcached. A process-local backend such as
+# LocMemCache turns those caches off.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'smmart-cache')
+        ),
+    }
+}
+
+# The file and local memory backends cull once CACHE_MAX_ENTRIES keys
+# are stored (Django's default is 300), dropping 1/CACHE_CULL_FREQUENCY
+# of them at random. Each active user holds two token keys, next to a
+# few per organization and the catalog and matcher keys, so the default
+# serves about 20000 active users before tokens are culled. Redis and
+# Memcached evict by memory and take no such options.
+if CACHES['default']['BACKEND'].endswith(('FileBasedCache', 'LocMemCache')):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 50000)),
+        'CULL_FREQUENCY': int(os.environ.get('CACHE_CULL_FREQUENCY', 10)),
+    }
+
+# Seconds a token -> user lookup stays in the cache
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 300))
+
+# Token lookups between two log lines of the token cache hit/miss counters
+AUTH_TOKEN_STATS_INTERVAL = int(
+    os.environ.get('AUTH_TOKEN_STATS_INTERVAL', 10000)
+)
+
+# Seconds the active package of an organization stays in the cache
+ENTITLEMENT_CACHE_TTL = int(os.environ.get('ENTITLEMENT_CACHE_TTL', 300))
+
+# Seconds between checks of the shared package/role catalog version
+CATALOG_VERSION_CHECK_INTERVAL = float(
+    os.environ.get('CATALOG_VERSION_CHECK_INTERVAL', 5)
+)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -157,6 +210,9 @@ REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": 'drf_spectacular.openapi.AutoSchema',
 }
 
+# Default page size of the keyset paginated list endpoints
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))
+
 SPECTACULAR_SETTINGS = {
     "COMPONENET_SPLIT_REQUEST": True,
 }
@@ -190,5 +246,124 @@ CORS_ALLOW_HEADERS = (
 STRIPE_PUBLIC_KEY = os.environ.get('STRIPE_PUBLIC_KEY')
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
 STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
+# Payments are confirmed by the payments.confirm background job; tests
+# and local setups point STRIPE_API_BASE at a Stripe stub
+STRIPE_API_BASE = os.environ.get(
+    'STRIPE_API_BASE', 'https://api.stripe.com'
+)
+
+REDIRECT_DOMAIN = os.environ.get('REDIRECT_DOMAIN')
+
 
-REDIRECT_DOMAIN = os.environ.get('REDIRECT_DOMAIN')
\ No newline at end of file
+# Data collection
+# Connector class per platform, see smmart.collectors
+COLLECTOR_CONNECTORS = {
+    'linkedin': 'smmart.collectors.stubs.LinkedInStubConnector',
+    'facebook': 'smmart.collectors.stubs.FacebookStubConnector',
+    'instagram': 'smmart.collectors.stubs.InstagramStubConnector',
+}
+COLLECTOR_SINK = 'smmart.ingest.store_posts'
+# Longest date range the topic rollups API returns
+ROLLUP_MAX_DAYS = int(os.environ.get('ROLLUP_MAX_DAYS', 366))
+# Trending terms: TRENDING_BUCKETS buckets of TRENDING_BUCKET_MINUTES are
+# kept per topic, each a TRENDING_SKETCH_WIDTH x TRENDING_SKETCH_DEPTH
+# count-min sketch plus its TRENDING_HITTERS most frequent terms
+TRENDING_BUCKET_MINUTES = int(os.environ.get('TRENDING_BUCKET_MINUTES', 60))
+TRENDING_BUCKETS = int(os.environ.get('TRENDING_BUCKETS', 24))
+TRENDING_RECENT_BUCKETS = int(os.environ.get('TRENDING_RECENT_BUCKETS', 3))
+TRENDING_SKETCH_WIDTH = int(os.environ.get('TRENDING_SKETCH_WIDTH', 1024))
+TRENDING_SKETCH_DEPTH = int(os.environ.get('TRENDING_SKETCH_DEPTH', 4))
+TRENDING_HITTERS = int(os.environ.get('TRENDING_HITTERS', 100))
+TRENDING_MIN_MENTIONS = int(os.environ.get('TRENDING_MIN_MENTIONS', 5))
+# Near-duplicate posts: MinHash signatures of NEAR_DUPLICATE_BANDS x
+# NEAR_DUPLICATE_ROWS slots; a post at least NEAR_DUPLICATE_THRESHOLD
+# similar to a stored one is clustered with it, unless the organization
+# sets its own threshold
+NEAR_DUPLICATE_BANDS = int(os.environ.get('NEAR_DUPLICATE_BANDS', 16))
+NEAR_DUPLICATE_ROWS = int(os.environ.get('NEAR_DUPLICATE_ROWS', 4))
+NEAR_DUPLICATE_THRESHOLD = float(
+    os.environ.get('NEAR_DUPLICATE_THRESHOLD', 0.7)
+)
+# Sentiment: posts are scored with the lexicon in smmart.sentiment hashed
+# into SENTIMENT_FEATURES weights, or with the weights of a trained model
+# saved as a .npy file at SENTIMENT_WEIGHTS. Scores are in (-1, 1) and
+# count as positive or negative from SENTIMENT_POLARITY
+SENTIMENT_FEATURES = int(os.environ.get('SENTIMENT_FEATURES', 2 ** 18))
+SENTIMENT_WEIGHTS = os.environ.get('SENTIMENT_WEIGHTS', '')
+SENTIMENT_POLARITY = float(os.environ.get('SENTIMENT_POLARITY', 0.25))
+# Texts per task when scoring on a process pool
+SENTIMENT_CHUNK_SIZE = int(os.environ.get('SENTIMENT_CHUNK_SIZE', 5000))
+# Similar topics and keyword suggestions: hashed embeddings of
+# EMBEDDING_DIMENSIONS stored in memory-mapped indexes under
+# VECTOR_INDEX_ROOT. Indexes of EMBEDDING_IVF_MIN_VECTORS or more are
+# clustered when rebuilt, and queries scan EMBEDDING_NPROBE clusters
+VECTOR_INDEX_ROOT = os.environ.get('VECTOR_INDEX_ROOT', '/vol/vectors')
+EMBEDDING_DIMENSIONS = int(os.environ.get('EMBEDDING_DIMENSIONS', 128))
+EMBEDDING_IVF_MIN_VECTORS = int(
+    os.environ.get('EMBEDDING_IVF_MIN_VECTORS', 50000)
+)
+EMBEDDING_NPROBE = int(os.environ.get('EMBEDDING_NPROBE', 32))
+# Topic prompts, see smmart.prompts: PROMPT_BACKEND answers batches of
+# up to PROMPT_BATCH_SIZE prompts, PROMPT_CONCURRENCY batches at a time,
+# each within PROMPT_TIMEOUT seconds. A topic's prompt runs over its
+# PROMPT_INPUT_POSTS latest posts of the day. Runs claim the prompts they
+# execute, and a claim older than PROMPT_CLAIM_TIMEOUT seconds is taken
+# over
+PROMPT_BACKEND = os.environ.get(
+    'PROMPT_BACKEND', 'smmart.prompts.stubs.StubBackend'
+)
+PROMPT_BATCH_SIZE = int(os.environ.get('PROMPT_BATCH_SIZE', 16))
+PROMPT_CONCURRENCY = int(os.environ.get('PROMPT_CONCURRENCY', 4))
+PROMPT_TIMEOUT = float(os.environ.get('PROMPT_TIMEOUT', 120))
+PROMPT_INPUT_POSTS = int(os.environ.get('PROMPT_INPUT_POSTS', 50))
+PROMPT_CLAIM_TIMEOUT = int(os.environ.get('PROMPT_CLAIM_TIMEOUT', 3600))
+# Topic metric time series, see smmart.timeseries: raw samples are kept
+# TIMESERIES_RAW_RETENTION_DAYS, their hourly aggregates
+# TIMESERIES_HOURLY_RETENTION_DAYS and daily aggregates
+# TIMESERIES_DAILY_RETENTION_DAYS, or for ever when 0
+TIMESERIES_RAW_RETENTION_DAYS = int(
+    os.environ.get('TIMESERIES_RAW_RETENTION_DAYS', 14)
+)
+TIMESERIES_HOURLY_RETENTION_DAYS = int(
+    os.environ.get('TIMESERIES_HOURLY_RETENTION_DAYS', 180)
+)
+TIMESERIES_DAILY_RETENTION_DAYS = int(
+    os.environ.get('TIMESERIES_DAILY_RETENTION_DAYS', 0)
+)
+# Background jobs, see core.jobs: run_worker runs JOB_CONCURRENCY
+# threads, each claiming JOB_BATCH_SIZE jobs at a time and polling every
+# JOB_POLL_INTERVAL seconds when idle. A failed job is retried after
+# JOB_RETRY_DELAY seconds, doubling up to JOB_RETRY_MAX_DELAY, until it
+# has run JOB_MAX_ATTEMPTS times. Jobs running for JOB_LOCK_TIMEOUT
+# seconds are requeued, and done jobs are deleted after JOB_KEEP_DAYS
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', 4))
+JOB_BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE', 10))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_DELAY = float(os.environ.get('JOB_RETRY_DELAY', 10))
+JOB_RETRY_MAX_DELAY = float(os.environ.get('JOB_RETRY_MAX_DELAY', 3600))
+JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT', 600))
+JOB_KEEP_DAYS = int(os.environ.get('JOB_KEEP_DAYS', 7))
+# Rows fetched from the database at a time by the topic export API
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+# Lines of the NDJSON post ingest endpoint stored per batch
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 500))
+INGEST_MAX_LINE_BYTES = int(
+    os.environ.get('INGEST_MAX_LINE_BYTES', 1024 * 1024)
+)
+COLLECTOR_CONCURRENCY = int(os.environ.get('COLLECTOR_CONCURRENCY', 16))
+COLLECTOR_TIMEOUT = float(os.environ.get('COLLECTOR_TIMEOUT', 10))
+COLLECTOR_QUEUE_SIZE = int(os.environ.get('COLLECTOR_QUEUE_SIZE', 1000))
+COLLECTOR_WINDOW_MINUTES = int(os.environ.get('COLLECTOR_WINDOW_MINUTES', 60))
+# Upstream quota per platform as (requests per second, burst)
+COLLECTOR_RATE_LIMITS = {
+    'linkedin': (5.0, 10),
+    'facebook': (20.0, 40),
+    'instagram': (10.0, 20),
+}
+# Share of each platform's quota per package tier
+COLLECTOR_TIER_WEIGHTS = {
+    'basic': 1,
+    'pro': 2,
+    'premium': 4,
+}
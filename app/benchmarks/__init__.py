@@ -0,0 +1,8 @@
+"""
+Benchmarks for the hot paths of the API.
+
+Modules are named bench_*.py so the regular test run skips them. Run
+them against the test database with:
+
+    python manage.py test benchmarks --pattern="bench_*.py"
+"""
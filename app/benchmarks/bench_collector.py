@@ -0,0 +1,52 @@
+"""
+Load test of the collection pipeline against stub connectors
+"""
+from datetime import datetime, timezone
+
+from django.test import SimpleTestCase
+
+from smmart.collectors import CollectJob, Collector, FetchRequest
+from smmart.collectors.stubs import (
+    FacebookStubConnector,
+    InstagramStubConnector,
+    LinkedInStubConnector,
+)
+
+REQUESTS = 3_000
+LATENCY = 0.05
+SINCE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+UNTIL = datetime(2024, 1, 1, 1, tzinfo=timezone.utc)
+
+
+class CollectorBenchmark(SimpleTestCase):
+
+    def test_throughput(self):
+        platforms = ['linkedin', 'facebook', 'instagram']
+        jobs = [
+            CollectJob(
+                FetchRequest(f'keyword {i}', platforms[i % 3], SINCE, UNTIL),
+                topic_ids=(i,),
+            )
+            for i in range(REQUESTS)
+        ]
+        for concurrency in [16, 64, 256]:
+            received = []
+            connectors = {
+                'linkedin': LinkedInStubConnector(latency=LATENCY),
+                'facebook': FacebookStubConnector(latency=LATENCY),
+                'instagram': InstagramStubConnector(latency=LATENCY),
+            }
+            stats = Collector(
+                connectors,
+                sink=lambda batch: received.extend(batch),
+                concurrency=concurrency,
+                timeout=5,
+                queue_size=1000,
+            ).collect(jobs)
+            self.assertEqual(len(received), stats.posts)
+            print(
+                f'\nconcurrency {concurrency}: {REQUESTS} requests at '
+                f'{LATENCY * 1000:.0f} ms in {stats.elapsed:.2f}s, '
+                f'{stats.requests / stats.elapsed:.0f} requests/s, '
+                f'{stats.posts / stats.elapsed:.0f} posts/s'
+            )
@@ -0,0 +1,49 @@
+"""
+Benchmark draining a backlog of due subscriptions
+"""
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import Organization, Package, PackageStatus
+
+BACKLOG = 50_000
+
+
+class ExpirePackagesBenchmark(TestCase):
+
+    def setUp(self):
+        basic = Package.objects.create(name='basic')
+        organizations = Organization.objects.bulk_create(
+            Organization(name=f'org{i}') for i in range(BACKLOG)
+        )
+        now = timezone.now()
+        PackageStatus.objects.bulk_create(
+            PackageStatus(
+                organization=organization,
+                package=basic,
+                start_date=now - timezone.timedelta(days=30),
+                end_date=now - timezone.timedelta(minutes=i),
+                status='y',
+            )
+            for i, organization in enumerate(organizations)
+        )
+
+    def test_drain_backlog(self):
+        for batch_size in [1000, 5000]:
+            PackageStatus.objects.update(status='y')
+            start = time.perf_counter()
+            call_command(
+                'expire_packages', batch_size=batch_size, stdout=StringIO()
+                )
+            elapsed = time.perf_counter() - start
+            self.assertFalse(
+                PackageStatus.objects.filter(status='y').exists()
+                )
+            print(
+                f'\nbatch {batch_size}: {BACKLOG} rows in {elapsed:.2f}s, '
+                f'{BACKLOG / elapsed:.0f} rows/s'
+            )
@@ -0,0 +1,75 @@
+"""
+Benchmark the memory and throughput of streaming topic exports
+"""
+import random
+import string
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Organization, Topics
+from smmart.collectors import CollectedPost
+from smmart.ingest import store_posts
+
+SIZES = [5_000, 50_000]
+PUBLISHED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class ExportBenchmark(TestCase):
+
+    def setUp(self):
+        organization = Organization.objects.create(name='bench')
+        self.user = get_user_model().objects.create(
+            email='bench@example.com', organization=organization,
+            package=None, role=None,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def make_topic(self, rows):
+        rng = random.Random(rows)
+        vocabulary = [
+            ''.join(rng.choices(string.ascii_lowercase, k=6))
+            for _ in range(5000)
+        ]
+        topic = Topics.objects.create(user=self.user, name=f'{rows} rows')
+        for start in range(0, rows, 5000):
+            store_posts([
+                CollectedPost(
+                    platform='linkedin',
+                    external_id=f'{topic.id}-{i}',
+                    text=' '.join(rng.choices(vocabulary, k=30)),
+                    published_at=PUBLISHED,
+                    keyword='bench',
+                    topic_ids=(topic.id,),
+                )
+                for i in range(start, min(start + 5000, rows))
+            ])
+        return topic
+
+    def test_memory_is_flat(self):
+        print()
+        for rows in SIZES:
+            topic = self.make_topic(rows)
+            url = reverse('smmart:topics-export', args=[topic.id])
+            for params in [{}, {'type': 'ndjson', 'gzip': 'true'}]:
+                tracemalloc.start()
+                start = time.perf_counter()
+                size = 0
+                for chunk in self.client.get(url, params).streaming_content:
+                    size += len(chunk)
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(
+                    f'{rows} rows {params.get("type", "csv")}'
+                    f'{" gzip" if params else ""}: {size / 1e6:.1f} MB in '
+                    f'{elapsed:.2f}s, {rows / elapsed:.0f} rows/s, '
+                    f'peak {peak / 1e6:.1f} MB'
+                )
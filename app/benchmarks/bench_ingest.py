@@ -0,0 +1,70 @@
+"""
+Benchmark storing collected posts in batches
+"""
+import time
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core.models import Organization, Post, Topics
+from smmart.collectors import CollectedPost
+from smmart.ingest import store_posts
+
+POSTS = 50_000
+TOPICS = 20
+PUBLISHED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class IngestBenchmark(TestCase):
+
+    def setUp(self):
+        organization = Organization.objects.create(name='bench')
+        user = get_user_model().objects.create(
+            email='bench@example.com', organization=organization,
+            package=None, role=None,
+        )
+        self.topic_ids = [
+            topic.id for topic in Topics.objects.bulk_create(
+                Topics(user=user, name=f'topic {i}') for i in range(TOPICS)
+            )
+        ]
+
+    def make_posts(self, start, count):
+        platforms = ['linkedin', 'facebook', 'instagram']
+        return [
+            CollectedPost(
+                platform=platforms[i % 3],
+                external_id=str(i),
+                text=f'post {i} about keyword {i % 100}',
+                author=f'author {i % 1000}',
+                published_at=PUBLISHED,
+                keyword=f'keyword {i % 100}',
+                topic_ids=(self.topic_ids[i % TOPICS],),
+            )
+            for i in range(start, start + count)
+        ]
+
+    def test_rows_per_second(self):
+        for batch_size in [100, 500, 2000]:
+            Post.objects.all().delete()
+            batches = [
+                self.make_posts(start, batch_size)
+                for start in range(0, POSTS, batch_size)
+            ]
+            start = time.perf_counter()
+            stored = sum(store_posts(batch).stored for batch in batches)
+            elapsed = time.perf_counter() - start
+            self.assertEqual(stored, POSTS)
+
+            start = time.perf_counter()
+            duplicates = sum(
+                store_posts(batch).duplicates for batch in batches
+            )
+            replay = time.perf_counter() - start
+            self.assertEqual(duplicates, POSTS)
+            print(
+                f'\nbatch {batch_size}: {POSTS} posts in {elapsed:.2f}s, '
+                f'{POSTS / elapsed:.0f} rows/s; replayed as duplicates '
+                f'at {POSTS / replay:.0f} rows/s'
+            )
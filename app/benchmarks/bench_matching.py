@@ -0,0 +1,54 @@
+"""
+Benchmark routing posts to topics with the keyword automaton
+"""
+import random
+import string
+import time
+
+from django.test import SimpleTestCase
+
+from smmart.matching import TopicMatcher
+
+KEYWORDS = 100_000
+TOPICS = 20_000
+POSTS = 5_000
+
+
+def random_word(rng):
+    return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9)))
+
+
+class MatchingBenchmark(SimpleTestCase):
+
+    def test_posts_per_second(self):
+        rng = random.Random(42)
+        vocabulary = [random_word(rng) for _ in range(60_000)]
+        keywords = set()
+        while len(keywords) < KEYWORDS:
+            phrase = rng.choices(vocabulary, k=rng.randint(1, 3))
+            keywords.add(' '.join(phrase))
+        keywords = list(keywords)
+
+        matcher = TopicMatcher()
+        for topic_id in range(TOPICS):
+            matcher.set_topic(topic_id, rng.sample(keywords, 5))
+        # Every keyword is tracked by at least one topic
+        for index, keyword in enumerate(keywords):
+            matcher.set_topic(TOPICS + index, [keyword])
+
+        start = time.perf_counter()
+        matcher.match('warm up')
+        build = time.perf_counter() - start
+
+        posts = [
+            ' '.join(rng.choices(vocabulary, k=40)) for _ in range(POSTS)
+        ]
+        start = time.perf_counter()
+        matched = sum(len(matcher.match(post)) for post in posts)
+        elapsed = time.perf_counter() - start
+
+        print(
+            f'\n{KEYWORDS} keywords, {len(matcher)} topics: '
+            f'build {build:.2f}s, {POSTS / elapsed:.0f} posts/s, '
+            f'{matched / POSTS:.1f} topics per post'
+        )
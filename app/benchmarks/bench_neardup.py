@@ -0,0 +1,113 @@
+"""
+Benchmark near-duplicate detection on a synthetic corpus
+"""
+import random
+import string
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from core.models import Organization, Topics
+from smmart import neardup
+from smmart.collectors import CollectedPost
+from smmart.ingest import store_posts
+
+ORIGINALS = 10_000
+VARIANTS = 10_000
+WORDS = 30
+PUBLISHED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def random_word(rng):
+    return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+
+
+def make_corpus(rng):
+    """Originals and variants of them with 0 to 6 words replaced"""
+    vocabulary = [random_word(rng) for _ in range(20_000)]
+    originals = [
+        rng.choices(vocabulary, k=WORDS) for _ in range(ORIGINALS)
+    ]
+    variants = []
+    for _ in range(VARIANTS):
+        source = rng.randrange(ORIGINALS)
+        words = list(originals[source])
+        for position in rng.sample(range(WORDS), rng.randint(0, 6)):
+            words[position] = rng.choice(vocabulary)
+        variants.append((source, ' '.join(words)))
+    return [' '.join(words) for words in originals], variants
+
+
+def jaccard(first, second):
+    first, second = neardup.shingles(first), neardup.shingles(second)
+    first, second = set(first.tolist()), set(second.tolist())
+    return len(first & second) / len(first | second)
+
+
+class NearDuplicateBenchmark(SimpleTestCase):
+
+    def test_precision_and_throughput(self):
+        rng = random.Random(42)
+        originals, variants = make_corpus(rng)
+        threshold = settings.NEAR_DUPLICATE_THRESHOLD
+
+        start = time.perf_counter()
+        index = neardup.LSHIndex()
+        for ref, text in enumerate(originals):
+            index.add(ref, neardup.signature(text))
+        matches = [
+            index.best(neardup.signature(text)) for _, text in variants
+        ]
+        elapsed = time.perf_counter() - start
+
+        found = relevant = correct = 0
+        for (source, text), (ref, similarity) in zip(variants, matches):
+            actual = jaccard(originals[source], text) >= threshold
+            predicted = ref is not None and similarity >= threshold
+            relevant += actual
+            found += predicted
+            correct += actual and predicted and ref == source
+        posts = ORIGINALS + VARIANTS
+        print(
+            f'\n{posts} posts in {elapsed:.2f}s, {posts / elapsed:.0f} '
+            f'posts/s; threshold {threshold}: precision '
+            f'{correct / max(found, 1):.3f}, recall '
+            f'{correct / max(relevant, 1):.3f}'
+        )
+
+
+class StoreNearDuplicatesBenchmark(TestCase):
+
+    def test_posts_per_second(self):
+        organization = Organization.objects.create(name='bench')
+        user = get_user_model().objects.create(
+            email='bench@example.com', organization=organization,
+            package=None, role=None,
+        )
+        topic = Topics.objects.create(user=user, name='bench')
+        originals, variants = make_corpus(random.Random(7))
+        texts = originals + [text for _, text in variants]
+        posts = [
+            CollectedPost(
+                platform='linkedin', external_id=str(i), text=text,
+                published_at=PUBLISHED, keyword='bench',
+                topic_ids=(topic.id,),
+            )
+            for i, text in enumerate(texts)
+        ]
+
+        start = time.perf_counter()
+        stored = near = 0
+        for offset in range(0, len(posts), 500):
+            stats = store_posts(posts[offset:offset + 500])
+            stored += stats.stored
+            near += stats.near_duplicates
+        elapsed = time.perf_counter() - start
+        print(
+            f'\nstored {len(posts)} posts in {elapsed:.2f}s, '
+            f'{len(posts) / elapsed:.0f} posts/s: {stored} stored, '
+            f'{near} near duplicates'
+        )
@@ -0,0 +1,82 @@
+"""
+Benchmark batch sentiment scoring against a per-text Python loop
+"""
+import functools
+import math
+import random
+import string
+import time
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from smmart.matching import tokenize
+from smmart.sentiment import (
+    ALPHA,
+    LEXICON,
+    NEGATION_WINDOW,
+    NEGATIONS,
+    feature,
+    get_model,
+    process_pool,
+    score_texts,
+)
+
+POSTS = 200_000
+WORDS = 40
+
+
+def python_scorer(model):
+    """The model's scoring of one text, in plain Python"""
+    weights = {
+        int(index): float(model.weights[index])
+        for index in np.flatnonzero(model.weights)
+    }
+    index = functools.lru_cache(maxsize=None)(
+        functools.partial(feature, dimensions=model.dimensions)
+    )
+
+    def score_text(text):
+        total = 0.0
+        since_negation = NEGATION_WINDOW + 1
+        for token in tokenize(text):
+            weight = weights.get(index(token), 0.0)
+            total += -weight if since_negation <= NEGATION_WINDOW \
+                else weight
+            since_negation = 1 if token in NEGATIONS \
+                else since_negation + 1
+        return total / math.sqrt(total * total + ALPHA)
+
+    return score_text
+
+
+class SentimentBenchmark(SimpleTestCase):
+
+    def test_texts_per_second(self):
+        rng = random.Random(42)
+        vocabulary = [
+            ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+            for _ in range(20_000)
+        ] + list(LEXICON) * 20 + list(NEGATIONS) * 20
+        texts = [
+            ' '.join(rng.choices(vocabulary, k=WORDS)) for _ in range(POSTS)
+        ]
+
+        score_text = python_scorer(get_model())
+        start = time.perf_counter()
+        baseline = [score_text(text) for text in texts]
+        loop = time.perf_counter() - start
+        print(f'\nper-text loop: {POSTS / loop:.0f} texts/s')
+
+        for workers in [1, 4]:
+            executor = process_pool(workers)
+            start = time.perf_counter()
+            scores = score_texts(texts, executor)
+            elapsed = time.perf_counter() - start
+            if executor is not None:
+                executor.shutdown()
+            np.testing.assert_allclose(scores, baseline, atol=1e-5)
+            print(
+                f'batch, {workers} process(es): {POSTS / elapsed:.0f} '
+                f'texts/s, {loop / elapsed:.1f}x the loop'
+            )
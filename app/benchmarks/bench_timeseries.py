@@ -0,0 +1,154 @@
+"""
+Benchmark array-block time series against one row per sample
+"""
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from core.models import Organization, Topics
+from smmart.timeseries import read, record
+
+TOPICS = 50
+METRICS = ['mentions', 'sentiment']
+DAYS = 14
+STEP = 300
+QUERIES = 50
+NOW = datetime(2024, 1, 15, tzinfo=timezone.utc)
+START = NOW - timedelta(days=DAYS)
+
+
+def database_bytes():
+    """Size of the SQLite database, None elsewhere"""
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA page_count')
+        pages = cursor.fetchone()[0]
+        cursor.execute('PRAGMA page_size')
+        return pages * cursor.fetchone()[0]
+
+
+class TimeSeriesBenchmark(TestCase):
+
+    def setUp(self):
+        organization = Organization.objects.create(name='bench')
+        user = get_user_model().objects.create(
+            email='bench@example.com', organization=organization,
+            package=None, role=None,
+        )
+        self.topic_ids = [
+            topic.id for topic in Topics.objects.bulk_create(
+                Topics(user=user, name=f'topic {i}') for i in range(TOPICS)
+            )
+        ]
+        rng = np.random.default_rng(0)
+        self.times = np.arange(
+            int(START.timestamp()), int(NOW.timestamp()), STEP
+        )
+        self.values = {
+            (topic_id, metric): rng.poisson(50, len(self.times))
+            .astype(np.float32)
+            for topic_id in self.topic_ids for metric in METRICS
+        }
+
+    def create_rows_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TABLE bench_sample (topic_id integer, '
+                'metric varchar(32), ts bigint, value real)'
+            )
+            cursor.execute(
+                'CREATE INDEX bench_sample_idx '
+                'ON bench_sample (topic_id, metric, ts)'
+            )
+
+    def test_storage_and_queries(self):
+        samples = len(self.values) * len(self.times)
+        print(f'\n{samples} samples')
+
+        self.create_rows_table()
+        before = database_bytes()
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            for (topic_id, metric), values in self.values.items():
+                cursor.executemany(
+                    'INSERT INTO bench_sample VALUES (%s, %s, %s, %s)',
+                    [
+                        (topic_id, metric, int(ts), float(value))
+                        for ts, value in zip(self.times, values)
+                    ],
+                )
+        rows_write = time.perf_counter() - start
+        rows_size = database_bytes() - before if before else None
+
+        before = database_bytes()
+        start = time.perf_counter()
+        for (topic_id, metric), values in self.values.items():
+            record([
+                (topic_id, metric,
+                 datetime.fromtimestamp(ts, tz=timezone.utc), value)
+                for ts, value in zip(self.times.tolist(), values.tolist())
+            ], now=NOW)
+        blocks_write = time.perf_counter() - start
+        blocks_size = database_bytes() - before if before else None
+
+        print(
+            f'rows:   write {samples / rows_write:.0f} samples/s'
+            + (f', {rows_size / 1e6:.1f} MB' if rows_size else '')
+        )
+        print(
+            f'blocks: write {samples / blocks_write:.0f} samples/s'
+            + (f', {blocks_size / 1e6:.1f} MB' if blocks_size else '')
+        )
+
+        topic_id = self.topic_ids[0]
+        day_start = NOW - timedelta(days=1)
+        with connection.cursor() as cursor:
+            start = time.perf_counter()
+            for _ in range(QUERIES):
+                cursor.execute(
+                    'SELECT ts, value FROM bench_sample WHERE topic_id = %s '
+                    'AND metric = %s AND ts >= %s AND ts < %s ORDER BY ts',
+                    [topic_id, 'mentions', int(day_start.timestamp()),
+                     int(NOW.timestamp())],
+                )
+                rows = np.array(cursor.fetchall())
+            rows_day = (time.perf_counter() - start) / QUERIES
+
+            start = time.perf_counter()
+            for _ in range(QUERIES):
+                cursor.execute(
+                    'SELECT ts / 3600, COUNT(*), AVG(value), MIN(value), '
+                    'MAX(value) FROM bench_sample WHERE topic_id = %s '
+                    'AND metric = %s AND ts >= %s AND ts < %s '
+                    'GROUP BY ts / 3600 ORDER BY ts / 3600',
+                    [topic_id, 'mentions', int(START.timestamp()),
+                     int(NOW.timestamp())],
+                )
+                hours = cursor.fetchall()
+            rows_hourly = (time.perf_counter() - start) / QUERIES
+
+        start = time.perf_counter()
+        for _ in range(QUERIES):
+            series = read(topic_id, 'mentions', day_start, NOW, tier='raw')
+        blocks_day = (time.perf_counter() - start) / QUERIES
+        self.assertEqual(series.mean.tolist(), rows[:, 1].tolist())
+
+        start = time.perf_counter()
+        for _ in range(QUERIES):
+            hourly = read(topic_id, 'mentions', START, NOW, tier='1h')
+        blocks_hourly = (time.perf_counter() - start) / QUERIES
+        self.assertEqual(len(hourly.times), len(hours))
+
+        print(
+            f'1 day raw:      rows {rows_day * 1000:.2f} ms, '
+            f'blocks {blocks_day * 1000:.2f} ms'
+        )
+        print(
+            f'{DAYS} days hourly: rows {rows_hourly * 1000:.2f} ms, '
+            f'blocks {blocks_hourly * 1000:.2f} ms'
+        )
@@ -0,0 +1,64 @@
+"""
+Benchmark switching the package of a large organization
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from core.models import Organization, Package, PackageStatus, UserRole
+
+ASSIGN_PACKAGE_URL = reverse('smmart:assign-package')
+USERS_PER_ORGANIZATION = 10_000
+
+
+class UpdatePackageBenchmark(TestCase):
+
+    def setUp(self):
+        self.organization = Organization.objects.create(name='large')
+        basic = Package.objects.create(name='basic')
+        Package.objects.create(name='pro')
+        role = UserRole.objects.create(id=1, name='admin')
+        get_user_model().objects.bulk_create(
+            get_user_model()(
+                email=f'user{i}@example.com',
+                organization=self.organization,
+                package=basic,
+                role=role,
+            )
+            for i in range(USERS_PER_ORGANIZATION)
+        )
+        now = timezone.now()
+        PackageStatus.objects.create(
+            organization=self.organization,
+            package=basic,
+            start_date=now,
+            end_date=now + timezone.timedelta(hours=72),
+            status='y',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(
+            user=get_user_model().objects.first()
+            )
+
+    def test_switch_package(self):
+        for name in ['pro', 'basic', 'pro']:
+            # The cached tokens are evicted once the switch commits, which
+            # is part of its cost
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                with self.captureOnCommitCallbacks(execute=True) as commits:
+                    res = self.client.put(ASSIGN_PACKAGE_URL, {'name': name})
+                elapsed = time.perf_counter() - start
+            self.assertTrue(commits)
+            self.assertEqual(res.status_code, 200)
+            print(
+                f'\nswitch to {name}: {USERS_PER_ORGANIZATION} users, '
+                f'{len(queries)} queries, {elapsed * 1000:.1f} ms'
+            )
@@ -0,0 +1,80 @@
+"""
+Benchmark top-k queries of a vector index of a million vectors
+"""
+import tempfile
+import time
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from smmart.vectors import VectorIndex
+
+VECTORS = 1_000_000
+DIMENSIONS = 128
+CLUSTERS = 2_000
+QUERIES = 100
+K = 10
+
+
+def clustered_vectors(count, rng):
+    """Unit vectors around random centers, like embeddings of topics"""
+    centers = rng.standard_normal((CLUSTERS, DIMENSIONS), dtype=np.float32)
+    vectors = centers[rng.integers(0, CLUSTERS, count)]
+    vectors += rng.standard_normal(vectors.shape, dtype=np.float32) * 0.8
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+class VectorIndexBenchmark(SimpleTestCase):
+
+    def test_query_latency(self):
+        rng = np.random.default_rng(42)
+        vectors = clustered_vectors(VECTORS, rng)
+        queries = clustered_vectors(QUERIES, rng)
+
+        with tempfile.TemporaryDirectory() as directory:
+            index = VectorIndex(directory, DIMENSIONS)
+            start = time.perf_counter()
+            for first in range(0, VECTORS, 100_000):
+                index.add(
+                    range(first, first + 100_000),
+                    vectors[first:first + 100_000],
+                )
+            elapsed = time.perf_counter() - start
+            print(f'\nadd: {VECTORS / elapsed:.0f} vectors/s')
+
+            # A new process resolves ids without reading every one first
+            reader = VectorIndex(directory, DIMENSIONS)
+            start = time.perf_counter()
+            for vector_id in range(0, VECTORS, VECTORS // 1000):
+                assert vector_id in reader
+            elapsed = time.perf_counter() - start
+            print(f'open + 1000 lookups: {elapsed * 1000:.1f} ms')
+
+            start = time.perf_counter()
+            exact = [index.search(query, k=K) for query in queries]
+            exhaustive = (time.perf_counter() - start) / QUERIES
+            print(f'exhaustive: {exhaustive * 1000:.1f} ms/query')
+
+            lists = int(4 * np.sqrt(VECTORS))
+            start = time.perf_counter()
+            index.train(lists=lists)
+            print(
+                f'train {lists} lists: {time.perf_counter() - start:.1f}s'
+            )
+
+            for nprobe in [8, 16, 32]:
+                start = time.perf_counter()
+                found = [
+                    index.search(query, k=K, nprobe=nprobe)
+                    for query in queries
+                ]
+                elapsed = (time.perf_counter() - start) / QUERIES
+                recall = np.mean([
+                    len({i for i, _ in hits} & {i for i, _ in truth}) / K
+                    for hits, truth in zip(found, exact)
+                ])
+                print(
+                    f'nprobe {nprobe}: {elapsed * 1000:.2f} ms/query, '
+                    f'recall@{K} {recall:.2f}'
+                )
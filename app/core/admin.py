@@ -50,4 +50,6 @@ admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Organization)
 admin.site.register(models.Package)
 admin.site.register(models.UserRole)
-admin.site.register(models.Payment)
\ No newline at end of file
+admin.site.register(models.Payment)
+admin.site.register(models.Job)
+admin.site.register(models.StripeCustomer)
\ No newline at end of file
@@ -0,0 +1,200 @@
+"""
+Cached token authentication
+"""
+import hashlib
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from core.caching import is_shared
+
+TOKEN_KEY_PREFIX = 'auth:token:'
+USER_KEY_PREFIX = 'auth:user:'
+ORGANIZATION_KEY_PREFIX = 'auth:organization:'
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStats:
+    """
+    Hit/miss counters of the token cache for this process, logged every
+    AUTH_TOKEN_STATS_INTERVAL lookups
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+            self._report()
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+            self._report()
+
+    def _report(self):
+        interval = settings.AUTH_TOKEN_STATS_INTERVAL
+        total = self.hits + self.misses
+        if interval and total % interval == 0:
+            logger.info(
+                'Token cache: %d hits, %d misses, %.1f%% hit ratio',
+                self.hits, self.misses, 100 * self.hits / total,
+            )
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+
+stats = CacheStats()
+
+
+def token_cache_key(key):
+    """Cache key for a token, the raw token never leaves the process"""
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'{TOKEN_KEY_PREFIX}{digest}'
+
+
+def user_cache_key(user_id):
+    return f'{USER_KEY_PREFIX}{user_id}'
+
+
+def organization_cache_key(organization_id):
+    return f'{ORGANIZATION_KEY_PREFIX}{organization_id}'
+
+
+def organization_generation(organization_id):
+    """
+    The current generation of an organization's cached tokens, which
+    are only served while it is the one they were cached under
+    """
+    key = organization_cache_key(organization_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Culled or never set: a new one drops whatever was cached under
+        # the old one
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def evict_users(user_ids):
+    """Drop the cached tokens of the given users"""
+    user_keys = [user_cache_key(user_id) for user_id in user_ids]
+    if not user_keys:
+        return
+    token_keys = cache.get_many(user_keys)
+    cache.delete_many(user_keys + list(token_keys.values()))
+
+
+def evict_organizations(organization_ids):
+    """
+    Drop the cached tokens of every user in the organizations, with one
+    cache write per organization however many users it has.
+
+    Needed after set-based updates, which do not send post_save.
+    """
+    cache.set_many({
+        organization_cache_key(organization_id): uuid.uuid4().hex
+        for organization_id in organization_ids
+    }, timeout=None)
+
+
+def evict_organization(organization_id):
+    """Drop the cached tokens of every user in an organization"""
+    evict_organizations([organization_id])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that keeps token -> user in the cache.
+
+    Entries live for AUTH_TOKEN_CACHE_TTL seconds and are evicted when
+    the user or the token is saved or deleted (logout, password change,
+    is_active change, token rotation), or when evict_organizations()
+    moves the generation of the user's organization they carry. With a
+    process-local cache every
+    lookup goes to the database, since the evictions of one worker
+    would not reach the others.
+    """
+
+    def authenticate_credentials(self, key):
+        if not is_shared():
+            return super().authenticate_credentials(key)
+        cache_key = token_cache_key(key)
+        cached = cache.get(cache_key)
+        organization_id = generation = None
+        if cached is not None:
+            token, cached_generation = cached
+            organization_id = token.user.organization_id
+            generation = organization_generation(organization_id)
+            if cached_generation == generation:
+                stats.hit()
+                return (token.user, token)
+
+        stats.miss()
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+                )
+
+        # Read before the query when the organization is known, so that
+        # an eviction committed during it drops this entry too
+        if generation is None or \
+                token.user.organization_id != organization_id:
+            generation = organization_generation(token.user.organization_id)
+        timeout = settings.AUTH_TOKEN_CACHE_TTL
+        cache.set_many({
+            cache_key: (token, generation),
+            user_cache_key(token.user_id): cache_key,
+        }, timeout=timeout)
+
+        return (token.user, token)
+
+    @staticmethod
+    def stats():
+        """Return the hit/miss counters of this process"""
+        return stats.snapshot()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def evict_user_token(sender, instance, **kwargs):
+    evict_users([instance.pk])
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def evict_token(sender, instance, **kwargs):
+    cache.delete(token_cache_key(instance.key))
+    evict_users([instance.user_id])
@@ -0,0 +1,114 @@
+"""
+Set-based inserts that skip rows which already exist
+"""
+from django.db import connections, router
+
+# SQL Server refuses statements with more than 2100 parameters
+MAX_PARAMS = 2000
+
+
+def chunked(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def insert_ignore(model, objs, unique_fields, batch_size=1000):
+    """
+    Insert objs, skipping those that collide on unique_fields.
+
+    Backends with ON CONFLICT / INSERT IGNORE go through bulk_create. SQL
+    Server has neither, so one parameterized INSERT ... WHERE NOT EXISTS
+    is sent for all rows with pyodbc's fast_executemany, which ships the
+    parameters as arrays in a single round trip per batch. The primary
+    keys of objs are not set either way.
+    """
+    objs = list(objs)
+    if not objs:
+        return
+    using = router.db_for_write(model)
+    connection = connections[using]
+    if connection.features.supports_ignore_conflicts:
+        model._default_manager.using(using).bulk_create(
+            objs, batch_size=batch_size, ignore_conflicts=True
+            )
+        return
+    executemany_ignore(connection, model, objs, unique_fields, batch_size)
+
+
+def insert_ignore_sql(connection, model, fields, unique_fields):
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    columns = ', '.join(qn(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    match = ' AND '.join(
+        f'{qn(field.column)} = %s' for field in unique_fields
+    )
+    # Holding the key range lock until commit keeps a concurrent insert
+    # of the same key from slipping between the check and the insert.
+    hint = ' WITH (UPDLOCK, HOLDLOCK)' \
+        if connection.vendor == 'microsoft' else ''
+    return (
+        f'INSERT INTO {table} ({columns}) SELECT {placeholders} '
+        f'WHERE NOT EXISTS (SELECT 1 FROM {table}{hint} WHERE {match})'
+    )
+
+
+def executemany_ignore(connection, model, objs, unique_fields,
+                       batch_size=1000):
+    opts = model._meta
+    fields = [
+        field for field in opts.concrete_fields
+        if field is not opts.auto_field
+    ]
+    unique_fields = [opts.get_field(name) for name in unique_fields]
+    sql = insert_ignore_sql(connection, model, fields, unique_fields)
+
+    def params(obj):
+        values = {
+            field: field.get_db_prep_save(
+                field.pre_save(obj, add=True), connection
+            )
+            for field in fields
+        }
+        return [values[field] for field in fields] + [
+            values[field] for field in unique_fields
+        ]
+
+    with connection.cursor() as cursor:
+        raw = getattr(cursor.cursor, 'cursor', None)
+        if hasattr(raw, 'fast_executemany'):
+            raw.fast_executemany = True
+        for batch in chunked(objs, batch_size):
+            cursor.executemany(sql, [params(obj) for obj in batch])
+
+
+def insert_values(model, field_names, rows, batch_size=1000):
+    """
+    Insert rows of database-ready values for field_names.
+
+    For narrow rows inserted by the hundred thousand, where building and
+    compiling a model instance per row costs more than the insert: the
+    tuples go to executemany as they are (with fast_executemany on SQL
+    Server).
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    opts = model._meta
+    columns = ', '.join(
+        qn(opts.get_field(name).column) for name in field_names
+    )
+    sql = (
+        f'INSERT INTO {qn(opts.db_table)} ({columns}) '
+        f'VALUES ({", ".join(["%s"] * len(field_names))})'
+    )
+    with connection.cursor() as cursor:
+        raw = getattr(cursor.cursor, 'cursor', None)
+        if hasattr(raw, 'fast_executemany'):
+            raw.fast_executemany = True
+        for batch in chunked(rows, batch_size):
+            cursor.executemany(sql, batch)
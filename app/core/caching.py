@@ -0,0 +1,16 @@
+"""
+Checks on the cache the token, entitlement and catalog caches rely on
+"""
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared():
+    """
+    Whether the default cache is seen by every process.
+
+    Entries are evicted through the cache, so with a process-local one
+    the other workers would keep serving them (a revoked token, an old
+    package) until they expire; callers bypass it instead.
+    """
+    return not isinstance(caches['default'], LocMemCache)
@@ -0,0 +1,140 @@
+"""
+Process-local catalog of packages and user roles
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.caching import is_shared
+from core.models import Package, UserRole
+
+VERSION_KEY = 'catalog:version'
+
+
+def shared_version():
+    """Return the catalog version shared by all workers"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 0, timeout=None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+def bump_version():
+    """Tell every worker its catalog is stale"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, timeout=None)
+
+
+class Catalog:
+    """
+    Packages and roles by name, loaded once per worker.
+
+    The local copy is dropped when the shared version moves, which
+    post_save/post_delete of Package and UserRole do once committed. The
+    shared version is read at most every CATALOG_VERSION_CHECK_INTERVAL
+    seconds; with a process-local cache, which cannot carry it, the
+    copy is reloaded that often instead. Names that are not found are
+    remembered until the next reload.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._packages = None
+        self._roles = None
+        self._missing = set()
+        self._version = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._packages = None
+            self._roles = None
+            self._missing = set()
+
+    def _load(self):
+        version = shared_version()
+        packages = {}
+        for package in Package.objects.order_by('id'):
+            packages.setdefault(package.name, package)
+        roles = {}
+        for role in UserRole.objects.order_by('id'):
+            roles.setdefault(role.name, role)
+        self._packages, self._roles = packages, roles
+        self._missing = set()
+        self._version = version
+        self._checked_at = time.monotonic()
+
+    def _tables(self, force=False):
+        """Return (packages, roles), reloading them when stale"""
+        with self._lock:
+            now = time.monotonic()
+            interval = settings.CATALOG_VERSION_CHECK_INTERVAL
+            if force or self._packages is None:
+                self._load()
+            elif now - self._checked_at >= interval:
+                self._checked_at = now
+                if not is_shared() or shared_version() != self._version:
+                    self._load()
+            return self._packages, self._roles
+
+    def _lookup(self, index, name):
+        found = self._tables()[index].get(name)
+        if found is None and (index, name) not in self._missing:
+            # Created by another worker since the last version check
+            found = self._tables(force=True)[index].get(name)
+            if found is None:
+                with self._lock:
+                    self._missing.add((index, name))
+        return found
+
+    def packages(self):
+        """Return every package"""
+        packages, _ = self._tables()
+        return list(packages.values())
+
+    def package(self, name):
+        """Return the package called name, like Package.objects.get"""
+        package = self._lookup(0, name)
+        if package is None:
+            raise Package.DoesNotExist(f'Package {name!r} does not exist.')
+        return package
+
+    def role(self, name):
+        """Return the role called name, like UserRole.objects.get"""
+        role = self._lookup(1, name)
+        if role is None:
+            raise UserRole.DoesNotExist(f'UserRole {name!r} does not exist.')
+        return role
+
+    def get_or_create_role(self, name):
+        """Return (role, created) like UserRole.objects.get_or_create"""
+        try:
+            return self.role(name), False
+        except UserRole.DoesNotExist:
+            return UserRole.objects.get_or_create(name=name)
+
+
+catalog = Catalog()
+
+
+@receiver(post_save, sender=Package)
+@receiver(post_delete, sender=Package)
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def invalidate_catalog(sender, **kwargs):
+    catalog.invalidate()
+
+    def committed():
+        # Workers reloading before the commit would read the old rows
+        catalog.invalidate()
+        bump_version()
+
+    transaction.on_commit(committed)
@@ -0,0 +1,67 @@
+"""
+Cached resolution of the package an organization is entitled to
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.caching import is_shared
+from core.models import PackageStatus
+
+NO_STATUS = 'none'
+
+
+def cache_key(organization_id):
+    return f'entitlement:organization:{organization_id}'
+
+
+def invalidate(organization_id):
+    """Forget the cached entitlement of an organization"""
+    cache.delete(cache_key(organization_id))
+
+
+def active_package_status(organization_id):
+    """
+    Return the active PackageStatus of an organization, or None.
+
+    The row is cached per organization for ENTITLEMENT_CACHE_TTL seconds,
+    unless the cache is process-local: a package switch could then only
+    evict it in the process that made it. A row whose end_date has
+    passed is treated as expired on read, even while its status is
+    still 'y', so no write is needed to expire it.
+    """
+    key = cache_key(organization_id)
+    shared = is_shared()
+    package_status = cache.get(key) if shared else None
+    if package_status is None:
+        package_status = PackageStatus.objects.filter(
+            organization_id=organization_id,
+            status='y',
+            end_date__gt=timezone.now(),
+        ).order_by('-end_date').first() or NO_STATUS
+        if shared:
+            cache.set(key, package_status, settings.ENTITLEMENT_CACHE_TTL)
+
+    if package_status == NO_STATUS:
+        return None
+    if package_status.end_date <= timezone.now():
+        return None
+    return package_status
+
+
+def active_package_id(organization_id):
+    """Return the id of the package an organization may use, or None"""
+    package_status = active_package_status(organization_id)
+    return package_status.package_id if package_status else None
+
+
+@receiver(post_save, sender=PackageStatus)
+@receiver(post_delete, sender=PackageStatus)
+def invalidate_entitlement(sender, instance, **kwargs):
+    organization_id = instance.organization_id
+    invalidate(organization_id)
+    # Readers may cache the old row again before this transaction commits
+    transaction.on_commit(lambda: invalidate(organization_id))
@@ -0,0 +1,318 @@
+"""
+Background jobs queued in the database
+"""
+import logging
+import random
+import threading
+import time
+import traceback
+import uuid
+
+from django.conf import settings
+from django.db import (
+    DatabaseError,
+    close_old_connections,
+    connections,
+    transaction,
+)
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core.models import Job
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+
+
+def task(name=None, on_dead=None):
+    """
+    Register a function as a job.
+
+    It is called with the job's payload as keyword arguments; raising
+    fails the attempt. Jobs may run more than once (after a crash, or a
+    retry of an attempt that had partly succeeded), so tasks should be
+    safe to repeat. on_dead is called with the payload and the error
+    when a job of the function fails its last attempt.
+    """
+    def register(func):
+        func.job_name = name or f'{func.__module__}.{func.__name__}'
+        func.on_dead = on_dead
+        _tasks[func.job_name] = func
+        return func
+    return register
+
+
+def discover():
+    """Import the tasks modules of the installed apps"""
+    autodiscover_modules('tasks')
+
+
+def enqueue(func, payload=None, priority=0, run_at=None, delay=None,
+            max_attempts=None):
+    """
+    Queue a job of a registered function, or of a job name.
+
+    Called inside a transaction, the job is committed (or rolled back)
+    with the rest of it, and no worker sees it before.
+    """
+    if run_at is None:
+        run_at = timezone.now()
+    if delay:
+        run_at += timezone.timedelta(seconds=delay)
+    return Job.objects.create(
+        name=getattr(func, 'job_name', func),
+        payload=payload or {},
+        priority=priority,
+        run_at=run_at,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def backoff(attempts):
+    """
+    Seconds before retrying a job that failed attempts times:
+    exponential from JOB_RETRY_DELAY up to JOB_RETRY_MAX_DELAY, with
+    jitter so jobs that failed together do not retry together
+    """
+    delay = min(
+        settings.JOB_RETRY_DELAY * 2 ** (attempts - 1),
+        settings.JOB_RETRY_MAX_DELAY,
+    )
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim(limit=1, now=None):
+    """
+    Mark up to limit due jobs as running and return them, highest
+    priority first.
+
+    The candidates are selected FOR UPDATE SKIP LOCKED (WITH (READPAST)
+    on SQL Server), so workers claiming at the same time skip each
+    other's rows instead of waiting on them. The update then stamps the
+    rows with a token of this claim, and only the rows carrying it are
+    returned; that also keeps claims exact on databases without row
+    locks.
+    """
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True).filter(
+                status=Job.QUEUED, run_at__lte=now
+            ).order_by('-priority', 'run_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        Job.objects.filter(id__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            locked_by=token,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+        )
+    return list(
+        Job.objects.filter(locked_by=token, status=Job.RUNNING)
+        .order_by('-priority', 'run_at', 'id')
+    )
+
+
+def run(job):
+    """
+    Run a claimed job and record its outcome; True if it succeeded.
+
+    Its lock is stamped again as it starts, since the jobs of a batch
+    wait for the ones before them. A job recovered as stale in the
+    meantime, which another worker may be running, is skipped and None
+    returned.
+    """
+    started = Job.objects.filter(
+        id=job.id, locked_by=job.locked_by, status=Job.RUNNING
+    ).update(locked_at=timezone.now())
+    if not started:
+        logger.warning('Job %s was recovered before it started', job)
+        return None
+    func = _tasks.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f'No task is registered as {job.name!r}')
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if func is None or job.attempts >= job.max_attempts:
+            logger.error('Job %s is dead: %s', job, error)
+            _finish(job, Job.DEAD, last_error=error)
+            if func is not None and func.on_dead is not None:
+                try:
+                    func.on_dead(error=error, **job.payload)
+                except Exception:
+                    logger.exception('Handling dead job %s failed', job)
+        else:
+            logger.warning('Job %s failed, will retry: %s', job, error)
+            _finish(
+                job, Job.QUEUED, last_error=error, finished_at=None,
+                run_at=timezone.now() + timezone.timedelta(
+                    seconds=backoff(job.attempts)
+                ),
+            )
+        return False
+    _finish(job, Job.DONE)
+    return True
+
+
+def _finish(job, status, **fields):
+    fields.setdefault('finished_at', timezone.now())
+    # The token guards against a job recovered as stale and claimed by
+    # another worker in the meantime
+    Job.objects.filter(id=job.id, locked_by=job.locked_by).update(
+        status=status, locked_by='', locked_at=None, **fields
+    )
+
+
+def release(jobs):
+    """Put claimed jobs back in the queue without counting an attempt"""
+    for job in jobs:
+        Job.objects.filter(
+            id=job.id, locked_by=job.locked_by, status=Job.RUNNING
+        ).update(
+            status=Job.QUEUED, locked_by='', locked_at=None,
+            attempts=F('attempts') - 1,
+        )
+
+
+def recover_stale(now=None):
+    """
+    Requeue jobs running for longer than JOB_LOCK_TIMEOUT, whose worker
+    is presumed dead; the lost run counts as an attempt
+    """
+    now = now or timezone.now()
+    cutoff = now - timezone.timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff)
+    dead = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.DEAD, locked_by='', locked_at=None, finished_at=now,
+        last_error='The worker running the job stopped.',
+    )
+    requeued = stale.update(
+        status=Job.QUEUED, locked_by='', locked_at=None, run_at=now,
+        last_error='The worker running the job stopped.',
+    )
+    return requeued + dead
+
+
+def requeue_dead(name=None):
+    """Give dead jobs (of name) a new set of attempts"""
+    jobs = Job.objects.filter(status=Job.DEAD)
+    if name:
+        jobs = jobs.filter(name=name)
+    return jobs.update(
+        status=Job.QUEUED, attempts=0, run_at=timezone.now(),
+        finished_at=None,
+    )
+
+
+def purge(now=None):
+    """Delete the jobs done more than JOB_KEEP_DAYS ago"""
+    now = now or timezone.now()
+    cutoff = now - timezone.timedelta(days=settings.JOB_KEEP_DAYS)
+    return Job.objects.filter(
+        status=Job.DONE, finished_at__lt=cutoff
+    ).delete()[0]
+
+
+class Worker:
+    """
+    Claim and run jobs on concurrency threads.
+
+    Each thread claims up to batch_size jobs at a time and runs them one
+    after another, and sleeps poll_interval seconds when none is due.
+    With burst it returns once the queue has no due job. stop() lets
+    the threads finish the job at hand; the rest of their claims go back
+    to the queue. Every JOB_LOCK_TIMEOUT / 2 seconds one of the threads
+    requeues stale jobs and purges old ones.
+    """
+
+    def __init__(self, concurrency=None, batch_size=None,
+                 poll_interval=None):
+        self.concurrency = concurrency or settings.JOB_CONCURRENCY
+        self.batch_size = batch_size or settings.JOB_BATCH_SIZE
+        self.poll_interval = poll_interval if poll_interval is not None \
+            else settings.JOB_POLL_INTERVAL
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._maintained_at = None
+        self.succeeded = 0
+        self.failed = 0
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, burst=False):
+        if self.concurrency == 1:
+            self._work(burst)
+        else:
+            threads = [
+                threading.Thread(
+                    target=self._thread, args=(burst,), daemon=True
+                )
+                for _ in range(self.concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return self.succeeded, self.failed
+
+    def _thread(self, burst):
+        try:
+            self._work(burst)
+        finally:
+            connections.close_all()
+
+    def _work(self, burst):
+        while not self._stop.is_set():
+            close_old_connections()
+            try:
+                self._maintain()
+                if not self._work_batch():
+                    if burst:
+                        return
+                    self._stop.wait(self.poll_interval)
+            except DatabaseError:
+                # Lost connections and lock timeouts should not stop the
+                # worker. Jobs it could not record stay running until
+                # recover_stale() requeues them
+                logger.exception('Running jobs failed')
+                connections.close_all()
+                self._stop.wait(self.poll_interval)
+
+    def _maintain(self):
+        """Recover stale jobs and purge, if no thread did it lately"""
+        now = time.monotonic()
+        with self._lock:
+            due = self._maintained_at is None or \
+                now - self._maintained_at >= settings.JOB_LOCK_TIMEOUT / 2
+            if due:
+                self._maintained_at = now
+        if due:
+            recover_stale()
+            purge()
+
+    def _work_batch(self):
+        """Claim and run a batch; False when no job was due"""
+        jobs = claim(self.batch_size)
+        if not jobs:
+            return False
+        for index, job in enumerate(jobs):
+            if self._stop.is_set():
+                release(jobs[index:])
+                break
+            succeeded = run(job)
+            if succeeded is None:
+                continue
+            with self._lock:
+                if succeeded:
+                    self.succeeded += 1
+                else:
+                    self.failed += 1
+        return True
@@ -0,0 +1,153 @@
+"""
+Django command to expire subscriptions whose end date has passed
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core import entitlements
+from core.authentication import evict_organizations
+from core.catalog import catalog
+from core.models import Organization, PackageStatus
+
+
+class Command(BaseCommand):
+    """
+    Flip due PackageStatus rows from 'y' to 'n' in bounded batches and
+    move the users of organizations left without an active package to
+    the downgrade package.
+
+    Each batch is its own short transaction and claims its due rows,
+    then their organizations, with SELECT ... FOR UPDATE SKIP LOCKED
+    (READPAST on MSSQL), so several nodes can run the command at once,
+    each on the rows the others have not claimed, and a concurrent
+    package switch is never undone by the downgrade. Organizations held
+    by a switch are left for the next sweep.
+    """
+    help = 'Expire subscriptions whose end_date has passed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Rows expired per transaction.',
+        )
+        parser.add_argument(
+            '--downgrade-to', default='basic',
+            help='Package given to users of expired organizations.',
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running and poll for due rows.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=60,
+            help='Seconds to sleep between polls in --loop mode.',
+        )
+
+    def handle(self, *args, **options):
+        downgrade_package = catalog.package(options['downgrade_to'])
+        while True:
+            self.sweep(options['batch_size'], downgrade_package.id)
+            if not options['loop']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
+
+    def sweep(self, batch_size, downgrade_package_id):
+        """Expire batches until nothing is due"""
+        started = time.perf_counter()
+        total = 0
+        busy = set()
+        while True:
+            expired, lag, skipped = self.expire_batch(
+                batch_size, downgrade_package_id, skip=busy
+            )
+            if not expired and not skipped:
+                break
+            # Work on the rows behind organizations held by a switch
+            busy |= skipped
+            if not expired:
+                continue
+            total += expired
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'Expired {expired} rows ({total} total, '
+                f'{total / elapsed:.0f} rows/s, '
+                f'lag {lag.total_seconds():.0f}s)'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {total} subscriptions in '
+            f'{time.perf_counter() - started:.2f}s'
+        ))
+        return total
+
+    def expire_batch(self, batch_size, downgrade_package_id, skip=()):
+        """
+        Expire one batch of the organizations not in skip and return
+        (rows expired, oldest lag, organizations held by a switch)
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            # Rows claimed by other nodes are skipped, so each node
+            # works on the next ones
+            claimed = list(
+                PackageStatus.objects.select_for_update(skip_locked=True)
+                .filter(status='y', end_date__lte=now)
+                .exclude(organization_id__in=skip)
+                .order_by('end_date')
+                .values_list('id', 'organization_id', 'end_date')
+                [:batch_size]
+            )
+            if not claimed:
+                return 0, timezone.timedelta(0), set()
+            # A package switch either committed before the still-active
+            # check below or waits for this batch on the organization.
+            # UpdatePackage takes the organization first, the rows after;
+            # taking them the other way round cannot deadlock, since
+            # organizations are skipped here rather than waited for.
+            organization_ids = {row[1] for row in claimed}
+            locked = set(
+                Organization.objects.select_for_update(skip_locked=True)
+                .filter(id__in=organization_ids)
+                .order_by('id')
+                .values_list('id', flat=True)
+            )
+            skipped = organization_ids - locked
+            due = [row for row in claimed if row[1] in locked]
+            if not due:
+                return 0, timezone.timedelta(0), skipped
+
+            expired = PackageStatus.objects.filter(
+                id__in=[row[0] for row in due], status='y'
+            ).update(status='n')
+
+            organization_ids = {row[1] for row in due}
+            still_active = set(
+                PackageStatus.objects.filter(
+                    organization_id__in=organization_ids,
+                    status='y',
+                    end_date__gt=now,
+                ).values_list('organization_id', flat=True)
+            )
+            downgraded = organization_ids - still_active
+            get_user_model().objects.filter(
+                organization_id__in=downgraded
+            ).exclude(
+                package_id=downgrade_package_id
+            ).update(package_id=downgrade_package_id)
+
+            def clear_caches():
+                for organization_id in organization_ids:
+                    entitlements.invalidate(organization_id)
+                if downgraded:
+                    evict_organizations(downgraded)
+
+            transaction.on_commit(clear_caches)
+
+        return expired, now - due[0][2], skipped
@@ -0,0 +1,72 @@
+"""
+Django command to run the background jobs queued in the database
+"""
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    """
+    Run queued jobs on --concurrency threads until SIGTERM or SIGINT,
+    or, with --burst, until no job is due.
+
+    Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED (READPAST on
+    MSSQL), so any number of workers can share the queue. On a signal
+    the job at hand finishes and the rest of the claimed ones go back to
+    the queue.
+    """
+    help = 'Run background jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int)
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Jobs claimed by a thread at a time.',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float,
+            help='Seconds to sleep when no job is due.',
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once no job is due.',
+        )
+        parser.add_argument(
+            '--requeue-dead', action='store_true',
+            help='Give the dead jobs new attempts before starting.',
+        )
+
+    def handle(self, *args, **options):
+        jobs.discover()
+        if options['requeue_dead']:
+            self.stdout.write(f'Requeued {jobs.requeue_dead()} dead jobs')
+
+        worker = jobs.Worker(
+            concurrency=options['concurrency'],
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+        )
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the running jobs')
+            worker.stop()
+
+        previous = {
+            signum: signal.signal(signum, stop)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        self.stdout.write(f'Running jobs on {worker.concurrency} threads')
+        started = time.perf_counter()
+        try:
+            succeeded, failed = worker.run(burst=options['burst'])
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(
+            f'{succeeded} jobs succeeded, {failed} failed in '
+            f'{time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.10 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_rename_stripe_checkout_id_payment_payment_intent_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='topics',
+            index=models.Index(fields=['user', 'id'], name='topics_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['organization', 'id'], name='user_organization_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.10 on 2026-10-18 16:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_topics_user_id_idx_user_organization_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='packagestatus',
+            index=models.Index(fields=['organization', 'status', 'end_date'], name='packagestatus_active_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.0.10 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_packagestatus_active_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Keyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Platform',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='topics',
+            name='keyword_terms',
+            field=models.ManyToManyField(blank=True, related_name='topics', to='core.keyword'),
+        ),
+        migrations.AddField(
+            model_name='topics',
+            name='platform_terms',
+            field=models.ManyToManyField(blank=True, related_name='topics', to='core.platform'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def normalize_term(value):
+    return ' '.join(str(value).split()).casefold()
+
+
+def split_terms(value):
+    names = {normalize_term(part) for part in (value or '').split(',')}
+    names.discard('')
+    return names
+
+
+def link_terms(term_model, through_model, field, topic_terms):
+    """Create missing terms and the topic links of one batch"""
+    names = set().union(*topic_terms.values())
+    if not names:
+        return
+    # Each topic is linked once, so only the terms can already exist;
+    # SQL Server has no ignore_conflicts.
+    ids = dict(
+        term_model.objects.filter(name__in=names).values_list('name', 'id')
+    )
+    term_model.objects.bulk_create(
+        [term_model(name=name) for name in names - ids.keys()]
+    )
+    ids = dict(
+        term_model.objects.filter(name__in=names).values_list('name', 'id')
+    )
+    through_model.objects.bulk_create([
+        through_model(**{'topics_id': topic_id, field: ids[name]})
+        for topic_id, topic_names in topic_terms.items()
+        for name in topic_names
+    ])
+
+
+def link_batch(batch, Keyword, Platform, keyword_through, platform_through):
+    link_terms(Keyword, keyword_through, 'keyword_id', {
+        topic_id: split_terms(keywords) for topic_id, keywords, _ in batch
+    })
+    link_terms(Platform, platform_through, 'platform_id', {
+        topic_id: split_terms(platform) for topic_id, _, platform in batch
+    })
+
+
+def backfill_topic_terms(apps, schema_editor):
+    Topics = apps.get_model('core', 'Topics')
+    Keyword = apps.get_model('core', 'Keyword')
+    Platform = apps.get_model('core', 'Platform')
+
+    last_id = 0
+    while True:
+        batch = list(
+            Topics.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'keywords', 'platform')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        link_batch(batch, Keyword, Platform,
+                   Topics.keyword_terms.through,
+                   Topics.platform_terms.through)
+        last_id = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_topic_terms'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_topic_terms, migrations.RunPython.noop
+        ),
+    ]
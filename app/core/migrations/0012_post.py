@@ -0,0 +1,64 @@
+# Generated by Django 4.0.10 on 2026-10-18 16:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_backfill_topic_terms'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Post',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.CharField(max_length=255)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('text', models.TextField()),
+                ('author', models.CharField(blank=True, default='', max_length=255)),
+                ('url', models.URLField(blank=True, default='', max_length=1000)),
+                ('published_at', models.DateTimeField(null=True)),
+                ('published_on', models.DateField()),
+                ('collected_at', models.DateTimeField(auto_now_add=True)),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='posts', to='core.platform')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostTopic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('published_on', models.DateField()),
+                ('keyword', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.keyword')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.post')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.topics')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='topics',
+            field=models.ManyToManyField(related_name='posts', through='core.PostTopic', to='core.topics'),
+        ),
+        migrations.AddIndex(
+            model_name='posttopic',
+            index=models.Index(fields=['topic', 'published_on'], name='posttopic_topic_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='posttopic',
+            constraint=models.UniqueConstraint(fields=('post', 'topic'), name='posttopic_post_topic_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['platform', 'content_hash'], name='post_content_hash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['published_on', 'platform'], name='post_published_on_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='post',
+            constraint=models.UniqueConstraint(fields=('platform', 'external_id'), name='post_platform_external_id_uniq'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.10 on 2026-10-18 16:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_post'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('mentions', models.PositiveIntegerField(default=0)),
+                ('keyword', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.keyword')),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='core.platform')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.topics')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='topicdailyrollup',
+            constraint=models.UniqueConstraint(fields=('topic', 'day', 'keyword', 'platform'), name='rollup_topic_day_uniq'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.10 on 2026-10-18 16:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_topicdailyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('posts', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField(default=b'')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.topics')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='topicsketch',
+            constraint=models.UniqueConstraint(fields=('topic', 'bucket_start'), name='topicsketch_topic_bucket_uniq'),
+        ),
+    ]
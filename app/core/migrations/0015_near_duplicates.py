@@ -0,0 +1,47 @@
+# Generated by Django 4.0.10 on 2026-10-18 16:50
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_topicsketch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='near_duplicate_threshold',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(0.5), django.core.validators.MaxValueValidator(1.0)]),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='signature',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.CreateModel(
+            name='PostDuplicate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.CharField(max_length=255)),
+                ('similarity', models.FloatField()),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='core.platform')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='near_duplicates', to='core.post')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(db_index=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='core.post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='postduplicate',
+            constraint=models.UniqueConstraint(fields=('platform', 'external_id'), name='postduplicate_platform_external_id_uniq'),
+        ),
+    ]
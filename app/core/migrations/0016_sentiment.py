@@ -0,0 +1,33 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_near_duplicates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='sentiment',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='topicdailyrollup',
+            name='negative',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='topicdailyrollup',
+            name='positive',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='topicdailyrollup',
+            name='sentiment',
+            field=models.FloatField(default=0),
+        ),
+    ]
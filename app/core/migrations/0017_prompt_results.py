@@ -0,0 +1,57 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_sentiment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromptResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('model', models.CharField(max_length=255)),
+                ('output', models.TextField()),
+                ('input_tokens', models.PositiveIntegerField(default=0)),
+                ('output_tokens', models.PositiveIntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=10, default=0, max_digits=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TopicPromptRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='core.promptresult')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prompt_runs', to='core.topics')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PromptUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('cache_hits', models.PositiveIntegerField(default=0)),
+                ('input_tokens', models.PositiveBigIntegerField(default=0)),
+                ('output_tokens', models.PositiveBigIntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=10, default=0, max_digits=20)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.organization')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='topicpromptrun',
+            constraint=models.UniqueConstraint(fields=('topic', 'day'), name='topicpromptrun_topic_day_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='promptusage',
+            constraint=models.UniqueConstraint(fields=('organization', 'day'), name='promptusage_organization_day_uniq'),
+        ),
+    ]
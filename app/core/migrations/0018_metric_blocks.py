@@ -0,0 +1,34 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_prompt_results'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=32)),
+                ('tier', models.CharField(max_length=8)),
+                ('start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField(default=b'')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.topics')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='metricblock',
+            index=models.Index(fields=['tier', 'start'], name='metricblock_tier_start_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='metricblock',
+            constraint=models.UniqueConstraint(fields=('topic', 'metric', 'tier', 'start'), name='metricblock_series_start_uniq'),
+        ),
+    ]
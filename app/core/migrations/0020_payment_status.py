@@ -0,0 +1,55 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_status(apps, schema_editor):
+    Payment = apps.get_model('core', 'Payment')
+    Payment.objects.filter(succeeded=True).update(status='succeeded')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='message',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='next_action_url',
+            field=models.URLField(blank=True, max_length=2000),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='package',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.package'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='payment_method_id',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('succeeded', 'Succeeded'), ('requires_action', 'Requires action'), ('failed', 'Failed')], default='', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='payment_intent_id',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.RunPython(backfill_status, migrations.RunPython.noop),
+    ]
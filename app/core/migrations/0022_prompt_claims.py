@@ -0,0 +1,22 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_stripe_customers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromptClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('claimed_by', models.CharField(db_index=True, max_length=32)),
+                ('claimed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,4 +1,6 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -7,12 +9,17 @@ from django.contrib.auth.models import (
 from django.dispatch import receiver
 from django.db.models.signals import post_save
 
+from core.bulk import insert_ignore
+
+
 class UserManager(BaseUserManager):
     """MANAGER for User"""
 
     def create_user(self, email, password=None, organization=None,
                     package=None, role=None, is_admin=False, **extra_fields):
         """Create and save a user"""
+        from core.catalog import catalog
+
         if is_admin is False:
             if not email:
                 raise ValueError("User must have an email.")
@@ -21,10 +28,10 @@ class UserManager(BaseUserManager):
                 raise ValueError("User must have an organization.")
 
             if package is None:
-                package = Package.objects.get(name='basic')
+                package = catalog.package('basic')
 
             if role is None:
-                role = UserRole.objects.get(name='admin')
+                role = catalog.role('admin')
 
             user = self.model(email=self.normalize_email(email),
                               organization=organization, package=package,
@@ -53,6 +60,10 @@ class UserManager(BaseUserManager):
 
         return user
 
+    def with_profile(self):
+        """Users with organization, package and role joined in"""
+        return self.select_related('organization', 'package', 'role')
+
 
 class UserRole(models.Model):
     name = models.CharField(max_length=255, null=True, blank=True)
@@ -91,6 +102,12 @@ class Organization(models.Model):
     last_update_date = models.DateTimeField(auto_now=True)
     last_updated_by = models.IntegerField(null=True, blank=True)
     last_update_login = models.IntegerField(null=True)
+    # Similarity from which posts count as one for the organization's
+    # topics; NEAR_DUPLICATE_THRESHOLD when unset
+    near_duplicate_threshold = models.FloatField(
+        null=True, blank=True,
+        validators=[MinValueValidator(0.5), MaxValueValidator(1.0)]
+        )
 
     def __str__(self):
         return self.name
@@ -112,15 +129,70 @@ class PackageStatus(models.Model):
     last_updated_by = models.IntegerField(null=True, blank=True)
     last_update_login = models.IntegerField(null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['organization', 'status', 'end_date'],
+                name='packagestatus_active_idx'
+                ),
+        ]
+
     def __str__(self):
         return self.organization
 
 
+def normalize_term(value):
+    """Case- and whitespace-insensitive form of a keyword or platform"""
+    return ' '.join(str(value).split()).casefold()
+
+
+class TermManager(models.Manager):
+    """MANAGER for Keyword and Platform"""
+
+    def resolve(self, values):
+        """Return the rows for values, creating the missing ones"""
+        names = {normalize_term(value) for value in values}
+        names.discard('')
+        if not names:
+            return self.none()
+        insert_ignore(
+            self.model, [self.model(name=name) for name in names], ['name']
+            )
+        return self.filter(name__in=names)
+
+
+class Keyword(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+
+    objects = TermManager()
+
+    def __str__(self):
+        return self.name
+
+
+class Platform(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+
+    objects = TermManager()
+
+    def __str__(self):
+        return self.name
+
+
 class Topics(models.Model):
+    # Status of a topic that is tracked; the default of new topics
+    ACTIVE = 't'
+
     name = models.CharField(max_length=255, null=True)
     prompt = models.CharField(max_length=255, null=True)
     keywords = models.CharField(max_length=255, null=True)
     platform = models.CharField(max_length=255, null=True)
+    keyword_terms = models.ManyToManyField(
+        'Keyword', related_name='topics', blank=True
+        )
+    platform_terms = models.ManyToManyField(
+        'Platform', related_name='topics', blank=True
+        )
     status = models.CharField(max_length=1, null=True)
     user = models.ForeignKey(
         'User', null=True, blank=True, on_delete=models.CASCADE
@@ -131,9 +203,243 @@ class Topics(models.Model):
     last_updated_by = models.IntegerField(null=True, blank=True)
     last_update_login = models.IntegerField(null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='topics_user_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    def set_terms(self, keywords, platforms):
+        """Link the normalized keyword and platform rows"""
+        self.keyword_terms.set(Keyword.objects.resolve(keywords))
+        self.platform_terms.set(Platform.objects.resolve(platforms))
+
+
+class Post(models.Model):
+    """A collected post, stored once however many topics it matches"""
+    platform = models.ForeignKey(
+        'Platform', on_delete=models.PROTECT, related_name='posts'
+        )
+    external_id = models.CharField(max_length=255)
+    # sha256 of the normalized text; reposts of the same text on a
+    # platform are stored once
+    content_hash = models.CharField(max_length=64)
+    text = models.TextField()
+    author = models.CharField(max_length=255, blank=True, default='')
+    url = models.URLField(max_length=1000, blank=True, default='')
+    published_at = models.DateTimeField(null=True)
+    # Day of publication (or collection), the partitioning key
+    published_on = models.DateField()
+    collected_at = models.DateTimeField(auto_now_add=True)
+    # MinHash of the text, see smmart.neardup
+    signature = models.BinaryField(null=True)
+    # In (-1, 1), see smmart.sentiment
+    sentiment = models.FloatField(null=True)
+    topics = models.ManyToManyField(
+        'Topics', through='PostTopic', related_name='posts'
+        )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['platform', 'external_id'],
+                name='post_platform_external_id_uniq'
+                ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['platform', 'content_hash'],
+                name='post_content_hash_idx'
+                ),
+            models.Index(
+                fields=['published_on', 'platform'],
+                name='post_published_on_idx'
+                ),
+        ]
+
+    def __str__(self):
+        return f'{self.platform_id}:{self.external_id}'
+
+
+class PostTopic(models.Model):
+    """A post matched to a topic through one of its keywords"""
+    post = models.ForeignKey('Post', on_delete=models.CASCADE)
+    topic = models.ForeignKey('Topics', on_delete=models.CASCADE)
+    keyword = models.ForeignKey(
+        'Keyword', null=True, blank=True, on_delete=models.SET_NULL
+        )
+    # Copied from the post so a topic's posts of a day are one range scan
+    published_on = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'topic'], name='posttopic_post_topic_uniq'
+                ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['topic', 'published_on'],
+                name='posttopic_topic_day_idx'
+                ),
+        ]
+
+
+class PostBand(models.Model):
+    """An LSH band key of a post's signature, for near-duplicate lookups"""
+    post = models.ForeignKey(
+        'Post', on_delete=models.CASCADE, related_name='bands'
+        )
+    key = models.BigIntegerField(db_index=True)
+
+
+class PostDuplicate(models.Model):
+    """A post not stored because it is a near duplicate of another"""
+    post = models.ForeignKey(
+        'Post', on_delete=models.CASCADE, related_name='near_duplicates'
+        )
+    platform = models.ForeignKey('Platform', on_delete=models.PROTECT)
+    external_id = models.CharField(max_length=255)
+    similarity = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['platform', 'external_id'],
+                name='postduplicate_platform_external_id_uniq'
+                ),
+        ]
+
+
+class TopicDailyRollup(models.Model):
+    """Mentions of a topic keyword on a platform in one day"""
+    topic = models.ForeignKey('Topics', on_delete=models.CASCADE)
+    keyword = models.ForeignKey('Keyword', on_delete=models.CASCADE)
+    platform = models.ForeignKey('Platform', on_delete=models.PROTECT)
+    day = models.DateField()
+    mentions = models.PositiveIntegerField(default=0)
+    positive = models.PositiveIntegerField(default=0)
+    negative = models.PositiveIntegerField(default=0)
+    # Sum of the sentiment scores of the mentions
+    sentiment = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['topic', 'day', 'keyword', 'platform'],
+                name='rollup_topic_day_uniq'
+                ),
+        ]
+
+
+class TopicSketch(models.Model):
+    """Token counts of a topic's posts in one time bucket, as a sketch"""
+    topic = models.ForeignKey('Topics', on_delete=models.CASCADE)
+    bucket_start = models.DateTimeField()
+    posts = models.PositiveIntegerField(default=0)
+    # Compressed count-min sketch and heavy hitters, see smmart.trending
+    data = models.BinaryField(default=b'')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['topic', 'bucket_start'],
+                name='topicsketch_topic_bucket_uniq'
+                ),
+        ]
+
+
+class MetricBlock(models.Model):
+    """
+    The samples of a topic metric in one block of time, as compressed
+    arrays; see smmart.timeseries
+    """
+    topic = models.ForeignKey('Topics', on_delete=models.CASCADE)
+    metric = models.CharField(max_length=32)
+    # raw samples, or 1h / 1d aggregates of them
+    tier = models.CharField(max_length=8)
+    start = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    data = models.BinaryField(default=b'')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['topic', 'metric', 'tier', 'start'],
+                name='metricblock_series_start_uniq'
+                ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['tier', 'start'], name='metricblock_tier_start_idx'
+                ),
+        ]
+
+
+class PromptResult(models.Model):
+    """
+    A model's output for a prompt and input, stored once under the
+    digest of both and shared by every topic that asks for it
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=255)
+    output = models.TextField()
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    cost = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class PromptClaim(models.Model):
+    """
+    A digest a prompt run is executing, so that concurrent runs leave
+    it to that run. Claims older than PROMPT_CLAIM_TIMEOUT are from a
+    run that stopped and may be taken over.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    claimed_by = models.CharField(max_length=32, db_index=True)
+    claimed_at = models.DateTimeField()
+
+
+class TopicPromptRun(models.Model):
+    """The result of a topic's prompt over its posts of one day"""
+    topic = models.ForeignKey(
+        'Topics', on_delete=models.CASCADE, related_name='prompt_runs'
+        )
+    day = models.DateField()
+    result = models.ForeignKey('PromptResult', on_delete=models.PROTECT)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['topic', 'day'], name='topicpromptrun_topic_day_uniq'
+                ),
+        ]
+
+
+class PromptUsage(models.Model):
+    """Prompt executions and their cost charged to an organization"""
+    organization = models.ForeignKey(
+        'Organization', on_delete=models.CASCADE
+        )
+    day = models.DateField()
+    # Prompts requested, and how many of them were answered from the cache
+    requests = models.PositiveIntegerField(default=0)
+    cache_hits = models.PositiveIntegerField(default=0)
+    input_tokens = models.PositiveBigIntegerField(default=0)
+    output_tokens = models.PositiveBigIntegerField(default=0)
+    cost = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['organization', 'day'],
+                name='promptusage_organization_day_uniq'
+                ),
+        ]
+
 
 class User(AbstractBaseUser, PermissionsMixin):
     """USER in the system"""
@@ -155,12 +461,87 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = "email"
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['organization', 'id'], name='user_organization_id_idx'
+                ),
+        ]
+
+
+class Job(models.Model):
+    """A unit of background work, run by the run_worker command"""
+    QUEUED = 'q'
+    RUNNING = 'r'
+    DONE = 'd'
+    DEAD = 'x'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (DEAD, 'Dead'),
+    ]
+
+    # Name of the function registered with core.jobs.task
+    name = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=1, choices=STATUSES, default=QUEUED)
+    # Higher priorities run first; jobs never run before run_at
+    priority = models.SmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    last_error = models.TextField(blank=True, default='')
+    # Claim token of the worker running the job
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'priority', 'run_at'],
+                name='job_status_priority_run_at_idx'
+                ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.get_status_display()})'
+
 
 class Payment(models.Model):
+    # Status of a checkout; blank for the row created with the
+    # organization and for payments made before checkouts had one
+    PENDING = 'pending'
+    SUCCEEDED = 'succeeded'
+    REQUIRES_ACTION = 'requires_action'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (SUCCEEDED, 'Succeeded'),
+        (REQUIRES_ACTION, 'Requires action'),
+        (FAILED, 'Failed'),
+    ]
+
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
     succeeded = models.BooleanField(default=False)
-    payment_intent_id = models.CharField(max_length=500)
+    payment_intent_id = models.CharField(max_length=500, blank=True)
     is_active = models.BooleanField(default=False)
+    status = models.CharField(
+        max_length=20, choices=STATUSES, blank=True, default=''
+        )
+    package = models.ForeignKey(
+        Package, on_delete=models.SET_NULL, null=True, blank=True
+        )
+    amount = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True
+        )
+    payment_method_id = models.CharField(max_length=100, blank=True)
+    # Decline reason, or why the payment could not be made
+    message = models.TextField(blank=True)
+    # Where the customer completes a payment that requires action
+    next_action_url = models.URLField(max_length=2000, blank=True)
 
     # who columns
     creation_date = models.DateTimeField(auto_now=True)
@@ -178,6 +559,29 @@ class Payment(models.Model):
         return f"{active} Payment by {self.organization.name}"
 
 
+class StripeCustomer(models.Model):
+    """
+    The Stripe customer of a user, so payments skip the remote search.
+
+    Filled by the first payment of the user and by the
+    sync_stripe_customers command for customers made before. Both
+    columns are unique: a user has one customer and a customer pays for
+    one user.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE,
+        related_name='stripe_customer'
+        )
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, null=True, blank=True
+        )
+    customer_id = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.customer_id} of {self.user_id}'
+
+
 @receiver(post_save, sender=Organization)
 def create_payment(sender, instance, created, **kwargs):
     if created:
@@ -0,0 +1,166 @@
+"""
+Test cached token authentication
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from core.authentication import (
+    CachedTokenAuthentication,
+    evict_organizations,
+    stats,
+    token_cache_key,
+)
+from core.models import Organization, Package, UserRole
+
+ME_URL = reverse('user:me')
+LOGOUT_URL = reverse('user:logout')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test token -> user caching and eviction"""
+
+    def setUp(self):
+        cache.clear()
+        stats.reset()
+        organization = Organization.objects.create(name='inseyab')
+        package = Package.objects.create(name='basic')
+        role = UserRole.objects.create(name='admin')
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+            organization=organization,
+            package=package,
+            role=role,
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def authenticate(self):
+        return self.auth.authenticate_credentials(self.token.key)
+
+    def test_second_lookup_is_served_from_cache(self):
+        """Test a cached token is resolved without a query"""
+        self.authenticate()
+
+        with CaptureQueriesContext(connection) as queries:
+            user, token = self.authenticate()
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(token.key, self.token.key)
+        self.assertEqual(
+            CachedTokenAuthentication.stats(),
+            {'hits': 1, 'misses': 1, 'hit_ratio': 0.5},
+        )
+
+    @override_settings(AUTH_TOKEN_STATS_INTERVAL=2)
+    def test_counters_are_logged_every_interval(self):
+        """Test the hit ratio is logged once per interval of lookups"""
+        with self.assertLogs('core.authentication', 'INFO') as logs:
+            for _ in range(4):
+                self.authenticate()
+
+        self.assertEqual(logs.output, [
+            'INFO:core.authentication:Token cache: 1 hits, 1 misses, '
+            '50.0% hit ratio',
+            'INFO:core.authentication:Token cache: 3 hits, 1 misses, '
+            '75.0% hit ratio',
+        ])
+
+    def test_cache_holds_more_than_the_default_entries(self):
+        """Test the token cache is not culled at Django's 300 keys"""
+        self.assertGreater(cache._max_entries, 10000)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_process_local_cache_is_not_used(self):
+        """Test a LocMem cache, which other workers cannot evict, is skipped"""
+        self.authenticate()
+
+        with CaptureQueriesContext(connection) as queries:
+            user, _ = self.authenticate()
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertIsNone(cache.get(token_cache_key(self.token.key)))
+        self.assertEqual(stats.hits, 0)
+
+    def test_password_change_evicts(self):
+        """Test saving the user drops the cached entry"""
+        self.authenticate()
+        self.user.set_password('newpass123')
+        self.user.save()
+
+        user, _ = self.authenticate()
+
+        self.assertTrue(user.check_password('newpass123'))
+        self.assertEqual(stats.misses, 2)
+
+    def test_deactivated_user_is_rejected(self):
+        """Test is_active change takes effect immediately"""
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_organization_eviction_is_one_write(self):
+        """Test evicting an organization drops its users' cached tokens"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            organization=Organization.objects.create(name='other'),
+        )
+        other_token = Token.objects.create(user=other)
+        self.authenticate()
+        self.auth.authenticate_credentials(other_token.key)
+        # Set-based, as a package switch does, without post_save
+        get_user_model().objects.filter(id=self.user.id).update(
+            name='Renamed'
+        )
+
+        with self.assertNumQueries(0), \
+                patch.object(cache, 'set_many', wraps=cache.set_many) as write:
+            evict_organizations([self.user.organization_id])
+
+        write.assert_called_once()
+        user, _ = self.authenticate()
+        self.assertEqual(user.name, 'Renamed')
+        with self.assertNumQueries(0):
+            self.auth.authenticate_credentials(other_token.key)
+
+    def test_token_rotation_evicts(self):
+        """Test a deleted token is no longer accepted"""
+        key = self.token.key
+        self.authenticate()
+        self.token.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+    def test_logout_deletes_token(self):
+        """Test logout revokes the token"""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(client.get(ME_URL).status_code, status.HTTP_200_OK)
+
+        res = client.post(LOGOUT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        self.assertEqual(
+            client.get(ME_URL).status_code, status.HTTP_401_UNAUTHORIZED
+            )
@@ -0,0 +1,47 @@
+"""
+Test inserts that skip existing rows
+"""
+from django.db import connection
+from django.test import TestCase
+
+from core.bulk import executemany_ignore, insert_ignore, insert_values
+from core.models import Keyword
+
+
+class InsertIgnoreTests(TestCase):
+
+    def setUp(self):
+        Keyword.objects.create(name='django')
+
+    def test_existing_rows_are_skipped(self):
+        """Test colliding rows are ignored and the others inserted"""
+        insert_ignore(
+            Keyword, [Keyword(name='django'), Keyword(name='python')],
+            ['name'],
+        )
+
+        self.assertEqual(
+            sorted(Keyword.objects.values_list('name', flat=True)),
+            ['django', 'python'],
+        )
+
+    def test_executemany_path(self):
+        """Test the path taken on backends without ignore_conflicts"""
+        with self.assertNumQueries(1):
+            executemany_ignore(
+                connection, Keyword,
+                [Keyword(name=name) for name in ['django', 'a', 'b', 'a']],
+                ['name'],
+            )
+
+        self.assertEqual(
+            sorted(Keyword.objects.values_list('name', flat=True)),
+            ['a', 'b', 'django'],
+        )
+
+    def test_insert_values(self):
+        """Test raw rows are inserted in one statement per batch"""
+        with self.assertNumQueries(1):
+            insert_values(Keyword, ['name'], [('a',), ('b',)])
+
+        self.assertEqual(Keyword.objects.count(), 3)
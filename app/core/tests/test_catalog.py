@@ -0,0 +1,97 @@
+"""
+Test the package and role catalog
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from core.catalog import VERSION_KEY, catalog, shared_version
+from core.models import Package, UserRole
+
+
+class CatalogTests(TestCase):
+    """Test process-local catalog lookups"""
+
+    def setUp(self):
+        cache.clear()
+        catalog.invalidate()
+        self.basic = Package.objects.create(
+            name='basic', price=Decimal('10.00')
+            )
+        self.admin = UserRole.objects.create(name='admin')
+
+    def test_lookups_are_served_locally(self):
+        """Test packages and roles are read once"""
+        catalog.package('basic')
+
+        with self.assertNumQueries(0):
+            package = catalog.package('basic')
+            role = catalog.role('admin')
+
+        self.assertEqual(package.id, self.basic.id)
+        self.assertEqual(package.price, Decimal('10.00'))
+        self.assertEqual(role.id, self.admin.id)
+
+    def test_save_bumps_version_and_reloads(self):
+        """Test saving a package invalidates every catalog"""
+        catalog.package('basic')
+        version = shared_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.basic.price = Decimal('12.00')
+            self.basic.save()
+            # Other workers would reload the old row before the commit
+            self.assertEqual(cache.get(VERSION_KEY), version)
+
+        self.assertEqual(cache.get(VERSION_KEY), version + 1)
+        self.assertEqual(catalog.package('basic').price, Decimal('12.00'))
+
+    def test_stale_version_reloads(self):
+        """Test a version bump from another worker is picked up"""
+        catalog.package('basic')
+        Package.objects.filter(id=self.basic.id).update(price=Decimal('5'))
+        cache.incr(VERSION_KEY)
+
+        with self.settings(CATALOG_VERSION_CHECK_INTERVAL=0):
+            package = catalog.package('basic')
+
+        self.assertEqual(package.price, Decimal('5'))
+
+    def test_unknown_name_raises(self):
+        """Test a missing package raises like the ORM"""
+        with self.assertRaises(Package.DoesNotExist):
+            catalog.package('gold')
+
+    def test_misses_are_remembered_until_the_next_reload(self):
+        """Test an unknown name reloads the tables once"""
+        catalog.package('basic')
+        with self.assertNumQueries(2):
+            for _ in range(3):
+                with self.assertRaises(Package.DoesNotExist):
+                    catalog.package('gold')
+
+        Package.objects.create(name='gold')
+
+        self.assertEqual(catalog.package('gold').name, 'gold')
+
+    @override_settings(
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }},
+        CATALOG_VERSION_CHECK_INTERVAL=0,
+    )
+    def test_process_local_cache_reloads_every_interval(self):
+        """Test changes reach workers a LocMem version cannot tell"""
+        catalog.package('basic')
+        Package.objects.filter(id=self.basic.id).update(price=Decimal('5'))
+
+        self.assertEqual(catalog.package('basic').price, Decimal('5'))
+
+    def test_get_or_create_role(self):
+        """Test unknown roles are created"""
+        role, created = catalog.get_or_create_role('user')
+
+        self.assertTrue(created)
+        self.assertEqual(catalog.role('user').id, role.id)
+        self.assertEqual(catalog.get_or_create_role('admin')[1], False)
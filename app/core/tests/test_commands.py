@@ -1,13 +1,18 @@
 """
 Test custom commands
 """
+from io import StringIO
 from unittest.mock import patch, Mock
 
+from django.contrib.auth import get_user_model
 from django.db import OperationalError as mssqlOperationalError
 
 from django.core.management import call_command
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from core.models import Organization, Package, PackageStatus, UserRole
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -29,3 +34,138 @@ class CommandTest(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class ExpirePackagesCommandTest(TestCase):
+    """Test the subscription expiry sweeper"""
+
+    def setUp(self):
+        self.basic = Package.objects.create(name='basic')
+        self.pro = Package.objects.create(name='pro')
+        self.role = UserRole.objects.create(name='admin')
+
+    def create_organization(self, name, package, hours, users=2):
+        organization = Organization.objects.create(name=name)
+        for i in range(users):
+            get_user_model().objects.create_user(
+                email=f'{name}{i}@example.com',
+                organization=organization,
+                package=package,
+                role=self.role,
+            )
+        now = timezone.now()
+        PackageStatus.objects.create(
+            organization=organization,
+            package=package,
+            start_date=now - timezone.timedelta(days=30),
+            end_date=now + timezone.timedelta(hours=hours),
+            status='y',
+        )
+        return organization
+
+    def test_expire_due_packages(self):
+        """Test due rows are expired and their users downgraded"""
+        expired = self.create_organization('expired', self.pro, hours=-1)
+        active = self.create_organization('active', self.pro, hours=1)
+        out = StringIO()
+
+        call_command('expire_packages', batch_size=1, stdout=out)
+
+        self.assertEqual(
+            PackageStatus.objects.get(organization=expired).status, 'n'
+            )
+        self.assertEqual(
+            PackageStatus.objects.get(organization=active).status, 'y'
+            )
+        self.assertFalse(
+            get_user_model().objects.filter(
+                organization=expired, package=self.pro
+            ).exists()
+        )
+        self.assertFalse(
+            get_user_model().objects.filter(
+                organization=active, package=self.basic
+            ).exists()
+        )
+        self.assertIn('Expired 1 subscriptions', out.getvalue())
+
+    def test_expire_in_batches(self):
+        """Test a backlog larger than the batch size is drained"""
+        for i in range(5):
+            self.create_organization(f'org{i}', self.basic, hours=-i - 1)
+        out = StringIO()
+
+        call_command('expire_packages', batch_size=2, stdout=out)
+
+        self.assertFalse(PackageStatus.objects.filter(status='y').exists())
+        self.assertEqual(out.getvalue().count('rows/s'), 3)
+
+    def test_renewed_organization_keeps_package(self):
+        """Test users keep their package when another row is active"""
+        organization = self.create_organization('renewed', self.pro, -1)
+        now = timezone.now()
+        PackageStatus.objects.create(
+            organization=organization,
+            package=self.pro,
+            start_date=now,
+            end_date=now + timezone.timedelta(days=30),
+            status='y',
+        )
+
+        call_command('expire_packages', stdout=StringIO())
+
+        self.assertFalse(
+            get_user_model().objects.filter(
+                organization=organization, package=self.basic
+            ).exists()
+        )
+
+    def test_organization_being_switched_is_skipped(self):
+        """Test a package switch holding the organization is not undone"""
+        busy = self.create_organization('busy', self.pro, hours=-2)
+        free = self.create_organization('free', self.pro, hours=-1)
+        select_for_update = Organization.objects.select_for_update
+
+        def skip_busy(**kwargs):
+            # What SKIP LOCKED returns while UpdatePackage holds busy
+            return select_for_update(**kwargs).exclude(id=busy.id)
+
+        # The busy organization's row is first; the sweep goes past it
+        with patch.object(Organization.objects, 'select_for_update',
+                          skip_busy):
+            call_command('expire_packages', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            PackageStatus.objects.get(organization=busy).status, 'y'
+            )
+        self.assertEqual(
+            PackageStatus.objects.get(organization=free).status, 'n'
+            )
+        self.assertFalse(
+            get_user_model().objects.filter(
+                organization=busy, package=self.basic
+            ).exists()
+        )
+
+    def test_rows_claimed_by_another_node_are_passed(self):
+        """Test a second node expires the rows behind the first's"""
+        held = self.create_organization('held', self.pro, hours=-2)
+        free = self.create_organization('free', self.pro, hours=-1)
+        select_for_update = PackageStatus.objects.select_for_update
+
+        def skip_held(**kwargs):
+            # What SKIP LOCKED returns while another node holds the row
+            return select_for_update(**kwargs).exclude(organization=held)
+
+        out = StringIO()
+        with patch.object(PackageStatus.objects, 'select_for_update',
+                          skip_held):
+            call_command('expire_packages', batch_size=1, stdout=out)
+
+        self.assertEqual(
+            PackageStatus.objects.get(organization=held).status, 'y'
+            )
+        self.assertEqual(
+            PackageStatus.objects.get(organization=free).status, 'n'
+            )
+        self.assertIn('Expired 1 subscriptions', out.getvalue())
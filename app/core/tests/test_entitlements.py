@@ -0,0 +1,115 @@
+"""
+Test the organization entitlement resolver
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.entitlements import (
+    active_package_id,
+    active_package_status,
+    cache_key,
+)
+from core.models import Organization, Package, PackageStatus, UserRole
+
+GET_PACKAGE_URL = reverse('smmart:get-package')
+
+
+class EntitlementTests(TestCase):
+    """Test cached active package lookups"""
+
+    def setUp(self):
+        cache.clear()
+        self.organization = Organization.objects.create(name='inseyab')
+        self.basic = Package.objects.create(name='basic')
+        self.pro = Package.objects.create(name='pro')
+
+    def create_status(self, package, hours=72, status_value='y'):
+        now = timezone.now()
+        return PackageStatus.objects.create(
+            organization=self.organization,
+            package=package,
+            start_date=now,
+            end_date=now + timezone.timedelta(hours=hours),
+            status=status_value,
+        )
+
+    def test_active_status_is_cached(self):
+        """Test repeated lookups do not query"""
+        package_status = self.create_status(self.basic)
+        active_package_status(self.organization.id)
+
+        with self.assertNumQueries(0):
+            cached = active_package_status(self.organization.id)
+            package_id = active_package_id(self.organization.id)
+
+        self.assertEqual(cached.id, package_status.id)
+        self.assertEqual(package_id, self.basic.id)
+
+    def test_missing_status_is_cached(self):
+        """Test organizations without a package are cached too"""
+        self.assertIsNone(active_package_status(self.organization.id))
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(active_package_status(self.organization.id))
+
+    def test_expired_status_is_ignored_without_write(self):
+        """Test a row past its end_date counts as expired on read"""
+        package_status = self.create_status(self.basic)
+        active_package_status(self.organization.id)
+        later = timezone.now() + timezone.timedelta(hours=73)
+
+        with patch('core.entitlements.timezone.now', return_value=later):
+            with self.assertNumQueries(0):
+                expired = active_package_status(self.organization.id)
+
+        self.assertIsNone(expired)
+        package_status.refresh_from_db()
+        self.assertEqual(package_status.status, 'y')
+
+    def test_saving_status_invalidates(self):
+        """Test a new active row replaces the cached one"""
+        old = self.create_status(self.basic)
+        active_package_status(self.organization.id)
+
+        old.status = 'n'
+        old.save()
+        self.create_status(self.pro)
+
+        self.assertEqual(active_package_id(self.organization.id), self.pro.id)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_process_local_cache_is_not_used(self):
+        """Test a LocMem cache, which other workers cannot evict, is skipped"""
+        self.create_status(self.basic)
+        active_package_status(self.organization.id)
+
+        with self.assertNumQueries(1):
+            package_id = active_package_id(self.organization.id)
+
+        self.assertEqual(package_id, self.basic.id)
+        self.assertIsNone(cache.get(cache_key(self.organization.id)))
+
+    def test_get_package_endpoint(self):
+        """Test the package endpoint reads through the resolver"""
+        role = UserRole.objects.create(id=1, name='admin')
+        admin = get_user_model().objects.create_user(
+            email='admin@example.com', organization=self.organization,
+            package=self.basic, role=role,
+        )
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        self.create_status(self.basic, hours=-1)
+
+        res = client.get(GET_PACKAGE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
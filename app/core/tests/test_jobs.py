@@ -0,0 +1,254 @@
+"""
+Test the database job queue
+"""
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+
+calls = []
+
+
+@jobs.task()
+def record_call(value):
+    calls.append(value)
+
+
+dead = []
+
+
+@jobs.task('tests.fail', on_dead=lambda error: dead.append(error))
+def fail():
+    raise RuntimeError('boom')
+
+
+workers = []
+
+
+@jobs.task('tests.crash')
+def crash():
+    """Leave a job behind as if its worker had died running it"""
+    Job.objects.create(
+        name='tests.stop', status=Job.RUNNING, attempts=1,
+        locked_by='crashed', locked_at=timezone.now()
+        - timezone.timedelta(hours=1),
+    )
+
+
+@jobs.task('tests.stop')
+def stop():
+    calls.append('recovered')
+    workers[0].stop()
+
+
+recovered = []
+
+
+@jobs.task('tests.recover')
+def recover():
+    """Recover stale jobs as another worker would meanwhile"""
+    recovered.append(jobs.recover_stale())
+
+
+@override_settings(JOB_RETRY_DELAY=10, JOB_RETRY_MAX_DELAY=60)
+class JobQueueTests(TestCase):
+    """Test claiming, running and retrying jobs"""
+
+    def setUp(self):
+        calls.clear()
+        dead.clear()
+        workers.clear()
+        recovered.clear()
+        self.worker = jobs.Worker(concurrency=1, batch_size=10)
+
+    def test_enqueue_by_function_or_name(self):
+        job = jobs.enqueue(record_call, {'value': 1})
+
+        self.assertEqual(job.name, 'core.tests.test_jobs.record_call')
+        self.assertEqual(jobs.enqueue('tests.fail').name, 'tests.fail')
+        self.assertEqual(job.max_attempts, 5)
+
+    def test_runs_by_priority_then_due_time(self):
+        now = timezone.now()
+        jobs.enqueue(record_call, {'value': 'late'},
+                     run_at=now - timezone.timedelta(seconds=1))
+        jobs.enqueue(record_call, {'value': 'early'},
+                     run_at=now - timezone.timedelta(seconds=2))
+        jobs.enqueue(record_call, {'value': 'urgent'}, priority=10)
+
+        self.assertEqual(self.worker.run(burst=True), (3, 0))
+
+        self.assertEqual(calls, ['urgent', 'early', 'late'])
+        job = Job.objects.get(payload__value='urgent')
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(job.locked_by, '')
+
+    def test_scheduled_jobs_wait(self):
+        jobs.enqueue(record_call, {'value': 1}, delay=60)
+
+        self.assertEqual(jobs.claim(10), [])
+        later = timezone.now() + timezone.timedelta(seconds=61)
+        self.assertEqual(len(jobs.claim(10, now=later)), 1)
+
+    def test_claimed_jobs_are_not_claimed_again(self):
+        for value in range(5):
+            jobs.enqueue(record_call, {'value': value})
+
+        first = jobs.claim(3)
+        second = jobs.claim(3)
+
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertNotEqual(first[0].locked_by, second[0].locked_by)
+        self.assertEqual(jobs.claim(3), [])
+
+    @patch('core.jobs.random.uniform', return_value=1.0)
+    def test_failures_retry_with_backoff_then_die(self, uniform):
+        job = jobs.enqueue(fail, max_attempts=3)
+        delays = []
+
+        with self.assertLogs('core.jobs', 'WARNING'):
+            for _ in range(3):
+                claimed, = jobs.claim(now=timezone.now()
+                                      + timezone.timedelta(hours=1))
+                started = timezone.now()
+                self.assertFalse(jobs.run(claimed))
+                job.refresh_from_db()
+                delays.append(round((job.run_at - started).total_seconds()))
+
+        self.assertEqual(delays[:2], [10, 20])
+        self.assertEqual((job.status, job.attempts), (Job.DEAD, 3))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertEqual(dead, [job.last_error])
+
+    def test_backoff_is_capped(self):
+        with patch('core.jobs.random.uniform', return_value=1.0):
+            self.assertEqual(jobs.backoff(1), 10)
+            self.assertEqual(jobs.backoff(3), 40)
+            self.assertEqual(jobs.backoff(10), 60)
+
+    def test_unknown_task_is_dead_at_once(self):
+        job = jobs.enqueue('tests.missing')
+
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(self.worker.run(burst=True), (0, 1))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DEAD)
+        self.assertIn('tests.missing', job.last_error)
+
+    def test_requeue_dead(self):
+        job = jobs.enqueue(record_call, {'value': 1})
+        Job.objects.update(status=Job.DEAD, attempts=5)
+
+        self.assertEqual(jobs.requeue_dead(), 1)
+
+        self.worker.run(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
+
+    def test_stopped_worker_releases_its_claims(self):
+        for value in range(3):
+            jobs.enqueue(record_call, {'value': value})
+        claimed = jobs.claim(3)
+
+        jobs.run(claimed[0])
+        jobs.release(claimed[1:])
+
+        statuses = dict(Job.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[claimed[0].id], Job.DONE)
+        self.assertEqual(statuses[claimed[1].id], Job.QUEUED)
+        self.assertEqual(
+            Job.objects.get(id=claimed[2].id).attempts, 0
+        )
+
+    @override_settings(JOB_LOCK_TIMEOUT=60)
+    def test_stale_jobs_are_recovered(self):
+        jobs.enqueue(record_call, {'value': 1})
+        jobs.enqueue(record_call, {'value': 2}, max_attempts=1)
+        stale, last = jobs.claim(2)
+        later = timezone.now() + timezone.timedelta(seconds=120)
+
+        self.assertEqual(jobs.recover_stale(now=later), 2)
+
+        self.assertEqual(
+            dict(Job.objects.values_list('id', 'status')),
+            {stale.id: Job.QUEUED, last.id: Job.DEAD},
+        )
+        # The recovered job's old worker no longer runs or records it
+        self.assertIsNone(jobs.run(stale))
+        self.assertEqual(calls, [])
+        self.assertEqual(Job.objects.get(id=stale.id).status, Job.QUEUED)
+
+    @override_settings(JOB_LOCK_TIMEOUT=60)
+    def test_job_recovered_while_waiting_in_a_batch_runs_once(self):
+        """Test jobs are stamped as they start, not when claimed"""
+        jobs.enqueue(recover, priority=1)
+        jobs.enqueue(record_call, {'value': 1})
+        batch = jobs.claim(2)
+        # Claimed long before the batch reaches them
+        Job.objects.update(
+            locked_at=timezone.now() - timezone.timedelta(seconds=120)
+        )
+
+        self.assertEqual([jobs.run(job) for job in batch], [True, None])
+
+        # Only the job still waiting was recovered, and it runs once
+        self.assertEqual(recovered, [1])
+        self.assertEqual(calls, [])
+        self.assertEqual(self.worker.run(burst=True), (1, 0))
+        self.assertEqual(calls, [1])
+
+    @override_settings(JOB_LOCK_TIMEOUT=60)
+    def test_running_worker_recovers_stale_jobs(self):
+        """Test stale jobs are requeued while the worker polls"""
+        worker = jobs.Worker(concurrency=1, poll_interval=0)
+        workers.append(worker)
+        jobs.enqueue(crash)
+        clock = iter(range(0, 100000, 10))
+
+        def monotonic():
+            # Stops a worker that never recovers the job
+            elapsed = next(clock)
+            if elapsed >= 10000:
+                worker.stop()
+            return elapsed
+
+        with patch('core.jobs.time.monotonic', monotonic):
+            worker.run()
+
+        self.assertEqual(calls, ['recovered'])
+        self.assertEqual(
+            Job.objects.get(name='tests.stop').status, Job.DONE
+        )
+        # Checked at start, then every 30s of the clock
+        self.assertLess(next(clock), 100)
+
+    @override_settings(JOB_KEEP_DAYS=7)
+    def test_purge(self):
+        old = jobs.enqueue(record_call, {'value': 1})
+        jobs.enqueue(record_call, {'value': 2})
+        self.worker.run(burst=True)
+        Job.objects.filter(id=old.id).update(
+            finished_at=timezone.now() - timezone.timedelta(days=8)
+        )
+
+        self.assertEqual(jobs.purge(), 1)
+        self.assertFalse(Job.objects.filter(id=old.id).exists())
+
+    def test_command(self):
+        jobs.enqueue(record_call, {'value': 1})
+        jobs.enqueue(record_call, {'value': 2})
+        out = StringIO()
+
+        call_command('run_worker', '--burst', '--concurrency=1',
+                     stdout=out)
+
+        self.assertEqual(sorted(calls), [1, 2])
+        self.assertIn('2 jobs succeeded, 0 failed', out.getvalue())
@@ -0,0 +1,64 @@
+"""
+Django command to record the Stripe customers of users
+"""
+import stripe
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core.bulk import insert_ignore
+from core.models import StripeCustomer
+from payments.tasks import configure
+
+
+class Command(BaseCommand):
+    """
+    Page through the Stripe customers once and record the customer of
+    every user without a StripeCustomer row, matched by email. Like the
+    payments, a user with several customers gets the newest one.
+    """
+    help = 'Record the Stripe customers of users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Rows recorded per insert.',
+        )
+
+    def handle(self, *args, **options):
+        configure()
+        users = {
+            email: (user_id, organization_id)
+            for email, user_id, organization_id in
+            get_user_model().objects.filter(
+                stripe_customer__isnull=True
+            ).values_list('email', 'id', 'organization_id')
+        }
+        self.stdout.write(f'{len(users)} users without a Stripe customer')
+
+        scanned = recorded = 0
+        batch = []
+        customers = stripe.Customer.list(limit=100).auto_paging_iter()
+        for customer in customers:
+            if not users:
+                break
+            scanned += 1
+            user = users.pop(customer.get('email'), None)
+            if user is None:
+                continue
+            batch.append(StripeCustomer(
+                user_id=user[0], organization_id=user[1],
+                customer_id=customer.id,
+            ))
+            if len(batch) >= options['batch_size']:
+                recorded += self.record(batch)
+                batch = []
+        recorded += self.record(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recorded {recorded} customers of {scanned} scanned'
+        ))
+
+    def record(self, batch):
+        # Payments may have recorded some users since the scan began
+        insert_ignore(StripeCustomer, batch, ['user'])
+        return len(batch)
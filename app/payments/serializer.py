@@ -1,6 +1,15 @@
 from rest_framework import serializers
 
+from core.models import Payment
+
 
 class SelectPackageSerializer(serializers.Serializer):
     package_name = serializers.ChoiceField(choices=['basic', 'pro', 'premium'])
     payment_method_id = serializers.CharField(max_length=100, required=True)
+
+
+class PaymentStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = ['id', 'status', 'succeeded', 'message', 'next_action_url']
+        read_only_fields = fields
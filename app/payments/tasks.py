@@ -0,0 +1,165 @@
+"""
+Background jobs talking to Stripe
+"""
+import logging
+
+import stripe
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from core import jobs
+from core.bulk import insert_ignore
+from core.models import Payment, StripeCustomer
+
+logger = logging.getLogger(__name__)
+
+# Errors worth another attempt: Stripe unreachable, rate limited or
+# failing on its side
+TRANSIENT_ERRORS = (
+    stripe.error.APIConnectionError,
+    stripe.error.RateLimitError,
+    stripe.error.APIError,
+)
+
+
+def configure():
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.api_base = settings.STRIPE_API_BASE
+
+
+def get_customer(user, payment):
+    """
+    The Stripe customer id of user, from StripeCustomer when known.
+
+    Otherwise the customer is looked up by email or created, outside of
+    any transaction so no lock is held while Stripe answers. Creating is
+    idempotent per user, so concurrent first payments of a user get the
+    same customer from Stripe (for the 24 hours Stripe keeps the key).
+    It is then recorded, and the unique StripeCustomer.user keeps the
+    first one recorded if they still differ.
+    """
+    customer_id = StripeCustomer.objects.filter(
+        user_id=user.id
+    ).values_list('customer_id', flat=True).first()
+    if customer_id:
+        return customer_id
+
+    customer_data = stripe.Customer.list(email=user.email).data
+
+    # if the array is empty it means the email has not been used yet
+    if len(customer_data) == 0:
+        customer = stripe.Customer.create(
+            name=user.name,
+            email=user.email,
+            payment_method=payment.payment_method_id,
+            idempotency_key=f'customer-{user.id}',
+            )
+    else:
+        customer = customer_data[0]
+    insert_ignore(StripeCustomer, [StripeCustomer(
+        user_id=user.id,
+        organization_id=user.organization_id,
+        customer_id=customer.id,
+    )], ['user'])
+    return StripeCustomer.objects.filter(
+        user_id=user.id
+    ).values_list('customer_id', flat=True).get()
+
+
+def fail_payment(payment_id, error=None):
+    """Give up on a payment whose job ran out of attempts"""
+    Payment.objects.filter(id=payment_id, status=Payment.PENDING).update(
+        status=Payment.FAILED,
+        message='The payment could not be processed, please try again.',
+    )
+
+
+@jobs.task('payments.confirm', on_dead=fail_payment)
+def confirm_payment(payment_id):
+    """
+    Create and confirm the PaymentIntent of a pending payment.
+
+    Stripe requests carry idempotency keys derived from the payment, so
+    a retried job gets the customer and intent of the earlier attempt
+    instead of charging twice. Declines, invalid requests and intents
+    that failed or were canceled fail the payment; transient errors and
+    intents still processing raise for the job to be retried.
+    """
+    payment = Payment.objects.filter(
+        id=payment_id, status=Payment.PENDING
+    ).first()
+    if payment is None:
+        return
+    user = get_user_model().objects.get(id=payment.created_by)
+    configure()
+
+    try:
+        if payment.payment_intent_id:
+            # Created by an earlier attempt and still processing
+            payment_intent = stripe.PaymentIntent.retrieve(
+                payment.payment_intent_id
+            )
+        else:
+            payment_intent = stripe.PaymentIntent.create(
+                customer=get_customer(user, payment),
+                payment_method=payment.payment_method_id,
+                currency='usd',  # you can provide any currency you want
+                amount=int(payment.amount*100),
+                confirm=True,
+                return_url="http://localhost:9001/",
+                receipt_email=user.email,
+                idempotency_key=f'payment-{payment.id}-intent',
+                )
+    except TRANSIENT_ERRORS:
+        raise
+    except stripe.error.StripeError as e:
+        logger.info('Payment %s failed: %s', payment.id, e)
+        if e.code == 'resource_missing' and \
+                getattr(e, 'param', None) == 'customer':
+            # Deleted on Stripe; the next payment finds or makes another
+            StripeCustomer.objects.filter(user_id=user.id).delete()
+        Payment.objects.filter(id=payment.id).update(
+            status=Payment.FAILED,
+            message=e.user_message or str(e),
+        )
+        return
+
+    if payment_intent.status == 'succeeded':
+        result = Payment.SUCCEEDED
+    elif payment_intent.status == 'requires_action':
+        result = Payment.REQUIRES_ACTION
+    elif payment_intent.status == 'processing':
+        result = Payment.PENDING
+    else:
+        # requires_payment_method (the attempt failed) or canceled: the
+        # intent will not move on by itself, so retrying cannot help
+        error = payment_intent.get('last_payment_error') or {}
+        logger.info('Payment %s failed: PaymentIntent %s is %s',
+                    payment.id, payment_intent.id, payment_intent.status)
+        Payment.objects.filter(id=payment.id).update(
+            payment_intent_id=payment_intent.id,
+            status=Payment.FAILED,
+            message=error.get('message') or
+            'The payment could not be completed, please try again.',
+        )
+        return
+    next_action = payment_intent.get('next_action') or {}
+    redirect = next_action.get('redirect_to_url') or {}
+
+    with transaction.atomic():
+        Payment.objects.filter(
+            organization_id=payment.organization_id
+        ).exclude(id=payment.id).update(is_active=False)
+        Payment.objects.filter(id=payment.id).update(
+            payment_intent_id=payment_intent.id,
+            succeeded=result == Payment.SUCCEEDED,
+            status=result,
+            is_active=True,
+            next_action_url=redirect.get('url') or '',
+        )
+    if result == Payment.PENDING:
+        # Still processing on Stripe's side; ask again later
+        raise RuntimeError(
+            f'PaymentIntent {payment_intent.id} is {payment_intent.status}'
+        )
@@ -0,0 +1,181 @@
+"""
+A local stand-in for the parts of the Stripe API the payments use
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Test payment methods, named like Stripe's test cards
+DECLINED = 'pm_card_chargeDeclined'
+THREE_D_SECURE = 'pm_card_threeDSecure2Required'
+# Left processing; tests move it on through StripeStub.intents
+PROCESSING = 'pm_card_processing'
+# Fails with a server error as many times as StripeStub.outages
+UNAVAILABLE = 'pm_card_unavailable'
+
+
+class StripeStub:
+    """
+    Serve customers and payment intents over HTTP on a free local port.
+
+    Requests are recorded in requests as (method, path, params), and
+    POSTs with an Idempotency-Key replay the first response like Stripe.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.customers = {}
+        self.intents = {}
+        self.outages = 0
+        self._replies = {}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub._handle(self, 'GET')
+
+            def do_POST(self):
+                stub._handle(self, 'POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.customers.clear()
+            self.intents.clear()
+            self._replies.clear()
+            self.outages = 0
+
+    def add_customer(self, email, name=None):
+        """A customer made before, outside of the payment flow"""
+        with self._lock:
+            return self._route('POST', '/v1/customers', {
+                'email': email, 'name': name,
+            })[1]['id']
+
+    def paths(self, method=None):
+        return [
+            path for verb, path, _ in self.requests
+            if method is None or verb == method
+        ]
+
+    def _handle(self, request, method):
+        url = urlsplit(request.path)
+        if method == 'POST':
+            length = int(request.headers.get('Content-Length') or 0)
+            query = request.rfile.read(length).decode()
+        else:
+            query = url.query
+        params = {key: values[0] for key, values in parse_qs(query).items()}
+        key = request.headers.get('Idempotency-Key')
+        with self._lock:
+            self.requests.append((method, url.path, params))
+            if key and key in self._replies:
+                code, body = self._replies[key]
+            else:
+                code, body = self._route(method, url.path, params)
+                if key and code < 500:
+                    self._replies[key] = code, body
+        payload = json.dumps(body).encode()
+        request.send_response(code)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def _route(self, method, path, params):
+        if path == '/v1/customers' and method == 'GET':
+            # Newest first, paged by limit and starting_after like Stripe
+            found = [
+                customer for customer in reversed(self.customers.values())
+                if 'email' not in params
+                or customer['email'] == params['email']
+            ]
+            if 'starting_after' in params:
+                ids = [customer['id'] for customer in found]
+                found = found[ids.index(params['starting_after']) + 1:]
+            limit = int(params.get('limit', 10))
+            return 200, {
+                'object': 'list', 'url': path,
+                'has_more': len(found) > limit, 'data': found[:limit],
+            }
+        if path == '/v1/customers' and method == 'POST':
+            customer = {
+                'id': f'cus_{len(self.customers) + 1}',
+                'object': 'customer',
+                'email': params.get('email'),
+                'name': params.get('name'),
+            }
+            self.customers[customer['id']] = customer
+            return 200, customer
+        if path == '/v1/payment_intents' and method == 'POST':
+            return self._create_intent(params)
+        if path.startswith('/v1/payment_intents/') and method == 'GET':
+            intent = self.intents.get(path.rsplit('/', 1)[1])
+            if intent is not None:
+                return 200, intent
+        return 404, {'error': {
+            'type': 'invalid_request_error',
+            'message': f'Unrecognized request URL ({method}: {path})',
+        }}
+
+    def _create_intent(self, params):
+        method = params.get('payment_method')
+        if method == UNAVAILABLE and self.outages:
+            self.outages -= 1
+            return 500, {'error': {
+                'type': 'api_error', 'message': 'Something went wrong.',
+            }}
+        if params.get('customer') not in self.customers:
+            return 400, {'error': {
+                'type': 'invalid_request_error', 'code': 'resource_missing',
+                'param': 'customer',
+                'message': f"No such customer: '{params.get('customer')}'",
+            }}
+        if method == DECLINED:
+            return 402, {'error': {
+                'type': 'card_error', 'code': 'card_declined',
+                'decline_code': 'generic_decline',
+                'message': 'Your card was declined.',
+            }}
+        intent = {
+            'id': f'pi_{len(self.intents) + 1}',
+            'object': 'payment_intent',
+            'amount': int(params['amount']),
+            'currency': params.get('currency'),
+            'customer': params.get('customer'),
+            'payment_method': method,
+            'status': 'succeeded',
+            'next_action': None,
+        }
+        if method == THREE_D_SECURE:
+            intent['status'] = 'requires_action'
+            intent['next_action'] = {
+                'type': 'redirect_to_url',
+                'redirect_to_url': {
+                    'url': 'https://hooks.stripe.com/3d_secure/test',
+                    'return_url': params.get('return_url'),
+                },
+            }
+        elif method == PROCESSING:
+            intent['status'] = 'processing'
+        self.intents[intent['id']] = intent
+        return 200, intent
@@ -0,0 +1,65 @@
+"""
+Test the payments commands
+"""
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.models import Organization, StripeCustomer
+from payments.tests.stripe_stub import StripeStub
+
+
+class SyncStripeCustomersTests(TestCase):
+    """Test backfilling the Stripe customers of users"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stripe = StripeStub().start()
+        cls.addClassCleanup(cls.stripe.stop)
+        settings = override_settings(
+            STRIPE_SECRET_KEY='sk_test_stub', STRIPE_API_BASE=cls.stripe.url,
+        )
+        settings.enable()
+        cls.addClassCleanup(settings.disable)
+
+    def setUp(self):
+        self.stripe.reset()
+        self.organization = Organization.objects.create(name='inseyab')
+        self.users = [
+            get_user_model().objects.create(
+                email=f'user{i}@example.com', organization=self.organization,
+                package=None, role=None,
+            )
+            for i in range(3)
+        ]
+
+    def test_backfill(self):
+        self.stripe.add_customer('user0@example.com')
+        self.stripe.add_customer('user1@example.com')
+        newer = self.stripe.add_customer('user1@example.com')
+        for i in range(150):
+            self.stripe.add_customer(f'stranger{i}@example.com')
+        self.stripe.add_customer('user2@example.com')
+        StripeCustomer.objects.create(user=self.users[2], customer_id='cus_x')
+        out = StringIO()
+
+        call_command('sync_stripe_customers', '--batch-size=1', stdout=out)
+
+        self.assertEqual(
+            dict(StripeCustomer.objects.values_list('user', 'customer_id')),
+            {
+                self.users[0].id: 'cus_1',
+                self.users[1].id: newer,
+                self.users[2].id: 'cus_x',
+            },
+        )
+        self.assertEqual(
+            StripeCustomer.objects.get(user=self.users[0]).organization,
+            self.organization,
+        )
+        self.assertIn('Recorded 2 customers', out.getvalue())
+        # Pages of 100 until every user is matched
+        self.assertEqual(self.stripe.paths('GET'), ['/v1/customers'] * 2)
@@ -0,0 +1,303 @@
+"""
+Test the asynchronous payment flow against a local Stripe stub
+"""
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import jobs
+from core.models import (
+    Job,
+    Organization,
+    Package,
+    Payment,
+    StripeCustomer,
+    UserRole,
+)
+from payments import tasks
+from payments.tests.stripe_stub import (
+    DECLINED,
+    PROCESSING,
+    THREE_D_SECURE,
+    UNAVAILABLE,
+    StripeStub,
+)
+
+CONFIRM_URL = reverse('payment:confirm_payment')
+
+
+def status_url(payment_id):
+    return reverse('payment:payment_status', args=[payment_id])
+
+
+class PaymentFlowTests(TestCase):
+    """Test payments are recorded at once and confirmed in the background"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stripe = StripeStub().start()
+        cls.addClassCleanup(cls.stripe.stop)
+        settings = override_settings(
+            STRIPE_SECRET_KEY='sk_test_stub', STRIPE_API_BASE=cls.stripe.url,
+        )
+        settings.enable()
+        cls.addClassCleanup(settings.disable)
+
+    def setUp(self):
+        self.stripe.reset()
+        self.organization = Organization.objects.create(name='inseyab')
+        Package.objects.create(name='pro', price=Decimal('49.99'))
+        role = UserRole.objects.create(id=1, name='admin')
+        self.user = get_user_model().objects.create(
+            email='admin@example.com', name='Admin',
+            organization=self.organization, package=None, role=role,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.worker = jobs.Worker(concurrency=1)
+
+    def pay(self, payment_method):
+        res = self.client.post(CONFIRM_URL, {
+            'package_name': 'pro', 'payment_method_id': payment_method,
+        })
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        return res
+
+    def poll(self, payment_id):
+        res = self.client.get(status_url(payment_id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res
+
+    def test_request_does_not_call_stripe(self):
+        res = self.pay('pm_card_visa')
+
+        payment_id = res.data['payment']['id']
+        self.assertEqual(res['Location'], status_url(payment_id))
+        self.assertEqual(self.stripe.requests, [])
+        payment = Payment.objects.get(id=payment_id)
+        self.assertEqual(payment.status, Payment.PENDING)
+        self.assertEqual(payment.amount, Decimal('49.99'))
+        job = Job.objects.get()
+        self.assertEqual(
+            (job.name, job.payload), ('payments.confirm',
+                                      {'payment_id': payment_id})
+        )
+        polled = self.poll(payment_id)
+        self.assertEqual(polled.data['status'], Payment.PENDING)
+        self.assertEqual(polled['Retry-After'], '1')
+
+    def test_successful_payment(self):
+        payment_id = self.pay('pm_card_visa').data['payment']['id']
+
+        self.assertEqual(self.worker.run(burst=True), (1, 0))
+
+        res = self.poll(payment_id)
+        self.assertEqual(res.data['status'], Payment.SUCCEEDED)
+        self.assertTrue(res.data['succeeded'])
+        self.assertNotIn('Retry-After', res)
+        payment = Payment.objects.get(id=payment_id)
+        self.assertEqual(payment.payment_intent_id, 'pi_1')
+        self.assertEqual(self.stripe.intents['pi_1']['amount'], 4999)
+        self.assertEqual(
+            list(Payment.objects.filter(is_active=True)), [payment]
+        )
+        self.assertEqual(self.stripe.paths('POST'), [
+            '/v1/customers', '/v1/payment_intents',
+        ])
+
+    def test_returning_customer_is_reused(self):
+        self.pay('pm_card_visa')
+        self.pay('pm_card_visa')
+
+        self.worker.run(burst=True)
+
+        self.assertEqual(len(self.stripe.customers), 1)
+        self.assertEqual(
+            {intent['customer'] for intent in self.stripe.intents.values()},
+            {'cus_1'},
+        )
+        customer = StripeCustomer.objects.get()
+        self.assertEqual(
+            (customer.user, customer.organization, customer.customer_id),
+            (self.user, self.organization, 'cus_1'),
+        )
+        # Only the first payment searched Stripe
+        self.assertEqual(self.stripe.paths('GET'), ['/v1/customers'])
+
+    def test_existing_stripe_customer_is_adopted(self):
+        customer_id = self.stripe.add_customer(self.user.email)
+        payment_id = self.pay('pm_card_visa').data['payment']['id']
+
+        self.worker.run(burst=True)
+
+        self.assertEqual(self.poll(payment_id).data['status'],
+                         Payment.SUCCEEDED)
+        self.assertEqual(len(self.stripe.customers), 1)
+        self.assertEqual(
+            StripeCustomer.objects.get(user=self.user).customer_id,
+            customer_id,
+        )
+
+    def test_customer_recorded_by_a_concurrent_payment_is_used(self):
+        winner = self.stripe.add_customer('admin+1@example.com')
+        insert_ignore = tasks.insert_ignore
+
+        def record_first(*args, **kwargs):
+            StripeCustomer.objects.create(
+                user=self.user, organization=self.organization,
+                customer_id=winner,
+            )
+            insert_ignore(*args, **kwargs)
+
+        payment_id = self.pay('pm_card_visa').data['payment']['id']
+        with patch('payments.tasks.insert_ignore', record_first):
+            self.worker.run(burst=True)
+
+        self.assertEqual(self.poll(payment_id).data['status'],
+                         Payment.SUCCEEDED)
+        self.assertEqual(
+            StripeCustomer.objects.get(user=self.user).customer_id, winner
+        )
+        self.assertEqual(self.stripe.intents['pi_1']['customer'], winner)
+
+    def test_concurrent_first_payments_create_one_customer(self):
+        first = Payment.objects.get(id=self.pay('pm_card_visa')
+                                    .data['payment']['id'])
+        second = Payment.objects.get(id=self.pay('pm_card_visa')
+                                     .data['payment']['id'])
+        tasks.configure()
+
+        customer_id = tasks.get_customer(self.user, first)
+        StripeCustomer.objects.all().delete()
+        # The second payment searched before the first one created
+        with patch('stripe.Customer.list',
+                   return_value=SimpleNamespace(data=[])):
+            self.assertEqual(
+                tasks.get_customer(self.user, second), customer_id
+            )
+
+        self.assertEqual(self.stripe.paths('POST'), ['/v1/customers'] * 2)
+        self.assertEqual(len(self.stripe.customers), 1)
+        self.assertEqual(
+            StripeCustomer.objects.get(user=self.user).customer_id,
+            customer_id,
+        )
+
+    def test_customer_deleted_on_stripe(self):
+        StripeCustomer.objects.create(
+            user=self.user, organization=self.organization,
+            customer_id='cus_deleted',
+        )
+        failed = self.pay('pm_card_visa').data['payment']['id']
+        self.worker.run(burst=True)
+
+        self.assertEqual(self.poll(failed).data['status'], Payment.FAILED)
+        self.assertFalse(StripeCustomer.objects.exists())
+
+        retried = self.pay('pm_card_visa').data['payment']['id']
+        self.worker.run(burst=True)
+
+        self.assertEqual(self.poll(retried).data['status'],
+                         Payment.SUCCEEDED)
+        self.assertEqual(
+            StripeCustomer.objects.get(user=self.user).customer_id, 'cus_1'
+        )
+
+    def test_declined_card(self):
+        payment_id = self.pay(DECLINED).data['payment']['id']
+
+        self.worker.run(burst=True)
+
+        res = self.poll(payment_id)
+        self.assertEqual(res.data['status'], Payment.FAILED)
+        self.assertEqual(res.data['message'], 'Your card was declined.')
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_payment_requiring_action(self):
+        payment_id = self.pay(THREE_D_SECURE).data['payment']['id']
+
+        self.worker.run(burst=True)
+
+        res = self.poll(payment_id)
+        self.assertEqual(res.data['status'], Payment.REQUIRES_ACTION)
+        self.assertEqual(
+            res.data['next_action_url'],
+            'https://hooks.stripe.com/3d_secure/test',
+        )
+
+    def test_processing_payment_is_polled_until_it_fails(self):
+        payment_id = self.pay(PROCESSING).data['payment']['id']
+        with patch('core.jobs.backoff', return_value=0), \
+                self.assertLogs('core.jobs', 'WARNING'):
+            self.assertFalse(jobs.run(jobs.claim()[0]))
+        self.assertEqual(self.poll(payment_id).data['status'],
+                         Payment.PENDING)
+        self.stripe.intents['pi_1'].update(
+            status='requires_payment_method',
+            last_payment_error={'message': 'Your card has expired.'},
+        )
+
+        self.assertEqual(self.worker.run(burst=True), (1, 0))
+
+        res = self.poll(payment_id)
+        self.assertEqual(res.data['status'], Payment.FAILED)
+        self.assertEqual(res.data['message'], 'Your card has expired.')
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_canceled_payment_is_not_retried(self):
+        payment_id = self.pay(PROCESSING).data['payment']['id']
+        with patch('core.jobs.backoff', return_value=0), \
+                self.assertLogs('core.jobs', 'WARNING'):
+            jobs.run(jobs.claim()[0])
+        self.stripe.intents['pi_1']['status'] = 'canceled'
+
+        self.assertEqual(self.worker.run(burst=True), (1, 0))
+
+        res = self.poll(payment_id)
+        self.assertEqual(res.data['status'], Payment.FAILED)
+        self.assertEqual(
+            res.data['message'],
+            'The payment could not be completed, please try again.',
+        )
+
+    def test_outage_is_retried_without_charging_twice(self):
+        self.stripe.outages = 1
+        payment_id = self.pay(UNAVAILABLE).data['payment']['id']
+
+        with patch('core.jobs.backoff', return_value=0), \
+                self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(self.worker.run(burst=True), (1, 1))
+
+        self.assertEqual(self.poll(payment_id).data['status'],
+                         Payment.SUCCEEDED)
+        self.assertEqual(len(self.stripe.customers), 1)
+        self.assertEqual(len(self.stripe.intents), 1)
+
+    def test_payment_fails_when_attempts_run_out(self):
+        self.stripe.outages = 10
+        payment_id = self.pay(UNAVAILABLE).data['payment']['id']
+        Job.objects.update(max_attempts=2)
+
+        with patch('core.jobs.backoff', return_value=0), \
+                self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(self.worker.run(burst=True), (0, 2))
+
+        res = self.poll(payment_id)
+        self.assertEqual(res.data['status'], Payment.FAILED)
+        self.assertEqual(Job.objects.get().status, Job.DEAD)
+
+    def test_status_of_other_organization(self):
+        other = Organization.objects.create(name='other')
+        payment = Payment.objects.get(organization=other)
+
+        res = self.client.get(status_url(payment.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
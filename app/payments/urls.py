@@ -4,5 +4,9 @@ from . import views
 app_name = 'payment'
 
 urlpatterns = [
-    path('confirm', views.CreatePayment.as_view(), name='confirm_payment')
+    path('confirm', views.CreatePayment.as_view(), name='confirm_payment'),
+    path(
+        'status/<int:pk>', views.PaymentStatus.as_view(),
+        name='payment_status'
+        ),
 ]
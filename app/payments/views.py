@@ -2,18 +2,34 @@ from rest_framework import status
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
-from payments.serializer import SelectPackageSerializer
-from django.conf import settings
-import stripe
+from core.authentication import CachedTokenAuthentication
+from payments.serializer import (
+    PaymentStatusSerializer,
+    SelectPackageSerializer,
+)
+from django.db import transaction
+from django.urls import reverse
 
-from core.models import Payment, Package
+from core import jobs
+from core.catalog import catalog
+from core.models import Payment
 from core.permissions import IsAdminUser
+from payments.tasks import confirm_payment
+
+# Seconds a client should wait before polling a pending payment again
+POLL_AFTER = 1
 
 
 class CreatePayment(GenericAPIView):
+    """
+    Start a payment for a package.
+
+    The payment is recorded as pending and confirmed with Stripe by a
+    background job, so the request never waits on Stripe; the client
+    polls the status endpoint in the Location header.
+    """
     permission_classes = [IsAuthenticated, IsAdminUser]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     serializer_class = SelectPackageSerializer
 
     def post(self, request):
@@ -24,70 +40,57 @@ class CreatePayment(GenericAPIView):
                 status=status.HTTP_400_BAD_REQUEST
                 )
         payment = payment.data
-        package = Package.objects.get(name=payment["package_name"])
+        package = catalog.package(payment["package_name"])
         user = self.request.user
-        data = request.data
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-
-        payment_method_id = data['payment_method_id']
-        customer_data = stripe.Customer.list(email=user.email).data
-
-        # if the array is empty it means the email has not been used yet
-        if len(customer_data) == 0:
-            # creating customer
-            customer = stripe.Customer.create(
-                name=user.name,
-                email=user.email,
-                payment_method=payment_method_id
-                )
-        else:
-            customer = customer_data[0]
-
-        try:
-            payment_intent = stripe.PaymentIntent.create(
-                customer=customer,
-                payment_method=payment_method_id,
-                currency='usd',  # you can provide any currency you want
-                amount=int(package.price*100),
-                confirm=True,
-                return_url="http://localhost:9001/",
-                receipt_email=user.email
-                )
-            previous_payments = Payment.objects.filter(
-                organization=user.organization
-                )
-            for p_payment in previous_payments:
-                p_payment.is_active = False
-                p_payment.save()
 
-            payment = Payment(
-                payment_intent_id=payment_intent.id,
+        with transaction.atomic():
+            payment = Payment.objects.create(
                 organization=user.organization,
-                succeeded=payment_intent.status == 'succeeded',
-                is_active=True,
+                status=Payment.PENDING,
+                package_id=package.id,
+                amount=package.price,
+                payment_method_id=payment['payment_method_id'],
                 created_by=user.id,
                 last_updated_by=user.id,
                 last_update_login=user.id
             )
-            payment.save()
+            # Checkouts go ahead of other background work
+            jobs.enqueue(
+                confirm_payment, {'payment_id': payment.id}, priority=10
+            )
 
-            return Response(
-                status=status.HTTP_200_OK,
-                data={
-                    'message': 'Success',
-                    'data': {'customer_id': customer.email},
-                    'payment': {
-                        'id': payment.id,
-                        'organization': user.organization.name
-                    }
+        status_url = reverse('payment:payment_status', args=[payment.id])
+        return Response(
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': status_url, 'Retry-After': POLL_AFTER},
+            data={
+                'message': 'Processing',
+                'payment': {
+                    'id': payment.id,
+                    'status': payment.status,
+                    'organization': user.organization.name,
+                    'status_url': status_url,
                 }
-            )
-        except stripe.error.CardError as e:
-            message = str(e)
-            print(message)
-            if ":" in message:
-                message = message.split(": ")[1]
+            }
+        )
+
+
+class PaymentStatus(GenericAPIView):
+    """Status of a payment of the user's organization, for polling"""
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    authentication_classes = [CachedTokenAuthentication]
+    serializer_class = PaymentStatusSerializer
+
+    def get(self, request, pk):
+        payment = Payment.objects.filter(
+            id=pk, organization_id=request.user.organization_id
+        ).values(*PaymentStatusSerializer.Meta.fields).first()
+        if payment is None:
             return Response(
-                {'message': message},
-                status=status.HTTP_400_BAD_REQUEST
+                {'message': 'Payment not found.'},
+                status=status.HTTP_404_NOT_FOUND
                 )
+        headers = {}
+        if payment['status'] == Payment.PENDING:
+            headers['Retry-After'] = POLL_AFTER
+        return Response(self.get_serializer(payment).data, headers=headers)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SmmartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'smmart'
+
+    def ready(self):
+        from smmart import matching  # noqa
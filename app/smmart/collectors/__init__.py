@@ -0,0 +1,16 @@
+"""
+Asynchronous collection of posts for topic keywords.
+
+A Connector fetches the posts of one platform for a FetchRequest; the
+Collector runs many of them concurrently and hands the results to a sink.
+"""
+from smmart.collectors.base import (  # noqa
+    CollectedPost,
+    CollectJob,
+    Connector,
+    ConnectorError,
+    FetchRequest,
+)
+from smmart.collectors.dedup import FetchPlan, deduplicate  # noqa
+from smmart.collectors.pipeline import Collector, CollectorStats  # noqa
+from smmart.collectors.scheduler import Scheduler  # noqa
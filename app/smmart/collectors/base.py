@@ -0,0 +1,60 @@
+"""
+Types shared by the collectors
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+
+
+class ConnectorError(Exception):
+    """A platform could not answer a fetch request"""
+
+
+@dataclass(frozen=True)
+class FetchRequest:
+    """Posts mentioning keyword on platform published in [since, until)"""
+    keyword: str
+    platform: str
+    since: datetime
+    until: datetime
+
+
+@dataclass(frozen=True)
+class CollectJob:
+    """
+    A fetch request and the topics its results belong to, with the
+    package tier and organization it is scheduled under
+    """
+    request: FetchRequest
+    topic_ids: tuple = ()
+    tier: str = 'basic'
+    organization_id: int = None
+
+
+@dataclass
+class CollectedPost:
+    """One post returned by a connector"""
+    platform: str
+    external_id: str
+    text: str
+    author: str = ''
+    url: str = ''
+    published_at: datetime = None
+    keyword: str = ''
+    topic_ids: tuple = field(default=())
+
+
+class Connector:
+    """
+    Base class of the per-platform connectors.
+
+    Subclasses set platform and implement fetch(); close() releases any
+    client held by the connector once a run is over.
+    """
+    platform = None
+
+    async def fetch(self, request):
+        """Return the CollectedPosts matching a FetchRequest"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
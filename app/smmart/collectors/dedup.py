@@ -0,0 +1,85 @@
+"""
+Cross-tenant deduplication of fetch requests
+"""
+import datetime
+
+from django.conf import settings
+
+from core.models import normalize_term
+from smmart.collectors.base import CollectJob, FetchRequest
+
+
+def _align(moment, step, up=False):
+    epoch = moment.timestamp()
+    aligned = epoch // step * step
+    if up and aligned < epoch:
+        aligned += step
+    return datetime.datetime.fromtimestamp(aligned, tz=datetime.timezone.utc)
+
+
+def canonical_request(request, window_minutes=None):
+    """
+    The canonical form of a FetchRequest: normalized keyword and
+    platform, and a window widened to whole collection windows.
+    """
+    step = (window_minutes or settings.COLLECTOR_WINDOW_MINUTES) * 60
+    return FetchRequest(
+        keyword=normalize_term(request.keyword),
+        platform=normalize_term(request.platform),
+        since=_align(request.since, step),
+        until=_align(request.until, step, up=True),
+    )
+
+
+class FetchPlan:
+    """
+    Collect jobs merged by canonical request.
+
+    Every canonical (keyword, platform, window) is fetched once and its
+    posts fan out to the union of the topics that asked for it.
+    """
+
+    def __init__(self, window_minutes=None):
+        self.window_minutes = window_minutes
+        self.requested = 0
+        self._topics = {}
+        self._owners = {}
+
+    def add(self, job):
+        self.requested += 1
+        request = canonical_request(job.request, self.window_minutes)
+        self._topics.setdefault(request, set()).update(job.topic_ids)
+        # A shared fetch is scheduled under its best-paying subscriber
+        weights = settings.COLLECTOR_TIER_WEIGHTS
+        owner = self._owners.get(request)
+        if owner is None or \
+                weights.get(job.tier, 0) > weights.get(owner[0], 0):
+            self._owners[request] = (job.tier, job.organization_id)
+
+    def extend(self, jobs):
+        for job in jobs:
+            self.add(job)
+        return self
+
+    def __len__(self):
+        return len(self._topics)
+
+    def __iter__(self):
+        for request, topic_ids in self._topics.items():
+            tier, organization_id = self._owners[request]
+            yield CollectJob(
+                request=request,
+                topic_ids=tuple(sorted(topic_ids)),
+                tier=tier,
+                organization_id=organization_id,
+            )
+
+    @property
+    def dedup_ratio(self):
+        """Requested fetches per fetch actually made"""
+        return self.requested / len(self) if len(self) else 1.0
+
+
+def deduplicate(jobs, window_minutes=None):
+    """Return a FetchPlan of jobs"""
+    return FetchPlan(window_minutes).extend(jobs)
@@ -0,0 +1,234 @@
+"""
+Concurrent execution of collect jobs
+"""
+import asyncio
+import dataclasses
+import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.models import Topics
+from smmart.collectors.base import CollectJob, ConnectorError, FetchRequest
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def discard(batch):
+    """Sink that drops every post"""
+
+
+def load_connectors():
+    """Instantiate the connectors of COLLECTOR_CONNECTORS by platform"""
+    return {
+        platform: import_string(path)()
+        for platform, path in settings.COLLECTOR_CONNECTORS.items()
+    }
+
+
+def load_sink():
+    return import_string(settings.COLLECTOR_SINK)
+
+
+def collection_window(now=None):
+    """The last complete COLLECTOR_WINDOW_MINUTES window before now"""
+    now = now or timezone.now()
+    minutes = settings.COLLECTOR_WINDOW_MINUTES
+    epoch = int(now.timestamp()) // (minutes * 60) * (minutes * 60)
+    until = datetime.datetime.fromtimestamp(epoch, tz=datetime.timezone.utc)
+    return until - timezone.timedelta(minutes=minutes), until
+
+
+def topic_jobs(topics=None, platforms=None, window=None, page_size=500):
+    """Yield a CollectJob per keyword and platform of every active topic"""
+    since, until = window or collection_window()
+    if topics is None:
+        topics = Topics.objects.filter(status=Topics.ACTIVE)
+    topics = topics.order_by('id').select_related(
+        'user__package'
+    ).prefetch_related('keyword_terms', 'platform_terms')
+    last_id = 0
+    while True:
+        page = list(topics.filter(id__gt=last_id)[:page_size])
+        if not page:
+            return
+        for topic in page:
+            user = topic.user
+            tier = 'basic'
+            if user and user.package and \
+                    user.package.name in settings.COLLECTOR_TIER_WEIGHTS:
+                tier = user.package.name
+            organization_id = user.organization_id if user else None
+            for platform in topic.platform_terms.all():
+                if platforms is not None and platform.name not in platforms:
+                    continue
+                for keyword in topic.keyword_terms.all():
+                    request = FetchRequest(
+                        keyword=keyword.name,
+                        platform=platform.name,
+                        since=since,
+                        until=until,
+                    )
+                    yield CollectJob(
+                        request=request,
+                        topic_ids=(topic.id,),
+                        tier=tier,
+                        organization_id=organization_id,
+                    )
+        last_id = page[-1].id
+
+
+@dataclass
+class CollectorStats:
+    requests: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    posts: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+
+    def as_dict(self):
+        return dataclasses.asdict(self)
+
+
+class Collector:
+    """
+    Run collect jobs against the platform connectors.
+
+    concurrency workers pull jobs from the job iterator, so no more than
+    that many fetches are in flight and jobs are never all materialized.
+    jobs may also be an async iterator such as a Scheduler.
+    Each fetch is cancelled after timeout seconds. Posts go through a
+    queue of queue_size entries to a single consumer that calls the sink
+    with batches of up to batch_size posts; when the sink falls behind the
+    queue fills up and the workers wait, which is the backpressure. If
+    the sink raises, the workers stop taking jobs, the posts still
+    queued are dropped and run() raises the sink's error.
+
+    A synchronous sink and the job iterator run on one dedicated thread,
+    so they share a single database connection; a coroutine sink is
+    awaited directly.
+    """
+
+    def __init__(self, connectors, sink=discard, concurrency=None,
+                 timeout=None, queue_size=None, batch_size=500):
+        self.connectors = connectors
+        self.sink = sink
+        self.concurrency = concurrency or settings.COLLECTOR_CONCURRENCY
+        self.timeout = timeout or settings.COLLECTOR_TIMEOUT
+        self.queue_size = queue_size or settings.COLLECTOR_QUEUE_SIZE
+        self.batch_size = batch_size
+        self.stats = CollectorStats()
+        self._sink_error = None
+
+    def collect(self, jobs):
+        """Run jobs to completion and return the stats"""
+        return asyncio.run(self.run(jobs))
+
+    async def run(self, jobs):
+        started = time.perf_counter()
+        if not hasattr(jobs, '__anext__'):
+            jobs = iter(jobs)
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        executor = ThreadPoolExecutor(max_workers=1)
+        self._sink_error = None
+        consumer = asyncio.create_task(self._consume(queue, executor))
+        try:
+            await asyncio.gather(*(
+                self._work(jobs, queue, executor)
+                for _ in range(self.concurrency)
+            ))
+            await queue.put(_DONE)
+            await consumer
+            if self._sink_error is not None:
+                raise self._sink_error
+        finally:
+            consumer.cancel()
+            for connector in self.connectors.values():
+                await connector.close()
+            executor.submit(connections.close_all)
+            executor.shutdown(wait=True)
+        self.stats.elapsed = time.perf_counter() - started
+        return self.stats
+
+    async def _next_job(self, jobs, executor):
+        if hasattr(jobs, '__anext__'):
+            try:
+                return await jobs.__anext__()
+            except StopAsyncIteration:
+                return None
+        # Job iterators may read the database, which is not allowed on
+        # the event loop, so they advance on the sink's thread.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, next, jobs, None)
+
+    async def _work(self, jobs, queue, executor):
+        while self._sink_error is None:
+            job = await self._next_job(jobs, executor)
+            if job is None:
+                return
+            posts = await self._fetch(job)
+            for post in posts:
+                post.topic_ids = job.topic_ids
+                await queue.put(post)
+
+    async def _fetch(self, job):
+        self.stats.requests += 1
+        connector = self.connectors.get(job.request.platform)
+        if connector is None:
+            self.stats.failed += 1
+            return []
+        try:
+            posts = await asyncio.wait_for(
+                connector.fetch(job.request), self.timeout
+            )
+        except asyncio.TimeoutError:
+            self.stats.timed_out += 1
+            return []
+        except ConnectorError:
+            self.stats.failed += 1
+            return []
+        except Exception:
+            logger.exception('Fetching %s failed', job.request)
+            self.stats.failed += 1
+            return []
+        self.stats.succeeded += 1
+        self.stats.posts += len(posts)
+        return posts
+
+    async def _consume(self, queue, executor):
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            batch = []
+            item = await queue.get()
+            while True:
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size or queue.empty():
+                    break
+                item = queue.get_nowait()
+            if not batch or self._sink_error is not None:
+                continue
+            try:
+                if asyncio.iscoroutinefunction(self.sink):
+                    await self.sink(batch)
+                else:
+                    await loop.run_in_executor(executor, self.sink, batch)
+            except Exception as error:
+                # Keep draining the queue so no worker is left waiting
+                # on it; they stop at their next job
+                self._sink_error = error
+                continue
+            self.stats.batches += 1
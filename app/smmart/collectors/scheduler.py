@@ -0,0 +1,238 @@
+"""
+Rate-limited, weighted fair dispatch of collect jobs
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+from django.conf import settings
+
+# Refills accumulate rounding error; a bucket this close to a whole
+# token has one, otherwise the wait shrinks below clock resolution.
+EPSILON = 1e-9
+
+
+class SystemClock:
+    """Wall clock for production use"""
+
+    def monotonic(self):
+        return time.monotonic()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+class FakeClock:
+    """Simulated clock whose sleep() only moves time forward"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    async def sleep(self, seconds):
+        # Concurrent sleepers share the timeline instead of adding up
+        target = self.now + seconds
+        await asyncio.sleep(0)
+        self.now = max(self.now, target)
+
+
+class TokenBucket:
+    """rate tokens per second, holding at most capacity tokens"""
+
+    def __init__(self, rate, capacity, clock):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock.monotonic()
+
+    def _refill(self):
+        now = self.clock.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def try_take(self):
+        self._refill()
+        if self.tokens >= 1 - EPSILON:
+            self.tokens = max(self.tokens - 1, 0.0)
+            return True
+        return False
+
+    def wait_time(self):
+        """Seconds until a token is available"""
+        self._refill()
+        if self.tokens >= 1 - EPSILON:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+@dataclass
+class WaitStats:
+    dispatched: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def record(self, wait):
+        self.dispatched += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    @property
+    def mean_wait(self):
+        return self.total_wait / self.dispatched if self.dispatched else 0.0
+
+
+class FairQueue:
+    """
+    Jobs of one platform, weighted by tier, round-robin by organization.
+
+    Tiers are served by stride scheduling: the non-empty tier with the
+    lowest pass goes next and its pass grows by 1 / weight, so a tier of
+    weight 4 gets four dispatches for every one of a tier of weight 1.
+    Organizations of the same tier take turns.
+    """
+
+    def __init__(self, weights):
+        self.weights = weights
+        self._tiers = {tier: OrderedDict() for tier in weights}
+        self._pass = {tier: 0.0 for tier in weights}
+        self._depth = {tier: 0 for tier in weights}
+
+    def __len__(self):
+        return sum(self._depth.values())
+
+    def depth(self):
+        return dict(self._depth)
+
+    def push(self, tier, organization_id, item):
+        if tier not in self._tiers:
+            raise ValueError(f'Unknown package tier {tier!r}')
+        if not self._depth[tier]:
+            # An idle tier rejoins at the current pass instead of
+            # spending the credit it built up while empty.
+            busy = [self._pass[t] for t in self._tiers if self._depth[t]]
+            self._pass[tier] = max(self._pass[tier], min(busy, default=0))
+        organizations = self._tiers[tier]
+        organizations.setdefault(organization_id, deque()).append(item)
+        self._depth[tier] += 1
+
+    def pop(self):
+        tier = min(
+            (t for t in self._tiers if self._depth[t]),
+            key=lambda t: (self._pass[t], -self.weights[t]),
+        )
+        self._pass[tier] += 1 / self.weights[tier]
+        organizations = self._tiers[tier]
+        organization_id, items = next(iter(organizations.items()))
+        item = items.popleft()
+        del organizations[organization_id]
+        if items:
+            organizations[organization_id] = items
+        self._depth[tier] -= 1
+        return tier, item
+
+
+class Scheduler:
+    """
+    Dispatch collect jobs within each platform's rate limit.
+
+    Every platform has a token bucket and a FairQueue; a job leaves its
+    queue only when its platform has a token, so a throttled platform
+    never holds back the others. Iterate with `async for` (the Collector
+    does) to receive jobs as they become dispatchable; iteration ends once
+    close() was called and the queues are empty.
+    """
+
+    def __init__(self, rate_limits=None, weights=None, clock=None):
+        self.clock = clock or SystemClock()
+        rate_limits = rate_limits or settings.COLLECTOR_RATE_LIMITS
+        self.weights = weights or settings.COLLECTOR_TIER_WEIGHTS
+        self.buckets = {
+            platform: TokenBucket(rate, burst, self.clock)
+            for platform, (rate, burst) in rate_limits.items()
+        }
+        self.queues = {
+            platform: FairQueue(self.weights) for platform in rate_limits
+        }
+        self.waits = {tier: WaitStats() for tier in self.weights}
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def submit(self, job):
+        """Queue a job under its platform, tier and organization"""
+        platform = job.request.platform
+        if platform not in self.queues:
+            raise ValueError(f'No rate limit for platform {platform!r}')
+        self.queues[platform].push(
+            job.tier, job.organization_id, (self.clock.monotonic(), job)
+        )
+        self._changed.set()
+
+    def extend(self, jobs):
+        for job in jobs:
+            self.submit(job)
+        return self
+
+    def close(self):
+        """No more jobs will be submitted"""
+        self.closed = True
+        self._changed.set()
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def metrics(self):
+        """Queue depth per platform and tier, wait times per tier"""
+        return {
+            'depth': {
+                platform: queue.depth()
+                for platform, queue in self.queues.items()
+            },
+            'wait': {
+                tier: {
+                    'dispatched': stats.dispatched,
+                    'mean': stats.mean_wait,
+                    'max': stats.max_wait,
+                }
+                for tier, stats in self.waits.items()
+            },
+        }
+
+    def poll(self):
+        """Return a dispatchable job, or the seconds until one may be"""
+        delay = None
+        for platform, queue in self.queues.items():
+            if not queue:
+                continue
+            bucket = self.buckets[platform]
+            if bucket.try_take():
+                tier, (queued_at, job) = queue.pop()
+                self.waits[tier].record(self.clock.monotonic() - queued_at)
+                return job, 0.0
+            wait = bucket.wait_time()
+            delay = wait if delay is None else min(delay, wait)
+        return None, delay
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            job, delay = self.poll()
+            if job is not None:
+                return job
+            if delay is None:
+                if self.closed:
+                    raise StopAsyncIteration
+                self._changed.clear()
+                await self._changed.wait()
+            else:
+                await self.clock.sleep(delay)
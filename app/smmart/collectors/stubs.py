@@ -0,0 +1,70 @@
+"""
+Offline connectors returning deterministic synthetic posts
+"""
+import asyncio
+import hashlib
+import random
+
+from smmart.collectors.base import CollectedPost, Connector, ConnectorError
+
+WORDS = (
+    'launch growth brand customer market update team product review '
+    'event hiring news report insight data cloud mobile design support'
+).split()
+
+
+class StubConnector(Connector):
+    """
+    Connector that sleeps for latency seconds and returns
+    posts_per_request posts. The same request always returns the same
+    posts, so repeated fetches collide on (platform, external_id).
+    """
+    platform = 'stub'
+
+    def __init__(self, latency=0.05, posts_per_request=10,
+                 failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.posts_per_request = posts_per_request
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.calls = 0
+
+    async def fetch(self, request):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        key = (
+            f'{self.seed}:{request.platform}:{request.keyword}:'
+            f'{request.since.isoformat()}'
+        )
+        rng = random.Random(key)
+        if rng.random() < self.failure_rate:
+            raise ConnectorError(f'{self.platform} refused {request}')
+
+        span = (request.until - request.since) / self.posts_per_request
+        posts = []
+        for i in range(self.posts_per_request):
+            external_id = hashlib.sha1(f'{key}:{i}'.encode()).hexdigest()
+            words = rng.choices(WORDS, k=12)
+            words.insert(rng.randrange(len(words)), request.keyword)
+            posts.append(CollectedPost(
+                platform=request.platform,
+                external_id=external_id[:20],
+                text=' '.join(words),
+                author=f'{self.platform}-user-{rng.randrange(1000)}',
+                url=f'https://{self.platform}.example.com/p/{external_id}',
+                published_at=request.since + span * i,
+                keyword=request.keyword,
+            ))
+        return posts
+
+
+class LinkedInStubConnector(StubConnector):
+    platform = 'linkedin'
+
+
+class FacebookStubConnector(StubConnector):
+    platform = 'facebook'
+
+
+class InstagramStubConnector(StubConnector):
+    platform = 'instagram'
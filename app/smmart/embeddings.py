@@ -0,0 +1,239 @@
+"""
+Hashed text embeddings of topics and keywords, for similar topics and
+keyword suggestions
+"""
+import hashlib
+import logging
+import shutil
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from core.models import Keyword, Topics
+from smmart.matching import tokenize
+from smmart.vectors import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+# Weight of a word and of each of its character trigrams
+WORD_WEIGHT = 1.0
+TRIGRAM_WEIGHT = 0.5
+
+_features = {}
+
+
+def grams(text):
+    """(gram, weight) of the words of text and of their trigrams"""
+    for word in tokenize(text):
+        yield word, WORD_WEIGHT
+        padded = f'<{word}>'
+        for start in range(len(padded) - 2):
+            yield padded[start:start + 3], TRIGRAM_WEIGHT
+
+
+def _column(gram, dimensions):
+    """(column, sign) of a gram, cached"""
+    key = (gram, dimensions)
+    value = _features.get(key)
+    if value is None:
+        if len(_features) >= 1_000_000:
+            _features.clear()
+        digest = int.from_bytes(
+            hashlib.blake2b(gram.encode(), digest_size=8).digest(), 'little'
+        )
+        value = _features[key] = (
+            digest % dimensions, 1.0 if digest >> 63 else -1.0
+        )
+    return value
+
+
+def embed(texts, dimensions=None):
+    """
+    Unit float32 vectors of texts, zero for texts without words.
+
+    A hashing vectorizer: words and their character trigrams are hashed
+    into dimensions signed columns, so texts sharing words or word parts
+    ("learn", "learning") point the same way and no vocabulary is kept.
+    """
+    dimensions = dimensions or settings.EMBEDDING_DIMENSIONS
+    texts = list(texts)
+    rows, columns, values = [], [], []
+    for row, text in enumerate(texts):
+        for gram, weight in grams(text):
+            column, sign = _column(gram, dimensions)
+            rows.append(row)
+            columns.append(column)
+            values.append(sign * weight)
+    vectors = np.zeros((len(texts), dimensions), dtype=np.float32)
+    np.add.at(vectors, (rows, columns), values)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def topic_text(topic):
+    keywords = (topic.keywords or '').replace(',', ' ')
+    return ' '.join(filter(None, [topic.name, topic.prompt, keywords]))
+
+
+def _root():
+    return Path(settings.VECTOR_INDEX_ROOT)
+
+
+_indexes = {}
+
+
+def _index(*parts):
+    """The process's VectorIndex at VECTOR_INDEX_ROOT/parts"""
+    path = _root().joinpath(*parts)
+    index = _indexes.get(path)
+    if index is None:
+        index = _indexes[path] = VectorIndex(
+            path, settings.EMBEDDING_DIMENSIONS
+        )
+    return index
+
+
+def keyword_index():
+    return _index('keywords')
+
+
+def topic_index(organization_id):
+    """Topics are indexed per organization, the scope of similar topics"""
+    return _index('topics', str(organization_id))
+
+
+def index_keywords(keywords):
+    """Add the Keyword rows missing from the keyword index"""
+    index = keyword_index()
+    missing = [keyword for keyword in keywords if keyword.id not in index]
+    if missing:
+        index.add(
+            [keyword.id for keyword in missing],
+            embed(keyword.name for keyword in missing),
+        )
+
+
+def index_topic(topic):
+    """
+    Add or replace the topic's vector and index its new keywords.
+
+    Called once the topic is committed; a failure is logged rather than
+    raised, the rebuild_vector_index command catches up.
+    """
+    organization_id = topic.user.organization_id if topic.user else None
+    if organization_id is None:
+        return
+    try:
+        topic_index(organization_id).add(
+            [topic.id], embed([topic_text(topic)])
+        )
+        index_keywords(topic.keyword_terms.all())
+    except (OSError, ValueError):
+        logger.exception('Indexing topic %s failed', topic.id)
+
+
+def remove_topic(topic_id, organization_id):
+    try:
+        topic_index(organization_id).remove([topic_id])
+    except (OSError, ValueError):
+        logger.exception('Removing topic %s from the index failed', topic_id)
+
+
+def similar_topics(topic, limit=10):
+    """Topics of the topic's organization closest to it, best first"""
+    organization_id = topic.user.organization_id
+    matches = topic_index(organization_id).search(
+        embed([topic_text(topic)])[0], k=limit, exclude={topic.id},
+        nprobe=settings.EMBEDDING_NPROBE,
+    )
+    names = dict(
+        Topics.objects.filter(
+            id__in=[topic_id for topic_id, _ in matches],
+            user__organization_id=organization_id,
+        ).values_list('id', 'name')
+    )
+    return [
+        {'topic_id': topic_id, 'name': names[topic_id],
+         'score': round(score, 3)}
+        for topic_id, score in matches
+        if topic_id in names and score > 0
+    ]
+
+
+def suggest_keywords(topic, limit=10):
+    """Known keywords closest to the topic that it does not track yet"""
+    tracked = set(topic.keyword_terms.values_list('id', flat=True))
+    matches = keyword_index().search(
+        embed([topic_text(topic)])[0], k=limit, exclude=tracked,
+        nprobe=settings.EMBEDDING_NPROBE,
+    )
+    names = dict(
+        Keyword.objects.filter(
+            id__in=[keyword_id for keyword_id, _ in matches]
+        ).values_list('id', 'name')
+    )
+    return [
+        {'keyword': names[keyword_id], 'score': round(score, 3)}
+        for keyword_id, score in matches
+        if keyword_id in names and score > 0
+    ]
+
+
+def _train(index):
+    count = len(index)
+    if count >= settings.EMBEDDING_IVF_MIN_VECTORS:
+        index.train(lists=min(count, int(4 * np.sqrt(count))))
+
+
+def _build(path, batches):
+    """Write an index of (ids, texts) batches next to path, then swap"""
+    staging = path.with_name(path.name + '.new')
+    shutil.rmtree(staging, ignore_errors=True)
+    index = VectorIndex(staging, settings.EMBEDDING_DIMENSIONS)
+    for ids, texts in batches:
+        index.add(ids, embed(texts))
+    _train(index)
+    retired = path.with_name(path.name + '.old')
+    shutil.rmtree(retired, ignore_errors=True)
+    if path.exists():
+        path.rename(retired)
+    if staging.exists():
+        staging.rename(path)
+    shutil.rmtree(retired, ignore_errors=True)
+    _indexes.pop(path, None)
+    return len(index)
+
+
+def _batches(queryset, text, batch_size):
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id')[
+            :batch_size
+        ])
+        if not batch:
+            return
+        yield [row.id for row in batch], [text(row) for row in batch]
+        last_id = batch[-1].id
+
+
+def rebuild(batch_size=10000):
+    """
+    Rebuild the keyword index and every organization's topic index.
+
+    Each index is written under a new directory and swapped in when
+    complete; processes holding the old one reopen it on their next
+    query. Yields (index name, vectors) as indexes finish.
+    """
+    yield 'keywords', _build(_root() / 'keywords', _batches(
+        Keyword.objects.all(), lambda keyword: keyword.name, batch_size
+    ))
+    organization_ids = Topics.objects.filter(
+        user__organization__isnull=False
+    ).values_list('user__organization_id', flat=True).distinct()
+    for organization_id in sorted(organization_ids):
+        topics = Topics.objects.filter(user__organization_id=organization_id)
+        yield f'topics/{organization_id}', _build(
+            _root() / 'topics' / str(organization_id),
+            _batches(topics, topic_text, batch_size),
+        )
@@ -0,0 +1,136 @@
+"""
+Streaming exports of the posts collected for a topic
+"""
+import asyncio
+import csv
+import io
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+
+from core.models import PostTopic
+
+# (column, PostTopic lookup) of the exported rows
+COLUMNS = [
+    ('post_id', 'post_id'),
+    ('platform', 'post__platform__name'),
+    ('external_id', 'post__external_id'),
+    ('keyword', 'keyword__name'),
+    ('published_at', 'post__published_at'),
+    ('published_on', 'published_on'),
+    ('author', 'post__author'),
+    ('url', 'post__url'),
+    ('sentiment', 'post__sentiment'),
+    ('text', 'post__text'),
+]
+HEADER = [name for name, _ in COLUMNS]
+# Encoded output is handed to the server in pieces of about this size
+BUFFER_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def topic_rows(topic_id, start=None, end=None, chunk_size=None):
+    """
+    The export rows of a topic's posts as tuples, oldest first.
+
+    Rows are read with .iterator(), chunk_size (EXPORT_CHUNK_SIZE) at a
+    time from the cursor, on a server-side cursor where the database
+    has them, so no more than a chunk is in memory.
+    """
+    links = PostTopic.objects.filter(topic_id=topic_id)
+    if start:
+        links = links.filter(published_on__gte=start)
+    if end:
+        links = links.filter(published_on__lte=end)
+    return links.order_by('published_on', 'post_id').values_list(
+        *(lookup for _, lookup in COLUMNS)
+    ).iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+
+
+def _buffered(lines):
+    """Join encoded lines into pieces of about BUFFER_SIZE bytes"""
+    buffer = io.StringIO()
+    for line in lines:
+        buffer.write(line)
+        if buffer.tell() >= BUFFER_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _Line:
+    """File-like target of csv.writer that returns what is written"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(HEADER, row))) + '\n'
+
+
+def gzipped(chunks, level=6):
+    """Compress chunks as one gzip stream, piece by piece"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(rows, file_format, compress=False):
+    """The bytes of rows encoded as file_format ('csv' or 'ndjson')"""
+    lines = csv_lines(rows) if file_format == 'csv' else ndjson_lines(rows)
+    chunks = _buffered(lines)
+    return gzipped(chunks) if compress else chunks
+
+
+def database_safe(chunks):
+    """
+    Iterate chunks wherever the response is consumed.
+
+    Exports are meant to be served by the uwsgi (WSGI) workers, which
+    iterate the response on the request's thread. Django 4.0's ASGI
+    handler iterates a streaming response synchronously on the event
+    loop; it only consumes async iterators from 4.2 on. The ORM refuses
+    to run there, so each chunk is produced on a dedicated thread with
+    its own connection, closed once the export is over. This keeps
+    exports working under ASGI, but the loop still waits for every
+    chunk, so no other request is served meanwhile.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        yield from chunks
+        return
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        while True:
+            chunk = executor.submit(next, chunks, None).result()
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        executor.submit(chunks.close)
+        executor.submit(connections.close_all)
+        executor.shutdown(wait=True)
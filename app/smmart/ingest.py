@@ -0,0 +1,286 @@
+"""
+Bulk storage of collected posts
+"""
+import dataclasses
+import hashlib
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.bulk import MAX_PARAMS, chunked, insert_ignore, insert_values
+from core.models import (
+    Keyword,
+    Platform,
+    Post,
+    PostBand,
+    PostDuplicate,
+    PostTopic,
+    Topics,
+    normalize_term,
+)
+from smmart import neardup, sentiment, trending
+from smmart.rollups import link_deltas, merge_deltas
+
+
+def content_hash(text):
+    """sha256 of the case- and whitespace-normalized text"""
+    return hashlib.sha256(normalize_term(text).encode()).hexdigest()
+
+
+@dataclass
+class IngestStats:
+    received: int = 0
+    stored: int = 0
+    duplicates: int = 0
+    near_duplicates: int = 0
+    links: int = 0
+
+    def as_dict(self):
+        return dataclasses.asdict(self)
+
+
+def _ids_by(platform_id, field, values):
+    """{value: post id} of the posts of a platform with field in values"""
+    ids = {}
+    for chunk in chunked(values, MAX_PARAMS):
+        rows = Post.objects.filter(
+            platform_id=platform_id, **{f'{field}__in': chunk}
+        ).order_by('id').values_list(field, 'id')
+        for value, post_id in rows:
+            ids.setdefault(value, post_id)
+    return ids
+
+
+def _term_ids(model, names):
+    ids = {}
+    for chunk in chunked(names, MAX_PARAMS):
+        ids.update(
+            model.objects.filter(name__in=chunk).values_list('name', 'id')
+        )
+    return ids
+
+
+def _post_id(by_hash, ref):
+    """Id of a stored post or of the new post with content hash ref"""
+    return by_hash.get(ref) if isinstance(ref, str) else ref
+
+
+def _match_near_duplicates(platform_id, new, thresholds):
+    """
+    Compare new posts with the stored ones and with each other.
+
+    Returns ({digest: (signature, band keys)},
+    {digest: (post, similarity)}) where
+    post is the id of a stored post or the digest of an earlier new post
+    at least as similar as the lowest threshold of the post's topics. A
+    post matching within the thresholds of all its topics is dropped from
+    new.
+    """
+    signatures = {}
+    for digest, post in new.items():
+        sig = neardup.signature(post.text)
+        if sig is not None:
+            signatures[digest] = sig, neardup.band_keys(sig, platform_id)
+    index = neardup.stored_index(
+        {key for _, keys in signatures.values() for key in keys}
+    )
+
+    near = {}
+    for digest, post in list(new.items()):
+        if digest not in signatures:
+            continue
+        sig, keys = signatures[digest]
+        ref, similarity = index.best(sig, keys=keys)
+        levels = [
+            thresholds[topic_id] for topic_id in post.topic_ids
+            if topic_id in thresholds
+        ] or [settings.NEAR_DUPLICATE_THRESHOLD]
+        if ref is not None and similarity >= min(levels):
+            near[digest] = ref, similarity
+            if similarity >= max(levels):
+                del new[digest]
+                continue
+        index.add(digest, sig, keys=keys)
+    return signatures, near
+
+
+def store_posts(posts):
+    """
+    Store CollectedPosts and link them to their topics.
+
+    A post is known by (platform, external id); a post whose text was
+    already stored on the same platform, under any id, is a duplicate and
+    only gains topic links. A near duplicate, within the threshold of the
+    topic's organization, is linked in place of the stored post it
+    resembles and is not stored if that holds for all its topics. Posts
+    are stored with their sentiment score, and new links are added to
+    the daily rollups and the trending sketches.
+    Every step is a set-based query or insert, so a batch costs the same
+    few round trips whatever its size. Usable as COLLECTOR_SINK.
+    """
+    stats = IngestStats(received=len(posts))
+    if not posts:
+        return stats
+
+    now = timezone.now()
+    by_platform = {}
+    for post in posts:
+        platform = normalize_term(post.platform)
+        by_platform.setdefault(platform, []).append(post)
+
+    with transaction.atomic():
+        platform_ids = dict(
+            Platform.objects.resolve(by_platform).values_list('name', 'id')
+        )
+        keyword_ids = _term_ids(
+            Keyword, {normalize_term(post.keyword) for post in posts}
+        )
+        thresholds = {}
+        for chunk in chunked(
+                {i for post in posts for i in post.topic_ids}, MAX_PARAMS):
+            rows = Topics.objects.filter(id__in=chunk).values_list(
+                'id', 'user__organization__near_duplicate_threshold'
+            )
+            for topic_id, threshold in rows:
+                thresholds[topic_id] = (
+                    settings.NEAR_DUPLICATE_THRESHOLD
+                    if threshold is None else threshold
+                )
+
+        links = {}
+        known = set()
+        post_of = {}
+        for platform, platform_posts in by_platform.items():
+            platform_id = platform_ids[platform]
+            digests = [content_hash(post.text) for post in platform_posts]
+            unique = {}
+            for digest, post in zip(digests, platform_posts):
+                unique.setdefault(digest, post)
+            scores = dict(zip(unique, sentiment.score_texts(
+                post.text for post in unique.values()
+            ).tolist()))
+
+            external_ids = {post.external_id for post in platform_posts}
+            by_hash = _ids_by(platform_id, 'content_hash', unique)
+            by_external = _ids_by(platform_id, 'external_id', external_ids)
+            aliases = {}
+            for chunk in chunked(external_ids, MAX_PARAMS):
+                aliases.update(PostDuplicate.objects.filter(
+                    platform_id=platform_id, external_id__in=chunk
+                ).values_list('external_id', 'post_id'))
+            known.update(
+                by_hash.values(), by_external.values(), aliases.values()
+            )
+            new = {
+                digest: post for digest, post in unique.items()
+                if digest not in by_hash
+                and post.external_id not in by_external
+                and post.external_id not in aliases
+            }
+            candidates = dict(new)
+            signatures, near = _match_near_duplicates(
+                platform_id, new, thresholds
+            )
+            known.update(
+                ref for ref, _ in near.values() if not isinstance(ref, str)
+            )
+
+            insert_ignore(Post, [
+                Post(
+                    platform_id=platform_id,
+                    external_id=post.external_id,
+                    content_hash=digest,
+                    text=post.text,
+                    author=post.author or '',
+                    url=post.url or '',
+                    published_at=post.published_at,
+                    published_on=(post.published_at or now).date(),
+                    sentiment=scores[digest],
+                    signature=(
+                        neardup.to_bytes(signatures[digest][0])
+                        if digest in signatures else None
+                    ),
+                )
+                for digest, post in new.items()
+            ], ['platform', 'external_id'])
+            stats.stored += len(new)
+            stats.near_duplicates += len(candidates) - len(new)
+
+            by_external.update(_ids_by(platform_id, 'external_id', {
+                post.external_id for post in new.values()
+            }))
+            for digest, post in new.items():
+                if post.external_id in by_external:
+                    by_hash[digest] = by_external[post.external_id]
+            insert_values(PostBand, ['post', 'key'], [
+                (by_hash[digest], key)
+                for digest in new
+                if digest in signatures and digest in by_hash
+                for key in signatures[digest][1]
+            ])
+            insert_ignore(PostDuplicate, [
+                PostDuplicate(
+                    post_id=_post_id(by_hash, ref),
+                    platform_id=platform_id,
+                    external_id=post.external_id,
+                    similarity=similarity,
+                )
+                for digest, post in candidates.items()
+                if digest not in new
+                for ref, similarity in [near[digest]]
+                if _post_id(by_hash, ref) is not None
+            ], ['platform', 'external_id'])
+
+            for digest, post in zip(digests, platform_posts):
+                post_id = by_external.get(post.external_id) or \
+                    aliases.get(post.external_id) or by_hash.get(digest)
+                ref, similarity = near.get(digest, (None, 0.0))
+                keyword_id = keyword_ids.get(normalize_term(post.keyword))
+                published_on = (post.published_at or now).date()
+                for topic_id in post.topic_ids:
+                    if topic_id not in thresholds:
+                        continue
+                    target = post_id
+                    if ref is not None and (
+                            target is None
+                            or similarity >= thresholds[topic_id]):
+                        target = _post_id(by_hash, ref)
+                    if target is None:
+                        continue
+                    post_of.setdefault(
+                        target, (platform_id, post, scores[digest])
+                    )
+                    links.setdefault((target, topic_id), PostTopic(
+                        post_id=target,
+                        topic_id=topic_id,
+                        keyword_id=keyword_id,
+                        published_on=published_on,
+                    ))
+
+        # Only links that did not exist yet count towards the rollups
+        linked = set()
+        for chunk in chunked({key[0] for key in links} & known, MAX_PARAMS):
+            linked.update(PostTopic.objects.filter(
+                post_id__in=chunk
+            ).values_list('post_id', 'topic_id'))
+        new_links = [
+            link for key, link in links.items() if key not in linked
+        ]
+        insert_ignore(PostTopic, new_links, ['post', 'topic'])
+        merge_deltas(link_deltas(
+            (link.topic_id, link.keyword_id, platform_id,
+             link.published_on, score)
+            for link in new_links
+            for platform_id, _, score in [post_of[link.post_id]]
+        ))
+        trending.record(
+            (link.topic_id, post.published_at, post.text)
+            for link in new_links
+            for _, post, _ in [post_of[link.post_id]]
+        )
+        stats.links = len(new_links)
+
+    stats.duplicates = stats.received - stats.stored - stats.near_duplicates
+    return stats
@@ -0,0 +1,61 @@
+"""
+Django command to collect posts for every topic
+"""
+from django.core.management.base import BaseCommand
+
+from smmart.collectors.dedup import deduplicate
+from smmart.collectors.pipeline import (
+    Collector,
+    load_connectors,
+    load_sink,
+    topic_jobs,
+)
+from smmart.collectors.scheduler import Scheduler
+
+
+class Command(BaseCommand):
+    """
+    Fetch the last collection window of every topic keyword on every
+    platform it tracks and hand the posts to COLLECTOR_SINK. Identical
+    keyword/platform pairs of different topics are fetched once, and
+    fetches are paced by COLLECTOR_RATE_LIMITS and shared between package
+    tiers by COLLECTOR_TIER_WEIGHTS.
+    """
+    help = 'Collect posts for the keywords and platforms of all topics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int)
+        parser.add_argument('--timeout', type=float)
+        parser.add_argument(
+            '--platform', action='append', dest='platforms',
+            help='Only collect this platform (repeatable).',
+        )
+
+    def handle(self, *args, **options):
+        connectors = load_connectors()
+        platforms = options['platforms'] or list(connectors)
+        collector = Collector(
+            connectors,
+            sink=load_sink(),
+            concurrency=options['concurrency'],
+            timeout=options['timeout'],
+        )
+        plan = deduplicate(topic_jobs(platforms=set(platforms)))
+        scheduler = Scheduler().extend(plan)
+        scheduler.close()
+        stats = collector.collect(scheduler)
+
+        self.stdout.write(
+            f'{plan.requested} topic requests, {len(plan)} unique fetches '
+            f'(dedup ratio {plan.dedup_ratio:.2f})'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{stats.requests} requests ({stats.failed} failed, '
+            f'{stats.timed_out} timed out), {stats.posts} posts in '
+            f'{stats.elapsed:.2f}s'
+        ))
+        for tier, wait in scheduler.metrics()['wait'].items():
+            self.stdout.write(
+                f'{tier}: {wait["dispatched"]} dispatched, '
+                f'mean wait {wait["mean"]:.2f}s, max {wait["max"]:.2f}s'
+            )
@@ -0,0 +1,70 @@
+"""
+Django command to recompute the topic daily rollups from stored posts
+"""
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from smmart.rollups import rebuild
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}, expected YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    """
+    Replace the rollups of a date range with counts of the post links.
+
+    The range is split into chunks of --chunk-days that are rebuilt by
+    --workers threads in parallel, each chunk in its own transaction.
+    """
+    help = 'Recompute the topic daily rollups of a date range.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start', type=parse_date,
+            help='First day to rebuild (default: --days before --end).',
+        )
+        parser.add_argument(
+            '--end', type=parse_date,
+            help='Last day to rebuild (default: today).',
+        )
+        parser.add_argument(
+            '--days', type=int, default=30,
+            help='Days to rebuild when --start is not given.',
+        )
+        parser.add_argument(
+            '--chunk-days', type=int, default=7,
+            help='Days rebuilt per transaction.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Chunks rebuilt at the same time.',
+        )
+
+    def handle(self, *args, **options):
+        end = options['end'] or timezone.now().date()
+        start = options['start'] or \
+            end - datetime.timedelta(days=options['days'] - 1)
+        if start > end:
+            raise CommandError('--start is after --end')
+
+        started = time.perf_counter()
+        total = 0
+        for chunk_start, chunk_end, rows in rebuild(
+                start, end, chunk_days=options['chunk_days'],
+                workers=options['workers']):
+            total += rows
+            self.stdout.write(
+                f'Rebuilt {chunk_start}..{chunk_end}: {rows} rows'
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {total} rollup rows for {start}..{end} in '
+            f'{time.perf_counter() - started:.2f}s'
+        ))
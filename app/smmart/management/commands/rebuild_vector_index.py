@@ -0,0 +1,35 @@
+"""
+Django command to rebuild the keyword and topic vector indexes
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from smmart.embeddings import rebuild
+
+
+class Command(BaseCommand):
+    """
+    Re-embed every keyword and topic into fresh indexes.
+
+    Topics and keywords are indexed as they are saved; run this after
+    changing EMBEDDING_DIMENSIONS, to catch up after indexing errors, or
+    periodically so that large indexes are clustered again.
+    """
+    help = 'Rebuild the keyword and topic vector indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Rows embedded per batch.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        for name, count in rebuild(options['batch_size']):
+            self.stdout.write(f'Indexed {count} vectors in {name}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the vector indexes in '
+            f'{time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,57 @@
+"""
+Django command to run the prompts of the topics over a day of posts
+"""
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from smmart.prompts.executor import (
+    PromptExecutor,
+    load_backend,
+    topic_prompt_jobs,
+)
+
+
+class Command(BaseCommand):
+    """
+    Run the prompt of every topic over its posts of --day (yesterday by
+    default) on PROMPT_BACKEND. Identical prompts over identical posts
+    run once, and results already in the cache are not run again.
+    """
+    help = 'Run the prompts of active topics over a day of their posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--day', help='YYYY-MM-DD, yesterday if unset.')
+        parser.add_argument('--concurrency', type=int)
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--timeout', type=float)
+
+    def handle(self, *args, **options):
+        if options['day']:
+            try:
+                day = datetime.date.fromisoformat(options['day'])
+            except ValueError as error:
+                raise CommandError(str(error))
+        else:
+            day = timezone.now().date() - datetime.timedelta(days=1)
+
+        executor = PromptExecutor(
+            load_backend(),
+            concurrency=options['concurrency'],
+            batch_size=options['batch_size'],
+            timeout=options['timeout'],
+        )
+        executor.execute(topic_prompt_jobs(day), day=day)
+        stats = executor.stats
+
+        self.stdout.write(
+            f'{stats.jobs} topic prompts, {stats.unique} unique, '
+            f'{stats.cache_hits} cached, {stats.concurrent} left to a '
+            f'concurrent run'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{stats.executed} executed in {stats.batches} batches '
+            f'({stats.failed} failed, {stats.timed_out} timed out), '
+            f'cost {stats.cost:.4f} in {stats.elapsed:.2f}s'
+        ))
@@ -0,0 +1,22 @@
+"""
+Django command to sample the metrics of every topic
+"""
+from django.core.management.base import BaseCommand
+
+from smmart.timeseries import prune, sample_topics
+
+
+class Command(BaseCommand):
+    """
+    Record a sample of each topic's metrics and drop the blocks past
+    their retention. Meant to run every few minutes; hourly and daily
+    aggregates are kept up to date as samples are recorded.
+    """
+    help = 'Sample the metrics of all topics into their time series.'
+
+    def handle(self, *args, **options):
+        samples = sample_topics()
+        deleted = prune()
+        self.stdout.write(self.style.SUCCESS(
+            f'Recorded {samples} samples, pruned {deleted} blocks'
+        ))
@@ -0,0 +1,74 @@
+"""
+Django command to score the sentiment of stored posts
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Post
+from smmart.sentiment import process_pool, score_texts
+
+
+class Command(BaseCommand):
+    """
+    Score the posts stored without a sentiment, or all with --all.
+
+    Posts are read in id order, --batch-size at a time; each batch is
+    scored across --workers processes and written in one transaction.
+    Run rebuild_rollups afterwards for the topic aggregates to include
+    the new scores.
+    """
+    help = 'Score the sentiment of stored posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rescore posts that already have a score.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=20000,
+            help='Posts scored and written per transaction.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Processes scoring each batch.',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.order_by('id')
+        if not options['all']:
+            posts = posts.filter(sentiment__isnull=True)
+
+        started = time.perf_counter()
+        total = 0
+        last_id = 0
+        executor = process_pool(options['workers'])
+        try:
+            while True:
+                batch = list(
+                    posts.filter(id__gt=last_id).only('id', 'text')
+                    [:options['batch_size']]
+                )
+                if not batch:
+                    break
+                scores = score_texts(
+                    [post.text for post in batch], executor
+                ).tolist()
+                for post, score in zip(batch, scores):
+                    post.sentiment = score
+                with transaction.atomic():
+                    Post.objects.bulk_update(
+                        batch, ['sentiment'], batch_size=1000
+                    )
+                total += len(batch)
+                last_id = batch[-1].id
+                self.stdout.write(f'Scored {total} posts')
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Scored {total} posts in '
+            f'{time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,340 @@
+"""
+Routing of collected text to the topics whose keywords it mentions
+"""
+import re
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.bulk import MAX_PARAMS, chunked
+from core.caching import is_shared
+from core.models import Topics
+
+VERSION_KEY = 'matcher:version'
+# Each version records the topics it changed for CHANGES_TIMEOUT
+# seconds, so that workers update those instead of reloading every
+# topic; one more than MAX_CHANGES versions behind reloads
+CHANGES_TIMEOUT = 24 * 60 * 60
+MAX_CHANGES = 1000
+RESET = 'reset'
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lower-case word tokens, the unit keywords are matched on"""
+    return TOKEN_RE.findall(str(text).casefold())
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over keyword phrases.
+
+    Transitions are on word tokens rather than characters, so phrases
+    only match on word boundaries and the trie stays small. search()
+    reads each token of the text once, however many phrases there are.
+    """
+
+    def __init__(self, phrases):
+        goto = [{}]
+        out = [()]
+        for phrase in phrases:
+            tokens = tokenize(phrase)
+            if not tokens:
+                continue
+            node = 0
+            for token in tokens:
+                child = goto[node].get(token)
+                if child is None:
+                    child = len(goto)
+                    goto[node][token] = child
+                    goto.append({})
+                    out.append(())
+                node = child
+            if phrase not in out[node]:
+                out[node] += (phrase,)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and token not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(token, 0)
+                # Fold the suffix outputs in so search() never walks them
+                out[child] += out[fail[child]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def __len__(self):
+        return len(self._goto)
+
+    def search(self, text):
+        """Return the set of phrases found in text"""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        found = set()
+        for token in tokenize(text):
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+
+class TopicMatcher:
+    """
+    Keyword -> topic index with a compiled automaton.
+
+    Topic changes update the index in place; the automaton is recompiled
+    lazily, and only when the set of distinct keywords changed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topic_keywords = {}
+        self._keyword_topics = defaultdict(set)
+        self._automaton = None
+        self.rebuilds = 0
+
+    def __len__(self):
+        return len(self._topic_keywords)
+
+    def set_topic(self, topic_id, keywords):
+        """Add or replace the keywords a topic tracks"""
+        keywords = frozenset(k for k in keywords if tokenize(k))
+        with self._lock:
+            old = self._topic_keywords.get(topic_id, frozenset())
+            if old == keywords:
+                return
+            self._unlink(topic_id, old - keywords)
+            for keyword in keywords - old:
+                if not self._keyword_topics[keyword]:
+                    self._automaton = None
+                self._keyword_topics[keyword].add(topic_id)
+            if keywords:
+                self._topic_keywords[topic_id] = keywords
+            else:
+                self._topic_keywords.pop(topic_id, None)
+
+    def remove_topic(self, topic_id):
+        with self._lock:
+            old = self._topic_keywords.pop(topic_id, frozenset())
+            self._unlink(topic_id, old)
+
+    def _unlink(self, topic_id, keywords):
+        for keyword in keywords:
+            topic_ids = self._keyword_topics[keyword]
+            topic_ids.discard(topic_id)
+            if not topic_ids:
+                del self._keyword_topics[keyword]
+                self._automaton = None
+
+    def _compiled(self):
+        with self._lock:
+            if self._automaton is None:
+                self._automaton = KeywordAutomaton(self._keyword_topics)
+                self.rebuilds += 1
+            return self._automaton
+
+    def match_keywords(self, text):
+        """Return {topic_id: {keyword, ...}} for the keywords in text"""
+        found = self._compiled().search(text)
+        matches = defaultdict(set)
+        # The automaton is never changed, but the topic sets are changed
+        # in place by set_topic()
+        with self._lock:
+            for keyword in found:
+                for topic_id in self._keyword_topics.get(keyword, ()):
+                    matches[topic_id].add(keyword)
+        return dict(matches)
+
+    def match(self, text):
+        """Return the ids of the topics whose keywords appear in text"""
+        return set(self.match_keywords(text))
+
+
+def topic_keyword_rows(topic_ids=None):
+    """(topic id, keyword) pairs of the keyword links of active topics"""
+    through = Topics.keyword_terms.through
+    rows = through.objects.filter(topics__status=Topics.ACTIVE)
+    if topic_ids is not None:
+        rows = rows.filter(topics_id__in=topic_ids)
+    return rows.values_list('topics_id', 'keyword__name').iterator()
+
+
+def load_matcher():
+    """Build a TopicMatcher from the active topics in the database"""
+    keywords = defaultdict(set)
+    for topic_id, keyword in topic_keyword_rows():
+        keywords[topic_id].add(keyword)
+    topic_matcher = TopicMatcher()
+    for topic_id, topic_keywords in keywords.items():
+        topic_matcher.set_topic(topic_id, topic_keywords)
+    return topic_matcher
+
+
+def publish(changes):
+    """
+    Bump the shared version, recording changes (topic ids, or RESET) as
+    what it changed; return the new version
+    """
+    for _ in range(3):
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, timeout=None)
+            version = 1
+        # Backends whose incr is not atomic may hand the same version to
+        # two writers; the second one takes the next version
+        if cache.add(changes_key(version), changes, CHANGES_TIMEOUT):
+            return version
+    # Whatever the version recorded, workers reading it must reload
+    cache.set(changes_key(version), RESET, CHANGES_TIMEOUT)
+    return version
+
+
+def changes_key(version):
+    return f'matcher:changes:{version}'
+
+
+class SharedMatcher:
+    """
+    The TopicMatcher of this process.
+
+    Topic changes are applied once their transaction commits, merged
+    into one update per transaction: the topics' rows are read again
+    and set on the matcher, and the shared version is bumped with their
+    ids. Other workers check the version at most every
+    CATALOG_VERSION_CHECK_INTERVAL seconds and apply the topics changed
+    since theirs the same way; a worker more than MAX_CHANGES versions
+    behind, or missing one of them, reloads every topic. With a
+    process-local cache the version of the other workers is not seen,
+    so the matcher is reloaded on every check instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matcher = None
+        self._version = None
+        self._checked_at = 0.0
+        self._pending = threading.local()
+
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            interval = settings.CATALOG_VERSION_CHECK_INTERVAL
+            if self._matcher is not None and \
+                    now - self._checked_at < interval:
+                return self._matcher
+            self._checked_at = now
+            version = cache.get(VERSION_KEY, 0)
+            if self._matcher is not None and is_shared() and \
+                    version != self._version:
+                changed = self._changes(self._version, version)
+                if changed is not None:
+                    self._apply(changed)
+                    self._version = version
+            if self._matcher is None or not is_shared() or \
+                    version != self._version:
+                self._matcher = load_matcher()
+                self._version = version
+            return self._matcher
+
+    @staticmethod
+    def _changes(old, new):
+        """Ids of the topics changed after version old up to new, or None"""
+        if old is None or not 0 < new - old <= MAX_CHANGES:
+            return None
+        keys = [changes_key(version) for version in range(old + 1, new + 1)]
+        found = cache.get_many(keys)
+        if len(found) != len(keys) or RESET in found.values():
+            return None
+        return {topic_id for ids in found.values() for topic_id in ids}
+
+    def _apply(self, topic_ids):
+        """Read the keywords of topic_ids again; call with the lock"""
+        keywords = {topic_id: set() for topic_id in topic_ids}
+        for chunk in chunked(topic_ids, MAX_PARAMS):
+            for topic_id, keyword in topic_keyword_rows(chunk):
+                keywords[topic_id].add(keyword)
+        for topic_id, topic_keywords in keywords.items():
+            self._matcher.set_topic(topic_id, topic_keywords)
+
+    def reset(self):
+        """Drop the matcher of every process"""
+        publish(RESET)
+        with self._lock:
+            self._matcher = None
+
+    def topics_changed(self, topic_ids=None):
+        """
+        Apply a change of topic_ids, or of any topic when None, once the
+        transaction commits
+        """
+        pending = self._pending
+        if not getattr(pending, 'scheduled', False):
+            pending.topic_ids, pending.reset = set(), False
+            pending.scheduled = True
+        if topic_ids is None:
+            pending.reset = True
+        else:
+            pending.topic_ids.update(topic_ids)
+        # Each change registers a callback, as a rolled back transaction
+        # drops them all; the first one run applies every change
+        transaction.on_commit(self._committed)
+
+    def _committed(self):
+        pending = self._pending
+        if not getattr(pending, 'scheduled', False):
+            return
+        pending.scheduled = False
+        if pending.reset:
+            self.reset()
+            return
+        topic_ids = pending.topic_ids
+        version = publish(sorted(topic_ids))
+        with self._lock:
+            if self._matcher is None:
+                return
+            self._apply(topic_ids)
+            if self._version == version - 1:
+                self._version = version
+
+
+matcher = SharedMatcher()
+
+
+@receiver(m2m_changed, sender=Topics.keyword_terms.through)
+def keywords_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # Changed from the Keyword side; pk_set holds topic ids
+        matcher.topics_changed(pk_set or None)
+    else:
+        matcher.topics_changed([instance.pk])
+
+
+@receiver(post_save, sender=Topics)
+def topic_saved(sender, instance, created, **kwargs):
+    # New topics get their keywords through keywords_changed; others may
+    # have been activated or deactivated
+    if not created:
+        matcher.topics_changed([instance.pk])
+
+
+@receiver(post_delete, sender=Topics)
+def topic_deleted(sender, instance, **kwargs):
+    matcher.topics_changed([instance.pk])
@@ -0,0 +1,159 @@
+"""
+Near-duplicate detection of post text with MinHash and LSH
+"""
+import hashlib
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+
+from core.bulk import MAX_PARAMS, chunked
+from core.models import PostBand
+from smmart.matching import tokenize
+
+SEED = 20240101
+
+
+def _mix(values):
+    """splitmix64 finalizer, element-wise on a uint64 array"""
+    values = values + np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * \
+        np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * \
+        np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def signature_size():
+    return settings.NEAR_DUPLICATE_BANDS * settings.NEAR_DUPLICATE_ROWS
+
+
+_seeds = {}
+
+
+def _seeds_for(size):
+    if size not in _seeds:
+        rng = np.random.default_rng(SEED)
+        _seeds[size] = rng.integers(
+            0, 2 ** 63, size=size, dtype=np.uint64
+        )[:, None]
+    return _seeds[size]
+
+
+def shingles(text):
+    """crc32 of the word bigrams of text (of its word if it has one)"""
+    tokens = tokenize(text)
+    if len(tokens) > 1:
+        grams = {f'{a} {b}' for a, b in zip(tokens, tokens[1:])}
+    else:
+        grams = set(tokens)
+    return np.fromiter(
+        (zlib.crc32(gram.encode()) for gram in grams),
+        dtype=np.uint64, count=len(grams),
+    )
+
+
+def signature(text):
+    """
+    MinHash signature of text, or None when it has no words.
+
+    Each of the signature_size() slots is the minimum of a different
+    hash over the shingles, so the share of equal slots between two
+    signatures estimates the Jaccard similarity of their shingle sets.
+    """
+    hashed = shingles(text)
+    if not hashed.size:
+        return None
+    size = signature_size()
+    values = _mix(hashed[None, :] ^ _seeds_for(size))
+    return values.min(axis=1).astype(np.uint32)
+
+
+def similarities(candidates, target):
+    """Estimated Jaccard similarity of each candidate row with target"""
+    return (candidates == target).mean(axis=1)
+
+
+def band_keys(sig, namespace=0):
+    """
+    One 63-bit key per band of NEAR_DUPLICATE_ROWS slots.
+
+    Posts sharing any key are candidates; with b bands of r rows a pair
+    of similarity s is a candidate with probability 1 - (1 - s^r)^b.
+    """
+    rows = settings.NEAR_DUPLICATE_ROWS
+    data = sig.astype('<u4', copy=False).tobytes()
+    keys = []
+    for band in range(len(sig) // rows):
+        digest = hashlib.blake2b(
+            data[band * rows * 4:(band + 1) * rows * 4],
+            digest_size=8,
+            person=f'{namespace}:{band}'.encode()[:16],
+        ).digest()
+        keys.append(int.from_bytes(digest, 'little') >> 1)
+    return keys
+
+
+def to_bytes(sig):
+    return sig.astype('<u4', copy=False).tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(bytes(data), dtype='<u4').astype(np.uint32)
+
+
+class LSHIndex:
+    """
+    In-memory LSH index of MinHash signatures.
+
+    Lookups only compare the signatures sharing a band key with the
+    query, so their cost follows the number of near matches rather than
+    the size of the index.
+    """
+
+    def __init__(self):
+        self._buckets = defaultdict(list)
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, ref):
+        return ref in self._signatures
+
+    def add(self, ref, sig, namespace=0, keys=None):
+        self._signatures[ref] = sig
+        for key in keys or band_keys(sig, namespace):
+            self._buckets[key].append(ref)
+
+    def candidates(self, sig, namespace=0, keys=None):
+        refs = {}
+        for key in keys or band_keys(sig, namespace):
+            for ref in self._buckets.get(key, ()):
+                refs[ref] = None
+        return list(refs)
+
+    def best(self, sig, namespace=0, keys=None):
+        """(ref, similarity) of the closest candidate, or (None, 0.0)"""
+        refs = self.candidates(sig, namespace, keys)
+        if not refs:
+            return None, 0.0
+        scores = similarities(
+            np.stack([self._signatures[ref] for ref in refs]), sig
+        )
+        index = int(scores.argmax())
+        return refs[index], float(scores[index])
+
+
+def stored_index(keys):
+    """LSHIndex of the stored posts sharing any of the band keys"""
+    index = LSHIndex()
+    for chunk in chunked(keys, MAX_PARAMS):
+        rows = PostBand.objects.filter(key__in=chunk).values_list(
+            'key', 'post_id', 'post__signature'
+        )
+        for key, post_id, data in rows:
+            if data:
+                index.add(post_id, from_bytes(data), keys=[key])
+    return index
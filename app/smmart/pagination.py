@@ -0,0 +1,28 @@
+"""
+Pagination for the smmart API
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Opaque-cursor keyset pagination on the primary key.
+
+    Pages are fetched with `WHERE id > cursor ORDER BY id` so the cost
+    depends on the page size only, and no COUNT(*) is issued.
+    """
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = 'id'
+
+
+class TopicPagination(KeysetPagination):
+    """Newest topics first, served by the (user, id) index"""
+    ordering = '-id'
+
+
+class UserPagination(KeysetPagination):
+    """Organization users, served by the (organization, id) index"""
+    ordering = 'id'
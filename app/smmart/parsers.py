@@ -0,0 +1,65 @@
+"""
+Incremental parsing of newline-delimited JSON request bodies
+"""
+import json
+
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+CHUNK_SIZE = 64 * 1024
+
+
+class OversizedLine(ValueError):
+    pass
+
+
+def iter_lines(stream, max_bytes):
+    """
+    Yield (line number, bytes) for every non-blank line of stream.
+
+    Lines longer than max_bytes yield an OversizedLine instead and are
+    skipped in chunks, so no more than max_bytes are held at a time.
+    """
+    number = 0
+    while True:
+        line = stream.readline(max_bytes + 1)
+        if not line:
+            return
+        number += 1
+        if len(line) > max_bytes and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(CHUNK_SIZE)
+            yield number, OversizedLine(
+                f'Line is longer than {max_bytes} bytes'
+                )
+            continue
+        if line.strip():
+            yield number, line
+
+
+def iter_records(stream, max_bytes):
+    """Yield (line number, object or ValueError) for every line"""
+    for number, line in iter_lines(stream, max_bytes):
+        if isinstance(line, ValueError):
+            yield number, line
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as exc:
+            yield number, ValueError(f'Invalid JSON: {exc}')
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline-delimited JSON lazily.
+
+    request.data is an iterator of (line number, object) pairs read from
+    the request stream as it is consumed, so the body is never held in
+    memory; a line that is not valid JSON comes as a ValueError.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return iter(())
+        return iter_records(stream, settings.INGEST_MAX_LINE_BYTES)
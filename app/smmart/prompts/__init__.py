@@ -0,0 +1,15 @@
+"""
+Batched, cached execution of topic prompts.
+
+A Backend answers batches of PromptRequests; the PromptExecutor runs
+each distinct prompt and input once, caches the output under their
+digest and charges its cost to the organizations that asked for it.
+"""
+from smmart.prompts.base import (  # noqa
+    Backend,
+    BackendError,
+    Completion,
+    PromptJob,
+    PromptRequest,
+)
+from smmart.prompts.executor import PromptExecutor, PromptStats  # noqa
@@ -0,0 +1,74 @@
+"""
+Types shared by the prompt backends and the executor
+"""
+import hashlib
+from dataclasses import dataclass
+from decimal import Decimal
+
+MILLION = Decimal(1_000_000)
+
+
+class BackendError(Exception):
+    """A backend could not answer a batch of prompts"""
+
+
+@dataclass(frozen=True)
+class PromptRequest:
+    """A prompt to run over an input text"""
+    prompt: str
+    input: str
+
+    def digest(self, model):
+        """
+        sha256 of model, prompt and input: the cache key of the result.
+        The parts are length-prefixed so no two requests share a key.
+        """
+        sha = hashlib.sha256()
+        for part in (model, self.prompt, self.input):
+            data = part.encode()
+            sha.update(len(data).to_bytes(8, 'little'))
+            sha.update(data)
+        return sha.hexdigest()
+
+
+@dataclass(frozen=True)
+class PromptJob:
+    """A prompt request of a topic, charged to its organization"""
+    request: PromptRequest
+    topic_id: int = None
+    organization_id: int = None
+
+
+@dataclass(frozen=True)
+class Completion:
+    """A backend's answer to one PromptRequest"""
+    text: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+class Backend:
+    """
+    Base class of the model backends.
+
+    Subclasses set model, the name results are cached under, and
+    implement complete(), which answers up to max_batch_size requests in
+    one call. Prices are per million tokens.
+    """
+    model = None
+    max_batch_size = 1
+    input_price = Decimal(0)
+    output_price = Decimal(0)
+
+    async def complete(self, requests):
+        """Return a Completion per PromptRequest, in order"""
+        raise NotImplementedError
+
+    def cost(self, completion):
+        return (
+            completion.input_tokens * self.input_price
+            + completion.output_tokens * self.output_price
+        ) / MILLION
+
+    async def close(self):
+        pass
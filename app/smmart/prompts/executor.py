@@ -0,0 +1,339 @@
+"""
+Execution of prompt jobs with a cache of their results
+"""
+import asyncio
+import dataclasses
+import logging
+import time
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.bulk import MAX_PARAMS, chunked, insert_ignore
+from core.models import (
+    PostTopic,
+    PromptClaim,
+    PromptResult,
+    PromptUsage,
+    TopicPromptRun,
+    Topics,
+)
+from smmart.prompts.base import BackendError, PromptJob, PromptRequest
+
+logger = logging.getLogger(__name__)
+
+USAGE_MEASURES = [
+    'requests', 'cache_hits', 'input_tokens', 'output_tokens', 'cost',
+]
+
+
+def load_backend():
+    return import_string(settings.PROMPT_BACKEND)()
+
+
+def topic_inputs(topic_ids, day, max_posts):
+    """
+    {topic_id: the texts of its latest max_posts posts of day, oldest
+    first} for the topics with posts, in one query
+    """
+    latest = PostTopic.objects.filter(
+        topic_id=OuterRef('topic_id'), published_on=day
+    ).order_by('-post_id').values('post_id')[:max_posts]
+    rows = PostTopic.objects.filter(
+        topic_id__in=topic_ids, published_on=day,
+        post_id__in=Subquery(latest),
+    ).order_by('topic_id', 'post_id').values_list('topic_id', 'post__text')
+    texts = defaultdict(list)
+    for topic_id, text in rows:
+        texts[topic_id].append(text)
+    return {topic_id: '\n'.join(lines) for topic_id, lines in texts.items()}
+
+
+def topic_prompt_jobs(day, topics=None, max_posts=None, page_size=500):
+    """
+    Yield a PromptJob per active topic with a prompt and posts on day.
+    Topics tracking the same keywords get the same input, so their jobs
+    share one execution.
+    """
+    max_posts = max_posts or settings.PROMPT_INPUT_POSTS
+    if topics is None:
+        topics = Topics.objects.filter(status=Topics.ACTIVE)
+    topics = topics.exclude(prompt__isnull=True).exclude(prompt='') \
+        .order_by('id').select_related('user')
+    last_id = 0
+    while True:
+        page = list(topics.filter(id__gt=last_id)[:page_size])
+        if not page:
+            return
+        inputs = topic_inputs([topic.id for topic in page], day, max_posts)
+        for topic in page:
+            text = inputs.get(topic.id)
+            if text:
+                yield PromptJob(
+                    request=PromptRequest(topic.prompt, text),
+                    topic_id=topic.id,
+                    organization_id=(
+                        topic.user.organization_id if topic.user else None
+                    ),
+                )
+        last_id = page[-1].id
+
+
+@dataclass
+class PromptStats:
+    jobs: int = 0
+    unique: int = 0
+    cache_hits: int = 0
+    # Claimed by a concurrent run and not answered when this one ended
+    concurrent: int = 0
+    executed: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    batches: int = 0
+    cost: Decimal = Decimal(0)
+    elapsed: float = 0.0
+
+    def as_dict(self):
+        return dataclasses.asdict(self)
+
+
+@dataclass
+class Usage:
+    """What one execution adds to an organization's PromptUsage"""
+    requests: int = 0
+    cache_hits: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: Decimal = Decimal(0)
+
+
+class PromptExecutor:
+    """
+    Run prompt jobs against a backend, once per distinct request.
+
+    Jobs are keyed by the digest of the backend's model, the prompt and
+    the input. Digests with a stored PromptResult are answered from it.
+    The others are claimed with a PromptClaim row first, so that a
+    concurrent run does not execute them too; the results of digests it
+    claimed are read back once this run's executions are done. Claimed
+    digests are sent to the backend in batches of batch_size, at most
+    concurrency batches at a time, each cancelled after timeout seconds.
+    A failed batch is counted and left out, and runs again next time.
+
+    Every job is charged to its organization's PromptUsage of the day: a
+    cached result costs nothing, and the cost and tokens of an execution
+    are charged to the jobs that asked for it, the cost split evenly
+    whichever tenant they belong to.
+    """
+
+    def __init__(self, backend, concurrency=None, batch_size=None,
+                 timeout=None):
+        self.backend = backend
+        self.concurrency = concurrency or settings.PROMPT_CONCURRENCY
+        self.batch_size = min(
+            batch_size or settings.PROMPT_BATCH_SIZE, backend.max_batch_size
+        )
+        self.timeout = timeout or settings.PROMPT_TIMEOUT
+        self.stats = PromptStats()
+
+    def execute(self, jobs, day=None):
+        """
+        Run jobs and return their PromptResults by digest. Topic jobs are
+        recorded as the topic's TopicPromptRun of day.
+        """
+        started = time.perf_counter()
+        jobs = [
+            (job, job.request.digest(self.backend.model)) for job in jobs
+        ]
+        requests = {}
+        for job, digest in jobs:
+            requests.setdefault(digest, job.request)
+        self.stats.jobs += len(jobs)
+        self.stats.unique += len(requests)
+
+        results = self._cached(requests)
+        cached = set(results)
+        self.stats.cache_hits += len(cached)
+        missing = {
+            digest: request for digest, request in requests.items()
+            if digest not in cached
+        }
+        token = uuid.uuid4().hex
+        try:
+            claimed = self._claim(missing, token)
+            # Stored by a run that released its claim since _cached()
+            stored = self._cached(claimed)
+            completions = asyncio.run(self._complete([
+                (digest, missing[digest]) for digest in claimed
+                if digest not in stored
+            ]))
+            self.stats.executed += len(completions)
+            results.update(self._store(completions))
+        finally:
+            PromptClaim.objects.filter(claimed_by=token).delete()
+        elsewhere = [digest for digest in missing if digest not in claimed]
+        stored.update(self._cached(elsewhere))
+        results.update(stored)
+        cached.update(stored)
+        self.stats.cache_hits += len(stored)
+        self.stats.concurrent += len(set(elsewhere) - set(stored))
+
+        with transaction.atomic():
+            self._charge(jobs, results, cached)
+            if day is not None:
+                self._record_runs(jobs, results, day)
+        self.stats.elapsed += time.perf_counter() - started
+        return results
+
+    def _cached(self, requests):
+        results = {}
+        for chunk in chunked(requests, MAX_PARAMS):
+            results.update(
+                (result.digest, result)
+                for result in PromptResult.objects.filter(digest__in=chunk)
+            )
+        return results
+
+    def _claim(self, digests, token):
+        """Claim digests for this run; return the set it got"""
+        if not digests:
+            return set()
+        now = timezone.now()
+        PromptClaim.objects.filter(claimed_at__lt=now - timezone.timedelta(
+            seconds=settings.PROMPT_CLAIM_TIMEOUT
+        )).delete()
+        insert_ignore(PromptClaim, [
+            PromptClaim(digest=digest, claimed_by=token, claimed_at=now)
+            for digest in digests
+        ], ['digest'])
+        return set(PromptClaim.objects.filter(
+            claimed_by=token
+        ).values_list('digest', flat=True))
+
+    async def _complete(self, missing):
+        """Completions of the missing (digest, request) pairs by digest"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        completions = {}
+
+        async def run(batch):
+            async with semaphore:
+                self.stats.batches += 1
+                try:
+                    answers = await asyncio.wait_for(
+                        self.backend.complete(
+                            [request for _, request in batch]
+                        ),
+                        self.timeout,
+                    )
+                    if len(answers) != len(batch):
+                        raise BackendError(
+                            f'{len(answers)} completions for '
+                            f'{len(batch)} prompts'
+                        )
+                except asyncio.TimeoutError:
+                    self.stats.timed_out += len(batch)
+                    return
+                except BackendError as error:
+                    logger.warning('Prompt batch failed: %s', error)
+                    self.stats.failed += len(batch)
+                    return
+                except Exception:
+                    logger.exception('Prompt batch failed')
+                    self.stats.failed += len(batch)
+                    return
+                completions.update(
+                    (digest, answer)
+                    for (digest, _), answer in zip(batch, answers)
+                )
+
+        try:
+            await asyncio.gather(*(
+                run(batch) for batch in chunked(missing, self.batch_size)
+            ))
+        finally:
+            await self.backend.close()
+        return completions
+
+    def _store(self, completions):
+        """
+        Save the new results. A concurrent run may have stored the same
+        digest first, and its row is the one returned.
+        """
+        objs = []
+        for digest, completion in completions.items():
+            cost = self.backend.cost(completion)
+            self.stats.cost += cost
+            objs.append(PromptResult(
+                digest=digest,
+                model=self.backend.model,
+                output=completion.text,
+                input_tokens=completion.input_tokens,
+                output_tokens=completion.output_tokens,
+                cost=cost,
+            ))
+        insert_ignore(PromptResult, objs, ['digest'])
+        return self._cached(completions)
+
+    def _charge(self, jobs, results, cached):
+        shares = Counter(
+            digest for _, digest in jobs
+            if digest in results and digest not in cached
+        )
+        usage = defaultdict(Usage)
+        for job, digest in jobs:
+            if job.organization_id is None:
+                continue
+            charge = usage[job.organization_id]
+            charge.requests += 1
+            result = results.get(digest)
+            if result is None:
+                continue
+            if digest in cached:
+                charge.cache_hits += 1
+            else:
+                charge.input_tokens += result.input_tokens
+                charge.output_tokens += result.output_tokens
+                charge.cost += result.cost / shares[digest]
+        record_usage(usage, timezone.now().date())
+
+    def _record_runs(self, jobs, results, day):
+        runs = {
+            job.topic_id: results[digest].id for job, digest in jobs
+            if job.topic_id is not None and digest in results
+        }
+        for chunk in chunked(runs, MAX_PARAMS):
+            TopicPromptRun.objects.filter(
+                topic_id__in=chunk, day=day
+            ).delete()
+        TopicPromptRun.objects.bulk_create([
+            TopicPromptRun(topic_id=topic_id, day=day, result_id=result_id)
+            for topic_id, result_id in runs.items()
+        ], batch_size=500)
+
+
+def record_usage(usage, day):
+    """Add {organization_id: Usage} to the PromptUsage rows of day"""
+    if not usage:
+        return
+    insert_ignore(PromptUsage, [
+        PromptUsage(organization_id=organization_id, day=day)
+        for organization_id in usage
+    ], ['organization', 'day'])
+    rows = []
+    for chunk in chunked(usage, MAX_PARAMS):
+        for row in PromptUsage.objects.select_for_update().filter(
+            organization_id__in=chunk, day=day
+        ):
+            charge = usage[row.organization_id]
+            charge.cost = charge.cost.quantize(Decimal('1e-10'))
+            for name in USAGE_MEASURES:
+                setattr(row, name, F(name) + getattr(charge, name))
+            rows.append(row)
+    PromptUsage.objects.bulk_update(rows, USAGE_MEASURES, batch_size=500)
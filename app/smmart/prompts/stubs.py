@@ -0,0 +1,44 @@
+"""
+Offline backend returning deterministic completions
+"""
+import asyncio
+import collections
+from decimal import Decimal
+
+from smmart.matching import tokenize
+from smmart.prompts.base import Backend, Completion
+
+
+class StubBackend(Backend):
+    """
+    Backend that sleeps for latency seconds per batch and answers each
+    request with its most frequent words. Tokens are counted as words,
+    and priced like a small hosted model.
+    """
+    model = 'stub-1'
+    max_batch_size = 32
+    input_price = Decimal('0.50')
+    output_price = Decimal('1.50')
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.calls = 0
+        self.completed = 0
+
+    async def complete(self, requests):
+        self.calls += 1
+        self.completed += len(requests)
+        await asyncio.sleep(self.latency)
+        return [self._answer(request) for request in requests]
+
+    def _answer(self, request):
+        words = tokenize(request.input)
+        top = collections.Counter(words).most_common(5)
+        text = f'{request.prompt}: ' + ', '.join(
+            f'{word} ({count})' for word, count in top
+        )
+        return Completion(
+            text=text,
+            input_tokens=len(tokenize(request.prompt)) + len(words),
+            output_tokens=len(text.split()),
+        )
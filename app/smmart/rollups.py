@@ -0,0 +1,213 @@
+"""
+Per-topic daily mention counts and sentiment, kept up to date by ingestion
+"""
+import dataclasses
+import datetime
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from core.bulk import MAX_PARAMS, chunked, insert_ignore
+from core.models import PostTopic, TopicDailyRollup
+from smmart.sentiment import polarity
+
+FIELDS = ['topic', 'keyword', 'platform', 'day']
+
+
+@dataclass
+class Delta:
+    """What new links add to one rollup row"""
+    mentions: int = 0
+    positive: int = 0
+    negative: int = 0
+    sentiment: float = 0.0
+
+    def add(self, score):
+        """Count a mention with sentiment score (None if not scored)"""
+        self.mentions += 1
+        self.sentiment += score or 0.0
+        sign = polarity(score)
+        self.positive += sign > 0
+        self.negative += sign < 0
+
+
+MEASURES = [field.name for field in dataclasses.fields(Delta)]
+
+
+def link_deltas(links):
+    """
+    Sum new PostTopic links by rollup key.
+
+    links are (topic_id, keyword_id, platform_id, day, sentiment)
+    tuples; links without a keyword cannot be attributed and are not
+    counted.
+    """
+    deltas = defaultdict(Delta)
+    for *key, score in links:
+        if key[1] is not None:
+            deltas[tuple(key)].add(score)
+    return deltas
+
+
+def merge_deltas(deltas):
+    """
+    Add {(topic_id, keyword_id, platform_id, day): Delta} to the
+    rollups.
+
+    SQL Server gets one MERGE per few hundred keys. Elsewhere the missing
+    rows are inserted empty, then every touched row is locked and
+    incremented with a single bulk_update; either way the cost is a few
+    statements per batch, not one per post.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta.mentions}
+    if not deltas:
+        return
+    connection = connections[router.db_for_write(TopicDailyRollup)]
+    with transaction.atomic(using=connection.alias):
+        if connection.vendor == 'microsoft':
+            _merge_statements(connection, deltas)
+        else:
+            _merge_rows(deltas)
+
+
+def _merge_statements(connection, deltas):
+    opts = TopicDailyRollup._meta
+    qn = connection.ops.quote_name
+    keys = [qn(opts.get_field(name).column) for name in FIELDS]
+    measures = [qn(opts.get_field(name).column) for name in MEASURES]
+    columns = keys + measures
+    source = ', '.join(columns)
+    match = ' AND '.join(
+        f'target.{column} = source.{column}' for column in keys
+    )
+    update = ', '.join(
+        f'{column} = target.{column} + source.{column}'
+        for column in measures
+    )
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    with connection.cursor() as cursor:
+        for chunk in chunked(deltas.items(), MAX_PARAMS // len(columns)):
+            params = []
+            for (topic_id, keyword_id, platform_id, day), delta in chunk:
+                params += [
+                    topic_id, keyword_id, platform_id,
+                    connection.ops.adapt_datefield_value(day),
+                    *dataclasses.astuple(delta),
+                ]
+            cursor.execute(
+                f'MERGE {qn(opts.db_table)} WITH (HOLDLOCK) AS target '
+                f'USING (VALUES {", ".join([row] * len(chunk))}) '
+                f'AS source ({source}) ON {match} '
+                f'WHEN MATCHED THEN UPDATE SET {update} '
+                f'WHEN NOT MATCHED THEN INSERT ({source}) VALUES ('
+                + ', '.join(f'source.{column}' for column in columns)
+                + ');',
+                params,
+            )
+
+
+def _merge_rows(deltas):
+    insert_ignore(TopicDailyRollup, [
+        TopicDailyRollup(
+            topic_id=topic_id, keyword_id=keyword_id,
+            platform_id=platform_id, day=day,
+        )
+        for topic_id, keyword_id, platform_id, day in deltas
+    ], ['topic', 'day', 'keyword', 'platform'])
+
+    rows = {}
+    for chunk in chunked(deltas, MAX_PARAMS // 2):
+        candidates = TopicDailyRollup.objects.select_for_update().filter(
+            topic_id__in={key[0] for key in chunk},
+            day__in={key[3] for key in chunk},
+        )
+        for row in candidates:
+            key = (row.topic_id, row.keyword_id, row.platform_id, row.day)
+            if key in deltas:
+                for name in MEASURES:
+                    setattr(row, name, F(name) + getattr(deltas[key], name))
+                rows[row.pk] = row
+    TopicDailyRollup.objects.bulk_update(
+        rows.values(), MEASURES, batch_size=500
+        )
+
+
+def day_ranges(start, end, chunk_days):
+    """Split the days start..end into ranges of at most chunk_days"""
+    step = datetime.timedelta(days=chunk_days)
+    while start <= end:
+        yield start, min(start + step - datetime.timedelta(days=1), end)
+        start += step
+
+
+def rebuild_range(start, end, batch_size=1000):
+    """Recompute the rollups of the days start..end from the post links"""
+    threshold = settings.SENTIMENT_POLARITY
+    counts = PostTopic.objects.filter(
+        published_on__range=(start, end), keyword__isnull=False
+    ).values(
+        'topic_id', 'keyword_id', 'post__platform_id', 'published_on'
+    ).annotate(
+        mentions=Count('id'),
+        positive=Count('id', filter=Q(post__sentiment__gte=threshold)),
+        negative=Count('id', filter=Q(post__sentiment__lte=-threshold)),
+        sentiment=Coalesce(Sum('post__sentiment'), 0.0),
+    ).order_by()
+
+    rows = 0
+    with transaction.atomic():
+        TopicDailyRollup.objects.filter(day__range=(start, end)).delete()
+        batch = []
+        for count in counts.iterator(chunk_size=batch_size):
+            batch.append(TopicDailyRollup(
+                topic_id=count['topic_id'],
+                keyword_id=count['keyword_id'],
+                platform_id=count['post__platform_id'],
+                day=count['published_on'],
+                **{name: count[name] for name in MEASURES},
+            ))
+            if len(batch) >= batch_size:
+                TopicDailyRollup.objects.bulk_create(batch)
+                rows += len(batch)
+                batch = []
+        TopicDailyRollup.objects.bulk_create(batch)
+        rows += len(batch)
+    return rows
+
+
+def _rebuild_in_thread(start, end, batch_size):
+    try:
+        return rebuild_range(start, end, batch_size)
+    finally:
+        connections.close_all()
+
+
+def rebuild(start, end, chunk_days=7, workers=1, batch_size=1000):
+    """
+    Recompute the rollups of start..end in chunks of chunk_days.
+
+    Chunks cover disjoint days, so workers threads can rebuild them at
+    the same time, each in its own transaction and connection. Yields
+    (chunk start, chunk end, rows) as chunks finish.
+    """
+    ranges = list(day_ranges(start, end, chunk_days))
+    if workers <= 1:
+        for chunk_start, chunk_end in ranges:
+            yield chunk_start, chunk_end, rebuild_range(
+                chunk_start, chunk_end, batch_size
+            )
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (chunk_start, chunk_end, executor.submit(
+                _rebuild_in_thread, chunk_start, chunk_end, batch_size
+            ))
+            for chunk_start, chunk_end in ranges
+        ]
+        for chunk_start, chunk_end, future in futures:
+            yield chunk_start, chunk_end, future.result()
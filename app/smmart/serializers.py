@@ -1,14 +1,21 @@
 from rest_framework import serializers, status
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from rest_framework.response import Response
 from core.models import (
+    Keyword,
     Organization,
     Package,
+    Platform,
     UserRole,
     Topics,
     PackageStatus
 )
 from django.contrib.auth import get_user_model
+from smmart import embeddings
+from smmart.timeseries import METRICS, TIERS
+from smmart.collectors import CollectedPost
 
 
 
@@ -22,8 +29,9 @@ class OrganizationSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'description', 'linkedin_profile',
             'facebook_profile', 'instagram_profile',
-            'industry', 'creation_date', 'created_by',
-            'last_update_date', 'last_updated_by', 'last_update_login']
+            'industry', 'near_duplicate_threshold', 'creation_date',
+            'created_by', 'last_update_date', 'last_updated_by',
+            'last_update_login']
 
         read_only_fields = ['id', 'creation_date', 'created_by']
 
@@ -50,6 +58,9 @@ class OrganizationSerializer(serializers.ModelSerializer):
         instance.industry = validated_data.get(
             'industry', instance.industry
             )
+        instance.near_duplicate_threshold = validated_data.get(
+            'near_duplicate_threshold', instance.near_duplicate_threshold
+            )
         instance.created_by = user.id
         instance.last_updated_by = user.id
 
@@ -94,8 +105,16 @@ class TopicSerializer(serializers.Serializer):
     topic_id = serializers.IntegerField(required=False)
     name = serializers.CharField(max_length=255, required=False)
     prompt = serializers.CharField(max_length=255, required=False)
-    keywords = serializers.ListField()
-    platform = serializers.ListField()
+    # Items are stored as Keyword and Platform names, so they are held to
+    # their lengths; padding and blanks are dropped when normalized
+    keywords = serializers.ListField(child=serializers.CharField(
+        max_length=Keyword._meta.get_field('name').max_length,
+        allow_blank=True, trim_whitespace=False,
+    ))
+    platform = serializers.ListField(child=serializers.CharField(
+        max_length=Platform._meta.get_field('name').max_length,
+        allow_blank=True, trim_whitespace=False,
+    ))
     status = serializers.CharField(max_length=1, required=False)
 
     def create(self, validated_data):
@@ -105,20 +124,23 @@ class TopicSerializer(serializers.Serializer):
         prompt = validated_data.pop('prompt', '')
         keywords = validated_data.pop('keywords', [])
         platform = validated_data.pop('platform', [])
-        status = validated_data.pop('status', 't')
+        status = validated_data.pop('status', Topics.ACTIVE)
 
         keyword = ",".join(keywords)
         platforms = ",".join(platform)
 
-        topic = Topics.objects.create(
-            user=user_id,
-            name=name,
-            prompt=prompt,
-            keywords=keyword,
-            platform=platforms,
-            status=status,
-            **validated_data
-        )
+        with transaction.atomic():
+            topic = Topics.objects.create(
+                user=user_id,
+                name=name,
+                prompt=prompt,
+                keywords=keyword,
+                platform=platforms,
+                status=status,
+                **validated_data
+            )
+            topic.set_terms(keywords, platform)
+            transaction.on_commit(lambda: embeddings.index_topic(topic))
 
         return topic
 
@@ -135,14 +157,21 @@ class TopicSerializer(serializers.Serializer):
         """Update and return the topic"""
         instance.name = validated_data.get('name', instance.name)
         instance.prompt = validated_data.get('prompt', instance.prompt)
-        keywords = validated_data.get('keywords', instance.keywords)
-        platform = validated_data.get('platform', instance.platform)
+        keywords = validated_data.get(
+            'keywords', (instance.keywords or '').split(",")
+            )
+        platform = validated_data.get(
+            'platform', (instance.platform or '').split(",")
+            )
         instance.status = validated_data.get('status', instance.status)
 
         instance.keywords = ",".join(keywords)
         instance.platform = ",".join(platform)
 
-        instance.save()
+        with transaction.atomic():
+            instance.save()
+            instance.set_terms(keywords, platform)
+            transaction.on_commit(lambda: embeddings.index_topic(instance))
 
         return instance
 
@@ -174,6 +203,115 @@ class GetDataSerializer(serializers.Serializer):
         return data
 
 
+class IngestPostSerializer(serializers.Serializer):
+    """Serializer for one line of the post ingest stream"""
+    platform = serializers.CharField(max_length=50)
+    external_id = serializers.CharField(max_length=255)
+    text = serializers.CharField(allow_blank=True, trim_whitespace=False)
+    author = serializers.CharField(
+        max_length=255, required=False, allow_blank=True, default=''
+        )
+    url = serializers.URLField(
+        max_length=1000, required=False, allow_blank=True, default=''
+        )
+    published_at = serializers.DateTimeField(required=False, allow_null=True)
+    keyword = serializers.CharField(
+        max_length=255, required=False, allow_blank=True, default=''
+        )
+    topic_ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False
+        )
+
+    def to_post(self):
+        return CollectedPost(
+            topic_ids=tuple(self.validated_data['topic_ids']),
+            **{
+                key: value for key, value in self.validated_data.items()
+                if key != 'topic_ids'
+            },
+        )
+
+
+class RollupQuerySerializer(serializers.Serializer):
+    """Query parameters of the topic rollups API"""
+    GROUPS = ['day', 'keyword', 'platform']
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    keyword = serializers.CharField(required=False)
+    platform = serializers.CharField(required=False)
+    group_by = serializers.MultipleChoiceField(
+        choices=GROUPS, required=False
+        )
+
+    def validate(self, data):
+        end = data.get('end') or timezone.now().date()
+        start = data.get('start') or end - timezone.timedelta(days=29)
+        if start > end:
+            raise serializers.ValidationError("start is after end.")
+        if (end - start).days >= settings.ROLLUP_MAX_DAYS:
+            raise serializers.ValidationError(
+                f"At most {settings.ROLLUP_MAX_DAYS} days can be read."
+                )
+        data['start'] = start
+        data['end'] = end
+        data['group_by'] = [
+            group for group in self.GROUPS
+            if group in (data.get('group_by') or self.GROUPS)
+        ]
+        return data
+
+
+class TrendingQuerySerializer(serializers.Serializer):
+    """Query parameters of the topic trending API"""
+    limit = serializers.IntegerField(
+        min_value=1, max_value=100, required=False, default=20
+        )
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    """Query parameters of the topic export API"""
+    # Not "format", which selects the DRF renderer
+    type = serializers.ChoiceField(
+        choices=['csv', 'ndjson'], required=False, default='csv'
+        )
+    gzip = serializers.BooleanField(required=False, default=False)
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data.get('start') and data.get('end') and \
+                data['start'] > data['end']:
+            raise serializers.ValidationError("start is after end.")
+        return data
+
+
+class MetricQuerySerializer(serializers.Serializer):
+    """Query parameters of the topic metrics API"""
+    metric = serializers.ChoiceField(
+        choices=METRICS, required=False, default='mentions'
+        )
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    tier = serializers.ChoiceField(choices=list(TIERS), required=False)
+
+    def validate(self, data):
+        end = data.get('end') or timezone.now()
+        start = data.get('start') or end - timezone.timedelta(days=1)
+        if start >= end:
+            raise serializers.ValidationError("start is not before end.")
+        data['start'] = start
+        data['end'] = end
+        return data
+
+
+class SimilarQuerySerializer(serializers.Serializer):
+    """Query parameters of the similar topics and suggestions APIs"""
+    limit = serializers.IntegerField(
+        min_value=1, max_value=50, required=False, default=10
+        )
+
+
 class PackageStatusSerializer(serializers.ModelSerializer):
     """Serializer for PackageStatus Object"""
 
@@ -0,0 +1,218 @@
+"""
+Test the asynchronous collection pipeline
+"""
+import asyncio
+from datetime import datetime, timezone
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from core.models import Organization, Topics
+from smmart.collectors import CollectJob, Collector, FetchRequest
+from smmart.collectors.dedup import deduplicate
+from smmart.collectors.pipeline import topic_jobs
+from smmart.collectors.stubs import (
+    FacebookStubConnector,
+    LinkedInStubConnector,
+)
+
+SINCE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+UNTIL = datetime(2024, 1, 1, 1, tzinfo=timezone.utc)
+
+
+def make_job(keyword, platform='linkedin', topic_ids=(1,)):
+    request = FetchRequest(keyword, platform, SINCE, UNTIL)
+    return CollectJob(request=request, topic_ids=topic_ids)
+
+
+def create_topic(keywords, platforms, email='test@example.com'):
+    organization = Organization.objects.create(name=email)
+    user = get_user_model().objects.create(
+        email=email, organization=organization, package=None, role=None,
+    )
+    topic = Topics.objects.create(
+        user=user, name='web', status=Topics.ACTIVE
+    )
+    topic.set_terms(keywords, platforms)
+    return topic
+
+
+class CollectorTests(SimpleTestCase):
+    """Test running jobs against stub connectors"""
+
+    def test_collects_every_job(self):
+        """Test posts of every job reach the sink with their topics"""
+        batches = []
+        connectors = {
+            'linkedin': LinkedInStubConnector(latency=0, posts_per_request=3),
+            'facebook': FacebookStubConnector(latency=0, posts_per_request=3),
+        }
+        jobs = [
+            make_job('django', topic_ids=(1,)),
+            make_job('python', 'facebook', topic_ids=(2, 3)),
+        ]
+
+        stats = Collector(connectors, sink=batches.append).collect(jobs)
+
+        posts = [post for batch in batches for post in batch]
+        self.assertEqual(stats.requests, 2)
+        self.assertEqual(stats.succeeded, 2)
+        self.assertEqual(stats.posts, 6)
+        self.assertEqual(len(posts), 6)
+        self.assertEqual(
+            {(post.keyword, post.topic_ids) for post in posts},
+            {('django', (1,)), ('python', (2, 3))},
+        )
+
+    def test_timeouts_and_unknown_platforms_are_counted(self):
+        """Test slow fetches are cancelled and missing connectors fail"""
+        connectors = {'linkedin': LinkedInStubConnector(latency=1)}
+        jobs = [make_job('django'), make_job('django', 'tiktok')]
+
+        stats = Collector(connectors, timeout=0.01).collect(jobs)
+
+        self.assertEqual(stats.timed_out, 1)
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(stats.posts, 0)
+
+    def test_connector_errors_are_counted(self):
+        """Test a refused request does not stop the run"""
+        connectors = {
+            'linkedin': LinkedInStubConnector(latency=0, failure_rate=1),
+            }
+
+        stats = Collector(connectors).collect([make_job('django')])
+
+        self.assertEqual(stats.failed, 1)
+
+    def test_slow_sink_applies_backpressure(self):
+        """Test a full queue holds fetchers back without losing posts"""
+        received = []
+
+        async def slow_sink(batch):
+            await asyncio.sleep(0.001)
+            received.extend(batch)
+
+        connectors = {
+            'linkedin': LinkedInStubConnector(latency=0, posts_per_request=5),
+            }
+        jobs = [make_job(f'keyword {i}') for i in range(20)]
+
+        stats = Collector(
+            connectors, sink=slow_sink, concurrency=4, queue_size=2,
+            batch_size=3,
+        ).collect(jobs)
+
+        self.assertEqual(len(received), 100)
+        self.assertGreaterEqual(stats.batches, 34)
+
+    def test_failing_sink_stops_the_run(self):
+        """Test a sink error is raised instead of blocking the workers"""
+        def failing_sink(batch):
+            raise RuntimeError('database is down')
+
+        connectors = {
+            'linkedin': LinkedInStubConnector(latency=0, posts_per_request=5),
+            }
+        jobs = [make_job(f'keyword {i}') for i in range(100)]
+        collector = Collector(
+            connectors, sink=failing_sink, concurrency=4, queue_size=20,
+        )
+
+        with self.assertRaisesMessage(RuntimeError, 'database is down'):
+            asyncio.run(asyncio.wait_for(collector.run(jobs), 10))
+        self.assertLess(collector.stats.requests, 100)
+
+
+class FetchPlanTests(SimpleTestCase):
+    """Test identical requests of different topics are merged"""
+
+    def test_identical_requests_are_fetched_once(self):
+        """Test canonical duplicates merge and fan out to every topic"""
+        jobs = [
+            make_job('Django', topic_ids=(1,)),
+            make_job(' django ', 'LinkedIn', topic_ids=(2,)),
+            make_job('django', topic_ids=(3,)),
+            make_job('django', 'facebook', topic_ids=(1,)),
+        ]
+
+        plan = deduplicate(jobs, window_minutes=60)
+
+        self.assertEqual(plan.requested, 4)
+        self.assertEqual(len(plan), 2)
+        self.assertEqual(plan.dedup_ratio, 2.0)
+        self.assertEqual(
+            {(job.request.platform, job.topic_ids) for job in plan},
+            {('linkedin', (1, 2, 3)), ('facebook', (1,))},
+        )
+
+    def test_windows_are_aligned(self):
+        """Test requests inside the same window share one fetch"""
+        inner = CollectJob(FetchRequest(
+            'django', 'linkedin',
+            SINCE.replace(minute=10), UNTIL.replace(minute=0),
+        ), topic_ids=(2,))
+
+        plan = deduplicate([make_job('django'), inner], window_minutes=60)
+
+        self.assertEqual(len(plan), 1)
+        job, = plan
+        self.assertEqual((job.request.since, job.request.until),
+                         (SINCE, UNTIL))
+
+    def test_fan_out_through_collector(self):
+        """Test the posts of a merged fetch reach every topic"""
+        batches = []
+        connector = LinkedInStubConnector(latency=0, posts_per_request=2)
+        plan = deduplicate(
+            [make_job('django', topic_ids=(i,)) for i in range(5)]
+            )
+
+        Collector({'linkedin': connector}, sink=batches.extend).collect(plan)
+
+        self.assertEqual(connector.calls, 1)
+        self.assertEqual(
+            {post.topic_ids for post in batches}, {(0, 1, 2, 3, 4)}
+            )
+
+
+class TopicJobsTests(TestCase):
+    """Test jobs are derived from the topic keywords and platforms"""
+
+    def test_job_per_keyword_and_platform(self):
+        topic = create_topic(['django', 'python'], ['linkedin', 'facebook'])
+
+        jobs = list(topic_jobs(
+            platforms={'linkedin'}, window=(SINCE, UNTIL), page_size=1
+            ))
+
+        self.assertEqual(
+            {(job.request.keyword, job.request.platform) for job in jobs},
+            {('django', 'linkedin'), ('python', 'linkedin')},
+        )
+        self.assertTrue(all(job.topic_ids == (topic.id,) for job in jobs))
+
+    def test_inactive_topics_are_not_collected(self):
+        topic = create_topic(['django'], ['linkedin'])
+        Topics.objects.filter(id=topic.id).update(status='f')
+
+        self.assertEqual(list(topic_jobs(window=(SINCE, UNTIL))), [])
+
+
+class CollectTopicsCommandTests(TransactionTestCase):
+    """Test the collect_topics command"""
+
+    def test_collect_topics(self):
+        create_topic(['django'], ['linkedin', 'instagram'])
+        create_topic(['Django'], ['linkedin'], email='other@example.com')
+        out = StringIO()
+
+        with self.settings(COLLECTOR_CONNECTORS={
+            'linkedin': 'smmart.collectors.stubs.LinkedInStubConnector',
+        }):
+            call_command('collect_topics', stdout=out)
+
+        self.assertIn('2 topic requests, 1 unique fetches', out.getvalue())
+        self.assertIn('1 requests (0 failed', out.getvalue())
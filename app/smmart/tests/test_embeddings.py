@@ -0,0 +1,154 @@
+'''
+Test similar topics and keyword suggestions
+'''
+import tempfile
+from io import StringIO
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Keyword, Organization
+from smmart import embeddings
+
+TOPICS_URL = reverse('smmart:topics-list')
+
+
+def similar_url(topic_id):
+    return reverse('smmart:topics-similar', args=[topic_id])
+
+
+def suggestions_url(topic_id):
+    return reverse('smmart:topics-suggestions', args=[topic_id])
+
+
+class EmbeddingTests(TestCase):
+    '''Test the hashing embedding'''
+
+    def test_shared_words_and_stems_are_close(self):
+        vectors = embeddings.embed([
+            'machine learning', 'learn machine', 'football scores', '',
+        ])
+
+        self.assertAlmostEqual(float(np.linalg.norm(vectors[0])), 1, 5)
+        self.assertGreater(vectors[0] @ vectors[1], 0.5)
+        self.assertGreater(vectors[0] @ vectors[1], vectors[0] @ vectors[2])
+        self.assertEqual(vectors[3].tolist(), [0.0] * len(vectors[3]))
+
+
+class SimilarTopicsAPITests(TestCase):
+    '''Test the topics API suggests from the vector indexes'''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = override_settings(VECTOR_INDEX_ROOT=directory.name)
+        root.enable()
+        self.addCleanup(root.disable)
+        self.addCleanup(embeddings._indexes.clear)
+
+        self.organization = Organization.objects.create(name='inseyab')
+        self.user = get_user_model().objects.create(
+            email='test@example.com',
+            organization=self.organization, package=None, role=None,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create(self, name, keywords):
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(TOPICS_URL, {
+                'name': name, 'prompt': 'Summarize',
+                'keywords': keywords, 'platform': ['linkedin'],
+            }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data
+
+    def test_create_suggests_keywords_and_topics(self):
+        self.create('Machine learning', ['pytorch', 'deep learning'])
+        self.create('Football', ['premier league', 'goals'])
+
+        res = self.create('Learning machines', ['machine learning'])
+
+        self.assertEqual(
+            [topic['name'] for topic in res['similar_topics']][:1],
+            ['Machine learning'],
+        )
+        suggested = [
+            keyword['keyword'] for keyword in res['suggested_keywords']
+        ]
+        self.assertIn('deep learning', suggested)
+        self.assertNotIn('machine learning', suggested)
+
+    def test_similar_and_suggestions(self):
+        learning = self.create(
+            'Machine learning', ['pytorch', 'deep learning']
+        )
+        self.create('Deep learning', ['neural networks'])
+        self.create('Football', ['premier league'])
+
+        similar = self.client.get(
+            similar_url(learning['topic_id']), {'limit': 1}
+        )
+        suggestions = self.client.get(suggestions_url(learning['topic_id']))
+
+        self.assertEqual(similar.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [topic['name'] for topic in similar.data['results']],
+            ['Deep learning'],
+        )
+        self.assertNotIn('pytorch', [
+            keyword['keyword'] for keyword in suggestions.data['results']
+        ])
+
+    def test_other_organizations_are_not_similar(self):
+        learning = self.create('Machine learning', ['pytorch'])
+        other = get_user_model().objects.create(
+            email='other@example.com',
+            organization=Organization.objects.create(name='other'),
+            package=None, role=None,
+        )
+        self.client.force_authenticate(user=other)
+        self.create('Machine learning', ['pytorch'])
+        self.client.force_authenticate(user=self.user)
+
+        res = self.client.get(similar_url(learning['topic_id']))
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_deleted_topics_are_removed(self):
+        learning = self.create('Machine learning', ['pytorch'])
+        deep = self.create('Deep learning', ['pytorch'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse(
+                'smmart:topics-detail', args=[deep['topic_id']]
+            ))
+
+        res = self.client.get(similar_url(learning['topic_id']))
+        self.assertEqual(res.data['results'], [])
+
+    def test_rebuild_command(self):
+        learning = self.create('Machine learning', ['pytorch'])
+        self.create('Deep learning', ['neural networks'])
+        Keyword.objects.create(name='transformers')
+        out = StringIO()
+
+        with override_settings(EMBEDDING_IVF_MIN_VECTORS=2):
+            call_command('rebuild_vector_index', stdout=out)
+
+        self.assertIn('Indexed 3 vectors in keywords', out.getvalue())
+        self.assertIn(
+            f'Indexed 2 vectors in topics/{self.organization.id}',
+            out.getvalue(),
+        )
+        res = self.client.get(similar_url(learning['topic_id']))
+        self.assertEqual(
+            [topic['name'] for topic in res.data['results']],
+            ['Deep learning'],
+        )
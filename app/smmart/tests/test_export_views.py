@@ -0,0 +1,149 @@
+"""
+Test the streaming topic export API
+"""
+import asyncio
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Organization, Topics
+from smmart import exports
+from smmart.collectors import CollectedPost
+from smmart.ingest import store_posts
+
+
+def export_url(topic_id):
+    return reverse('smmart:topics-export', args=[topic_id])
+
+
+def make_post(external_id, text, day, topic_ids):
+    return CollectedPost(
+        platform='linkedin',
+        external_id=external_id,
+        text=text,
+        author='author',
+        published_at=datetime(2024, 1, day, 12, tzinfo=timezone.utc),
+        keyword='django',
+        topic_ids=topic_ids,
+    )
+
+
+def create_topic(email):
+    organization = Organization.objects.create(name=email)
+    user = get_user_model().objects.create(
+        email=email, organization=organization, package=None, role=None,
+    )
+    topic = Topics.objects.create(user=user, name='web')
+    topic.set_terms(['django'], ['linkedin'])
+    return topic
+
+
+class ExportAPITests(TestCase):
+    """Test exporting the posts of a topic"""
+
+    def setUp(self):
+        self.topic = create_topic('test@example.com')
+        store_posts([
+            make_post('2', 'Django 5, "finally"\nout', 2, (self.topic.id,)),
+            make_post('1', 'Django 4 was great', 1, (self.topic.id,)),
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.topic.user)
+
+    def test_csv(self):
+        res = self.client.get(export_url(self.topic.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(
+            res['Content-Disposition'],
+            f'attachment; filename="topic-{self.topic.id}.csv"',
+        )
+        rows = list(csv.DictReader(
+            io.StringIO(b''.join(res.streaming_content).decode())
+        ))
+        self.assertEqual(
+            [row['external_id'] for row in rows], ['1', '2']
+        )
+        self.assertEqual(rows[1]['text'], 'Django 5, "finally"\nout')
+        self.assertEqual(rows[1]['keyword'], 'django')
+        self.assertEqual(rows[1]['published_on'], '2024-01-02')
+
+    def test_ndjson_gzip(self):
+        res = self.client.get(
+            export_url(self.topic.id),
+            {'type': 'ndjson', 'gzip': 'true', 'start': '2024-01-02'},
+        )
+
+        self.assertEqual(res['Content-Type'], 'application/gzip')
+        self.assertIn('.ndjson.gz', res['Content-Disposition'])
+        lines = gzip.decompress(
+            b''.join(res.streaming_content)
+        ).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(record['external_id'], '2')
+        self.assertEqual(record['published_at'], '2024-01-02T12:00:00Z')
+        self.assertEqual(list(record), exports.HEADER)
+
+    def test_large_exports_are_chunked(self):
+        """Test output is sent in pieces, not as one string"""
+        store_posts([
+            make_post(f'p{i}', 'django ' + 'x' * 200 + str(i), 3,
+                      (self.topic.id,))
+            for i in range(1000)
+        ])
+
+        res = self.client.get(export_url(self.topic.id))
+
+        chunks = list(res.streaming_content)
+        self.assertGreater(len(chunks), 2)
+        self.assertTrue(all(
+            len(chunk) < 2 * exports.BUFFER_SIZE for chunk in chunks
+        ))
+
+    def test_invalid_query(self):
+        res = self.client.get(export_url(self.topic.id), {'type': 'xml'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(
+            export_url(self.topic.id),
+            {'start': '2024-01-02', 'end': '2024-01-01'},
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_topics_are_not_exported(self):
+        other = create_topic('other@example.com')
+
+        res = self.client.get(export_url(other.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AsyncExportTests(TransactionTestCase):
+    """Test the export streams when iterated on an event loop"""
+
+    def test_rows_are_read_off_the_event_loop(self):
+        topic = create_topic('test@example.com')
+        store_posts([make_post('1', 'Django', 1, (topic.id,))])
+        client = APIClient()
+        client.force_authenticate(user=topic.user)
+        res = client.get(export_url(topic.id), {'type': 'ndjson'})
+
+        async def consume():
+            # What django.core.handlers.asgi does with the response
+            return b''.join(part for part in res)
+
+        body = asyncio.run(consume())
+
+        self.assertEqual(json.loads(body)['external_id'], '1')
@@ -0,0 +1,90 @@
+"""
+Test bulk storage of collected posts
+"""
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core.models import Organization, Post, PostTopic, Topics
+from smmart.collectors import CollectedPost
+from smmart.ingest import store_posts
+
+PUBLISHED = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def make_post(external_id, text, topic_ids, platform='linkedin',
+              keyword='django'):
+    return CollectedPost(
+        platform=platform,
+        external_id=external_id,
+        text=text,
+        published_at=PUBLISHED,
+        keyword=keyword,
+        topic_ids=topic_ids,
+    )
+
+
+class StorePostsTests(TestCase):
+    """Test posts are stored once and linked to every topic"""
+
+    def setUp(self):
+        organization = Organization.objects.create(name='test')
+        user = get_user_model().objects.create(
+            email='test@example.com', organization=organization,
+            package=None, role=None,
+        )
+        self.first = Topics.objects.create(user=user, name='first')
+        self.second = Topics.objects.create(user=user, name='second')
+        self.first.set_terms(['django'], ['linkedin'])
+
+    def test_posts_are_stored_and_linked(self):
+        stats = store_posts([
+            make_post('1', 'Django 5 is out', (self.first.id,)),
+            make_post('2', 'Python news', (self.first.id, self.second.id)),
+        ])
+
+        self.assertEqual((stats.stored, stats.links), (2, 3))
+        post = Post.objects.get(external_id='2')
+        self.assertEqual(post.platform.name, 'linkedin')
+        self.assertEqual(post.published_on, PUBLISHED.date())
+        self.assertEqual(
+            set(post.topics.values_list('id', flat=True)),
+            {self.first.id, self.second.id},
+        )
+        link = PostTopic.objects.get(post__external_id='1')
+        self.assertEqual(link.keyword.name, 'django')
+
+    def test_duplicates_only_add_links(self):
+        """Test known ids and reposted text do not create rows"""
+        store_posts([make_post('1', 'Django 5 is out', (self.first.id,))])
+
+        stats = store_posts([
+            make_post('1', 'Django 5 is out', (self.second.id,)),
+            make_post('9', '  django 5 IS out', (self.second.id,)),
+            make_post('7', 'Django 5 is out', (self.first.id,), 'facebook'),
+        ])
+
+        self.assertEqual((stats.stored, stats.duplicates), (1, 2))
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(
+            PostTopic.objects.filter(post__external_id='1').count(), 2
+            )
+
+    def test_batch_is_a_few_queries(self):
+        """Test the round trips do not grow with the batch"""
+        posts = [
+            make_post(str(i), f'post {i}', (self.first.id, self.second.id))
+            for i in range(100)
+        ]
+
+        with self.assertNumQueries(21):
+            store_posts(posts)
+
+        self.assertEqual(Post.objects.count(), 100)
+        self.assertEqual(PostTopic.objects.count(), 200)
+
+    def test_unknown_topics_are_skipped(self):
+        stats = store_posts([make_post('1', 'text', (self.first.id, 0))])
+
+        self.assertEqual(stats.links, 1)
@@ -0,0 +1,165 @@
+"""
+Test the NDJSON post ingest API
+"""
+import io
+import json
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Organization, Post, Topics
+from smmart.parsers import iter_lines
+from smmart.views import PostIngestAPIView
+
+INGEST_URL = reverse('smmart:ingest-posts')
+
+
+def ndjson(*records):
+    return '\n'.join(
+        record if isinstance(record, str) else json.dumps(record)
+        for record in records
+    ) + '\n'
+
+
+def post_line(external_id, topic_ids, **params):
+    record = {
+        'platform': 'linkedin',
+        'external_id': external_id,
+        'text': f'post {external_id}',
+        'keyword': 'django',
+        'topic_ids': topic_ids,
+    }
+    record.update(params)
+    return record
+
+
+class PostIngestAPITests(TestCase):
+    """Test authenticated ingest requests"""
+
+    def setUp(self):
+        organization = Organization.objects.create(name='inseyab')
+        self.user = get_user_model().objects.create(
+            email='test@example.com', organization=organization,
+            package=None, role=None,
+        )
+        self.topic = Topics.objects.create(user=self.user, name='web')
+        other = get_user_model().objects.create(
+            email='other@example.com',
+            organization=Organization.objects.create(name='other'),
+            package=None, role=None,
+        )
+        self.foreign_topic = Topics.objects.create(user=other, name='web')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def ingest(self, body):
+        return self.client.post(
+            INGEST_URL, body, content_type='application/x-ndjson'
+            )
+
+    def test_posts_are_stored_in_batches(self):
+        """Test the counts of every batch are summed up"""
+        body = ndjson(*(post_line(str(i), [self.topic.id]) for i in range(5)))
+
+        with self.settings(INGEST_BATCH_SIZE=2):
+            res = self.ingest(body)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'accepted': 5, 'rejected': 0, 'stored': 5, 'duplicates': 0,
+            'near_duplicates': 0, 'batches': 3, 'errors': [],
+        })
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertEqual(self.topic.posts.count(), 5)
+
+    def test_invalid_lines_are_rejected(self):
+        """Test bad lines are reported without failing the others"""
+        body = ndjson(
+            post_line('1', [self.topic.id]),
+            '{not json',
+            post_line('2', [self.topic.id], url='not a url'),
+            post_line('3', [self.foreign_topic.id]),
+            '[1, 2]',
+            '',
+            post_line('4', [self.topic.id]),
+        )
+
+        res = self.ingest(body)
+
+        self.assertEqual((res.data['accepted'], res.data['rejected']), (2, 4))
+        self.assertEqual(
+            [error['line'] for error in res.data['errors']], [2, 3, 4, 5]
+            )
+        self.assertIn('url', res.data['errors'][1]['errors'])
+        self.assertEqual(
+            set(Post.objects.values_list('external_id', flat=True)),
+            {'1', '4'},
+        )
+
+    def test_oversized_lines_are_skipped(self):
+        big = post_line('1', [self.topic.id], text='x' * 500)
+        body = ndjson(big, post_line('2', [self.topic.id]))
+
+        with self.settings(INGEST_MAX_LINE_BYTES=200):
+            res = self.ingest(body)
+
+        self.assertEqual((res.data['accepted'], res.data['rejected']), (1, 1))
+        self.assertIn('longer than 200', res.data['errors'][0]['errors'])
+
+    def test_reported_errors_are_bounded(self):
+        """Test only the first errors across batches are returned"""
+        body = ndjson(*['{not json'] * 7, post_line('1', [self.topic.id]))
+
+        with self.settings(INGEST_BATCH_SIZE=2), \
+                patch.object(PostIngestAPIView, 'max_errors', 3):
+            res = self.ingest(body)
+
+        self.assertEqual((res.data['accepted'], res.data['rejected']), (1, 7))
+        self.assertEqual(res.data['batches'], 4)
+        self.assertEqual(
+            [error['line'] for error in res.data['errors']], [1, 2, 3]
+            )
+
+    def test_json_body_is_unsupported(self):
+        res = self.client.post(
+            INGEST_URL, [post_line('1', [self.topic.id])], format='json'
+            )
+
+        self.assertEqual(
+            res.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+
+    def test_auth_required(self):
+        res = APIClient().post(
+            INGEST_URL, ndjson(post_line('1', [self.topic.id])),
+            content_type='application/x-ndjson',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class IterLinesTests(TestCase):
+
+    def test_reads_a_bounded_amount_per_line(self):
+        """Test a long line is skipped without being read whole"""
+        reads = []
+
+        class Stream(io.BytesIO):
+            def readline(self, size=-1):
+                line = super().readline(size)
+                reads.append(len(line))
+                return line
+
+        stream = Stream(b'a\n' + b'x' * 300_000 + b'\n\nb')
+
+        lines = list(iter_lines(stream, max_bytes=10))
+
+        self.assertEqual(lines[0], (1, b'a\n'))
+        self.assertIsInstance(lines[1][1], ValueError)
+        self.assertEqual(lines[2], (4, b'b'))
+        self.assertLessEqual(max(reads), 64 * 1024)
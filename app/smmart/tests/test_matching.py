@@ -0,0 +1,212 @@
+"""
+Test keyword matching of collected text
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.models import Keyword, Organization, Topics
+from smmart.matching import (
+    VERSION_KEY,
+    KeywordAutomaton,
+    SharedMatcher,
+    TopicMatcher,
+    changes_key,
+    matcher,
+)
+
+
+class KeywordAutomatonTests(SimpleTestCase):
+    """Test the Aho-Corasick automaton"""
+
+    def test_finds_overlapping_phrases(self):
+        """Test phrases sharing tokens and suffixes are all reported"""
+        automaton = KeywordAutomaton(
+            ['django', 'django rest framework', 'rest framework', 'rest']
+            )
+
+        found = automaton.search('I love Django REST Framework!')
+
+        self.assertEqual(
+            found,
+            {'django', 'django rest framework', 'rest framework', 'rest'},
+        )
+
+    def test_matches_on_word_boundaries(self):
+        """Test a keyword inside a longer word does not match"""
+        automaton = KeywordAutomaton(['art', 'smart ai'])
+
+        self.assertEqual(automaton.search('Smartphones and startups'), set())
+        self.assertEqual(automaton.search('#smart AI rocks'), {'smart ai'})
+
+    def test_failure_links_recover_partial_matches(self):
+        """Test a broken phrase does not hide a following match"""
+        automaton = KeywordAutomaton(['new york times', 'york'])
+
+        self.assertEqual(automaton.search('new york city'), {'york'})
+
+
+class TopicMatcherTests(SimpleTestCase):
+    """Test routing text to topic ids"""
+
+    def test_match_returns_topics(self):
+        """Test every topic tracking a found keyword is returned"""
+        topic_matcher = TopicMatcher()
+        topic_matcher.set_topic(1, {'django', 'python'})
+        topic_matcher.set_topic(2, {'python'})
+        topic_matcher.set_topic(3, {'rust'})
+
+        self.assertEqual(topic_matcher.match('Python tips'), {1, 2})
+        self.assertEqual(
+            topic_matcher.match_keywords('django and python'),
+            {1: {'django', 'python'}, 2: {'python'}},
+        )
+
+    def test_rebuild_only_when_keywords_change(self):
+        """Test topics reusing known keywords do not recompile"""
+        topic_matcher = TopicMatcher()
+        topic_matcher.set_topic(1, {'django'})
+        topic_matcher.match('django')
+        topic_matcher.set_topic(2, {'django'})
+        topic_matcher.match('django')
+
+        self.assertEqual(topic_matcher.rebuilds, 1)
+
+        topic_matcher.remove_topic(1)
+        topic_matcher.remove_topic(2)
+
+        self.assertEqual(topic_matcher.match('django'), set())
+        self.assertEqual(topic_matcher.rebuilds, 2)
+
+
+class SharedMatcherTests(TestCase):
+    """Test the process matcher follows topic changes"""
+
+    def setUp(self):
+        cache.clear()
+        matcher.reset()
+        organization = Organization.objects.create(name='inseyab')
+        self.user = get_user_model().objects.create(
+            email='test@example.com', organization=organization,
+            package=None, role=None,
+        )
+
+    def create_topic(self, name, keywords, status=Topics.ACTIVE):
+        with self.captureOnCommitCallbacks(execute=True):
+            topic = Topics.objects.create(
+                user=self.user, name=name, status=status
+            )
+            topic.set_terms(keywords, ['linkedin'])
+        return topic
+
+    def test_topic_changes_are_applied(self):
+        """Test created, changed and deleted topics are routed"""
+        topic = self.create_topic('web', ['Django'])
+
+        self.assertEqual(matcher.get().match('django news'), {topic.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            topic.set_terms(['Flask'], ['linkedin'])
+        self.assertEqual(matcher.get().match('django news'), set())
+        self.assertEqual(matcher.get().match('flask news'), {topic.id})
+
+        topic_id = topic.id
+        with self.captureOnCommitCallbacks(execute=True):
+            topic.delete()
+        self.assertEqual(matcher.get().match('flask news'), set())
+        self.assertNotIn(topic_id, matcher.get().match_keywords('flask'))
+
+    def test_changes_apply_once_committed(self):
+        """Test a transaction bumps once, after commit, and rollbacks not"""
+        topic = self.create_topic('web', ['Django'])
+        matcher.get()
+        version = cache.get(VERSION_KEY)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            topic.name = 'renamed'
+            topic.save()
+            topic.set_terms(['Flask'], ['linkedin'])
+
+        self.assertEqual(cache.get(VERSION_KEY), version)
+        self.assertEqual(matcher.get().match('django'), {topic.id})
+        for callback in callbacks:
+            callback()
+        self.assertEqual(cache.get(VERSION_KEY), version + 1)
+        self.assertEqual(cache.get(changes_key(version + 1)), [topic.id])
+        self.assertEqual(matcher.get().match('flask'), {topic.id})
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            topic.set_terms(['Rust'], ['linkedin'])
+            raise RuntimeError
+        self.assertEqual(matcher.get().match('rust'), set())
+        self.assertEqual(cache.get(VERSION_KEY), version + 1)
+
+    @override_settings(CATALOG_VERSION_CHECK_INTERVAL=0)
+    def test_other_workers_apply_the_changed_topics(self):
+        """Test a worker behind updates the changed topics only"""
+        kept = self.create_topic('kept', ['Django'])
+        changed = self.create_topic('changed', ['Python'])
+        other = SharedMatcher()
+        other.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            changed.set_terms(['Flask'], ['linkedin'])
+        with patch('smmart.matching.load_matcher') as load, \
+                self.assertNumQueries(1):
+            topic_matcher = other.get()
+
+        load.assert_not_called()
+        self.assertEqual(topic_matcher.match('django python flask'),
+                         {kept.id, changed.id})
+        self.assertEqual(topic_matcher.match('python'), set())
+
+    @override_settings(CATALOG_VERSION_CHECK_INTERVAL=0)
+    def test_worker_missing_changes_reloads(self):
+        topic = self.create_topic('web', ['Django'])
+        other = SharedMatcher()
+        other.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            topic.set_terms(['Flask'], ['linkedin'])
+        cache.delete(changes_key(cache.get(VERSION_KEY)))
+
+        self.assertEqual(other.get().match('flask'), {topic.id})
+
+    def test_only_active_topics_are_matched(self):
+        """Test inactive topics are left out and dropped when deactivated"""
+        active = self.create_topic('web', ['Django'])
+        self.create_topic('old', ['Django'], status='f')
+
+        self.assertEqual(matcher.get().match('django news'), {active.id})
+
+        active.status = 'f'
+        with self.captureOnCommitCallbacks(execute=True):
+            active.save()
+        self.assertEqual(matcher.get().match('django news'), set())
+
+        active.status = Topics.ACTIVE
+        with self.captureOnCommitCallbacks(execute=True):
+            active.save()
+        self.assertEqual(matcher.get().match('django news'), {active.id})
+
+    @override_settings(
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }},
+        CATALOG_VERSION_CHECK_INTERVAL=0,
+    )
+    def test_process_local_cache_reloads_every_interval(self):
+        """Test changes another worker made are seen without the version"""
+        matcher.get()
+        topic = Topics.objects.create(
+            user=self.user, name='web', status=Topics.ACTIVE
+        )
+        # Linked directly, as another process would, without the signal
+        Topics.keyword_terms.through.objects.bulk_create([
+            Topics.keyword_terms.through(topics=topic, keyword=keyword)
+            for keyword in Keyword.objects.resolve(['Django'])
+        ])
+
+        self.assertEqual(matcher.get().match('django news'), {topic.id})
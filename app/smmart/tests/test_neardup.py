@@ -0,0 +1,161 @@
+"""
+Test near-duplicate detection of posts
+"""
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from core.models import (
+    Organization,
+    Post,
+    PostBand,
+    PostDuplicate,
+    PostTopic,
+    Topics,
+)
+from smmart import neardup
+from smmart.collectors import CollectedPost
+from smmart.ingest import store_posts
+
+PUBLISHED = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+
+TEXT = (
+    'Django 5.0 released today with database computed default values, '
+    'field groups in forms and simplified templates for form rendering'
+)
+# Same text with one word changed, about 0.8 similar
+EDITED = TEXT.replace('simplified', 'simpler')
+OTHER = 'Python 3.12 brings better error messages and faster comprehensions'
+
+
+def similarity(first, second):
+    return float(neardup.similarities(
+        neardup.signature(first)[None, :], neardup.signature(second)
+    )[0])
+
+
+class SignatureTests(SimpleTestCase):
+    """Test MinHash signatures and the LSH index"""
+
+    def test_similar_texts_have_similar_signatures(self):
+        self.assertEqual(similarity(TEXT, TEXT.upper()), 1.0)
+        self.assertGreater(similarity(TEXT, EDITED), 0.6)
+        self.assertLess(similarity(TEXT, OTHER), 0.2)
+
+    def test_empty_text_has_no_signature(self):
+        self.assertIsNone(neardup.signature(' !? '))
+
+    def test_signature_round_trips(self):
+        sig = neardup.signature(TEXT)
+        self.assertTrue(
+            (neardup.from_bytes(neardup.to_bytes(sig)) == sig).all()
+        )
+
+    def test_index_finds_the_closest_post(self):
+        index = neardup.LSHIndex()
+        index.add('text', neardup.signature(TEXT))
+        index.add('other', neardup.signature(OTHER))
+
+        ref, score = index.best(neardup.signature(EDITED))
+
+        self.assertEqual(ref, 'text')
+        self.assertGreater(score, 0.6)
+
+    def test_index_is_namespaced(self):
+        """Test signatures only match within their platform"""
+        index = neardup.LSHIndex()
+        index.add('text', neardup.signature(TEXT), namespace=1)
+
+        self.assertEqual(
+            index.best(neardup.signature(TEXT), namespace=2), (None, 0.0)
+        )
+
+
+def make_post(external_id, text, topic_ids, platform='linkedin'):
+    return CollectedPost(
+        platform=platform,
+        external_id=external_id,
+        text=text,
+        published_at=PUBLISHED,
+        keyword='django',
+        topic_ids=topic_ids,
+    )
+
+
+class StoreNearDuplicatesTests(TestCase):
+    """Test near duplicates are clustered when posts are stored"""
+
+    def setUp(self):
+        self.strict = Organization.objects.create(
+            name='strict', near_duplicate_threshold=0.95
+        )
+        self.loose = Organization.objects.create(name='loose')
+        self.strict_topic = self.make_topic(self.strict)
+        self.loose_topic = self.make_topic(self.loose)
+
+    def make_topic(self, organization):
+        user = get_user_model().objects.create(
+            email=f'{organization.name}@example.com',
+            organization=organization, package=None, role=None,
+        )
+        return Topics.objects.create(user=user, name=organization.name)
+
+    def test_near_duplicate_is_clustered(self):
+        store_posts([make_post('1', TEXT, (self.loose_topic.id,))])
+
+        stats = store_posts([make_post('2', EDITED, (self.loose_topic.id,))])
+
+        self.assertEqual((stats.stored, stats.near_duplicates), (0, 1))
+        self.assertEqual((stats.duplicates, stats.links), (0, 0))
+        alias = PostDuplicate.objects.get()
+        self.assertEqual(alias.post.external_id, '1')
+        self.assertEqual(alias.external_id, '2')
+        self.assertEqual(PostBand.objects.filter(post=alias.post).count(),
+                         16)
+
+    def test_known_near_duplicate_is_not_matched_again(self):
+        store_posts([make_post('1', TEXT, (self.loose_topic.id,))])
+        store_posts([make_post('2', EDITED, (self.loose_topic.id,))])
+
+        stats = store_posts([make_post('2', EDITED, (self.loose_topic.id,))])
+
+        self.assertEqual((stats.duplicates, stats.near_duplicates), (1, 0))
+        self.assertEqual(PostDuplicate.objects.count(), 1)
+
+    def test_batch_near_duplicates_are_clustered(self):
+        stats = store_posts([
+            make_post('1', TEXT, (self.loose_topic.id,)),
+            make_post('2', EDITED, (self.loose_topic.id,)),
+            make_post('3', OTHER, (self.loose_topic.id,)),
+        ])
+
+        self.assertEqual((stats.stored, stats.near_duplicates), (2, 1))
+        self.assertEqual(stats.links, 2)
+
+    def test_threshold_is_per_organization(self):
+        """Test a stricter organization keeps its own copy of the post"""
+        store_posts([make_post('1', TEXT, (self.loose_topic.id,))])
+
+        stats = store_posts([
+            make_post('2', EDITED, (self.loose_topic.id,
+                                    self.strict_topic.id)),
+        ])
+
+        self.assertEqual((stats.stored, stats.near_duplicates), (1, 0))
+        self.assertEqual(
+            set(PostTopic.objects.values_list(
+                'post__external_id', 'topic_id'
+            )),
+            {('1', self.loose_topic.id), ('2', self.strict_topic.id)},
+        )
+
+    def test_platforms_are_not_compared(self):
+        store_posts([make_post('1', TEXT, (self.loose_topic.id,))])
+
+        stats = store_posts([
+            make_post('1', EDITED, (self.loose_topic.id,), 'facebook'),
+        ])
+
+        self.assertEqual(stats.stored, 1)
+        self.assertEqual(Post.objects.count(), 2)
@@ -0,0 +1,108 @@
+"""
+Test the organization package endpoints
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.catalog import catalog
+from core.models import Organization, Package, PackageStatus, UserRole
+
+ASSIGN_PACKAGE_URL = reverse('smmart:assign-package')
+
+
+class UpdatePackageTests(TestCase):
+    """Test switching the package of an organization"""
+
+    def setUp(self):
+        self.organization = Organization.objects.create(name='inseyab')
+        self.basic = Package.objects.create(name='basic')
+        self.pro = Package.objects.create(name='pro')
+        self.role = UserRole.objects.create(id=1, name='admin')
+        self.admin = self.create_user('admin@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def create_user(self, email):
+        return get_user_model().objects.create_user(
+            email=email,
+            organization=self.organization,
+            package=self.basic,
+            role=self.role,
+        )
+
+    def create_status(self, package):
+        now = timezone.now()
+        return PackageStatus.objects.create(
+            organization=self.organization,
+            package=package,
+            start_date=now,
+            end_date=now + timezone.timedelta(hours=72),
+            status='y',
+        )
+
+    def test_switch_package_updates_every_user(self):
+        """Test switching replaces the active status and user packages"""
+        old_status = self.create_status(self.basic)
+        for i in range(5):
+            self.create_user(f'user{i}@example.com')
+
+        res = self.client.put(ASSIGN_PACKAGE_URL, {'name': 'pro'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        old_status.refresh_from_db()
+        self.assertEqual(old_status.status, 'n')
+        active = PackageStatus.objects.filter(
+            organization=self.organization, status='y'
+            )
+        self.assertEqual(active.count(), 1)
+        self.assertEqual(active.get().package, self.pro)
+        self.assertFalse(
+            get_user_model().objects.filter(
+                organization=self.organization
+            ).exclude(package=self.pro).exists()
+        )
+
+    def test_switch_package_query_count_is_constant(self):
+        """Test the switch does not issue a query per user"""
+        self.create_status(self.basic)
+        for i in range(20):
+            self.create_user(f'user{i}@example.com')
+        catalog.packages()
+
+        with self.assertNumQueries(7):
+            self.client.put(ASSIGN_PACKAGE_URL, {'name': 'pro'})
+
+    def test_renew_same_package_extends_status(self):
+        """Test selecting the current package extends it"""
+        current = self.create_status(self.basic)
+
+        res = self.client.put(ASSIGN_PACKAGE_URL, {'name': 'basic'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        current.refresh_from_db()
+        self.assertEqual(current.status, 'y')
+        self.assertGreater(
+            current.end_date - current.start_date,
+            timezone.timedelta(days=29),
+        )
+        self.assertEqual(PackageStatus.objects.count(), 1)
+
+    def test_switch_without_active_status(self):
+        """Test an organization without an active status gets one"""
+        res = self.client.put(ASSIGN_PACKAGE_URL, {'name': 'pro'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            PackageStatus.objects.get(status='y').package, self.pro
+            )
+
+    def test_unknown_package(self):
+        """Test an unknown package name is rejected"""
+        res = self.client.put(ASSIGN_PACKAGE_URL, {'name': 'gold'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,346 @@
+"""
+Test batched, cached execution of topic prompts
+"""
+import asyncio
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone as django_timezone
+
+from core.models import (
+    Organization,
+    PromptClaim,
+    PromptResult,
+    PromptUsage,
+    TopicPromptRun,
+    Topics,
+)
+from smmart.collectors import CollectedPost
+from smmart.ingest import store_posts
+from smmart.prompts import (
+    BackendError,
+    Completion,
+    PromptExecutor,
+    PromptJob,
+    PromptRequest,
+)
+from smmart.prompts.executor import topic_prompt_jobs
+from smmart.prompts.stubs import StubBackend
+
+DAY = date(2024, 1, 1)
+
+
+def make_job(prompt, text, organization_id=None, topic_id=None):
+    return PromptJob(
+        request=PromptRequest(prompt, text),
+        topic_id=topic_id,
+        organization_id=organization_id,
+    )
+
+
+class PromptRequestTests(SimpleTestCase):
+
+    def test_digest_keys_model_prompt_and_input(self):
+        request = PromptRequest('Summarize', 'django')
+
+        self.assertEqual(
+            request.digest('a'), PromptRequest('Summarize', 'django')
+            .digest('a')
+        )
+        self.assertNotEqual(request.digest('a'), request.digest('b'))
+        self.assertNotEqual(
+            PromptRequest('ab', 'c').digest('a'),
+            PromptRequest('a', 'bc').digest('a'),
+        )
+
+
+class SlowBackend(StubBackend):
+    """Stub that records how many batches run at the same time"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.running = self.peak = 0
+
+    async def complete(self, requests):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            return await super().complete(requests)
+        finally:
+            self.running -= 1
+
+
+class FailingBackend(StubBackend):
+
+    async def complete(self, requests):
+        if any('fail' in request.input for request in requests):
+            raise BackendError('refused')
+        if any('slow' in request.input for request in requests):
+            await asyncio.sleep(1)
+        return await super().complete(requests)
+
+
+class PromptExecutorTests(TestCase):
+    """Test the executor against stub backends"""
+
+    def setUp(self):
+        self.first = Organization.objects.create(name='first')
+        self.second = Organization.objects.create(name='second')
+
+    def test_identical_requests_run_once(self):
+        """Test tenants asking the same thing share one execution"""
+        backend = StubBackend(latency=0)
+        jobs = [
+            make_job('Summarize', 'django django python', self.first.id),
+            make_job('Summarize', 'django django python', self.second.id),
+            make_job('Summarize', 'rust', self.first.id),
+        ]
+
+        results = PromptExecutor(backend).execute(jobs)
+
+        self.assertEqual(backend.completed, 2)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(PromptResult.objects.count(), 2)
+        result = results[jobs[0].request.digest(backend.model)]
+        self.assertEqual(result.output, 'Summarize: django (2), python (1)')
+        self.assertEqual(result.cost, backend.cost(Completion(
+            '', result.input_tokens, result.output_tokens
+        )))
+
+    def test_cached_results_are_not_run_again(self):
+        backend = StubBackend(latency=0)
+        PromptExecutor(backend).execute([make_job('Summarize', 'django')])
+
+        executor = PromptExecutor(backend)
+        executor.execute([
+            make_job('Summarize', 'django'), make_job('Summarize', 'python'),
+        ])
+
+        self.assertEqual(backend.completed, 2)
+        self.assertEqual(executor.stats.cache_hits, 1)
+        self.assertEqual(executor.stats.executed, 1)
+
+    def test_batches_and_concurrency(self):
+        backend = SlowBackend(latency=0.01)
+        jobs = [make_job('Summarize', f'post {i}') for i in range(50)]
+
+        executor = PromptExecutor(
+            backend, concurrency=2, batch_size=100
+        )
+        executor.execute(jobs)
+
+        # Batches are capped by the backend's max_batch_size
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(executor.stats.batches, 2)
+
+        executor = PromptExecutor(backend, concurrency=2, batch_size=3)
+        executor.execute(
+            make_job('Summarize', f'other {i}') for i in range(20)
+        )
+
+        self.assertEqual(executor.stats.batches, 7)
+        self.assertEqual(backend.peak, 2)
+
+    def test_failures_are_counted_and_not_cached(self):
+        backend = FailingBackend(latency=0)
+        executor = PromptExecutor(backend, batch_size=1, timeout=0.1)
+
+        with self.assertLogs('smmart.prompts.executor', 'WARNING'):
+            results = executor.execute([
+                make_job('Summarize', 'fail', self.first.id),
+                make_job('Summarize', 'slow', self.first.id),
+                make_job('Summarize', 'fine', self.first.id),
+            ])
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(
+            (executor.stats.failed, executor.stats.timed_out), (1, 1)
+        )
+        usage = PromptUsage.objects.get()
+        self.assertEqual(usage.requests, 3)
+        self.assertEqual(usage.cost, next(iter(results.values())).cost)
+
+    def test_cost_is_split_between_requesters(self):
+        backend = StubBackend(latency=0)
+        shared = make_job('Summarize', 'django python', self.first.id)
+        PromptExecutor(backend).execute([
+            shared,
+            make_job('Summarize', 'django python', self.second.id),
+            make_job('Summarize', 'rust', self.second.id),
+        ])
+        cost = dict(PromptResult.objects.values_list('output', 'cost'))
+
+        PromptExecutor(backend).execute([shared])
+
+        first = PromptUsage.objects.get(organization=self.first)
+        second = PromptUsage.objects.get(organization=self.second)
+        self.assertEqual((first.requests, first.cache_hits), (2, 1))
+        self.assertEqual((second.requests, second.cache_hits), (2, 0))
+        shared_cost = cost['Summarize: django (1), python (1)']
+        self.assertEqual(first.cost, shared_cost / 2)
+        self.assertEqual(
+            second.cost, shared_cost / 2 + cost['Summarize: rust (1)']
+        )
+        # The cache hit is not billed tokens either
+        self.assertEqual(
+            first.input_tokens,
+            PromptResult.objects.get(cost=shared_cost).input_tokens,
+        )
+
+    def test_digests_claimed_by_a_concurrent_run_are_left_to_it(self):
+        backend = StubBackend(latency=0)
+        busy = make_job('Summarize', 'django', self.first.id)
+        stale = make_job('Summarize', 'python', self.first.id)
+        now = django_timezone.now()
+        PromptClaim.objects.bulk_create([
+            PromptClaim(
+                digest=busy.request.digest(backend.model),
+                claimed_by='other', claimed_at=now,
+            ),
+            PromptClaim(
+                digest=stale.request.digest(backend.model),
+                claimed_by='stopped',
+                claimed_at=now - django_timezone.timedelta(hours=2),
+            ),
+        ])
+
+        executor = PromptExecutor(backend)
+        results = executor.execute([busy, stale])
+
+        self.assertEqual(backend.completed, 1)
+        self.assertEqual(list(results),
+                         [stale.request.digest(backend.model)])
+        self.assertEqual(
+            (executor.stats.executed, executor.stats.concurrent), (1, 1)
+        )
+        # The run's own claims are released
+        self.assertEqual(
+            list(PromptClaim.objects.values_list('claimed_by', flat=True)),
+            ['other'],
+        )
+
+    def test_results_of_a_concurrent_run_are_cache_hits(self):
+        backend = StubBackend(latency=0)
+        job = make_job('Summarize', 'django', self.first.id)
+        digest = job.request.digest(backend.model)
+        PromptClaim.objects.create(
+            digest=digest, claimed_by='other',
+            claimed_at=django_timezone.now(),
+        )
+        executor = PromptExecutor(backend)
+        claim = executor._claim
+
+        def finish_other_run(digests, token):
+            claimed = claim(digests, token)
+            PromptResult.objects.create(
+                digest=digest, model=backend.model, output='done',
+                input_tokens=5, cost=Decimal('1'),
+            )
+            return claimed
+
+        with patch.object(executor, '_claim', finish_other_run):
+            results = executor.execute([job])
+
+        self.assertEqual(results[digest].output, 'done')
+        self.assertEqual(backend.completed, 0)
+        self.assertEqual(
+            (executor.stats.cache_hits, executor.stats.concurrent), (1, 0)
+        )
+        usage = PromptUsage.objects.get()
+        self.assertEqual(
+            (usage.cache_hits, usage.input_tokens, usage.cost),
+            (1, 0, 0),
+        )
+
+
+def make_post(external_id, text, topic_ids):
+    return CollectedPost(
+        platform='linkedin',
+        external_id=external_id,
+        text=text,
+        published_at=datetime(2024, 1, 1, 12, tzinfo=timezone.utc),
+        keyword='django',
+        topic_ids=topic_ids,
+    )
+
+
+class TopicPromptTests(TestCase):
+    """Test running the prompts of topics over their posts"""
+
+    def setUp(self):
+        self.topics = []
+        for name in ['first', 'second']:
+            organization = Organization.objects.create(name=name)
+            user = get_user_model().objects.create(
+                email=f'{name}@example.com', organization=organization,
+                package=None, role=None,
+            )
+            topic = Topics.objects.create(
+                user=user, name='web', prompt='Summarize',
+                status=Topics.ACTIVE,
+            )
+            topic.set_terms(['django'], ['linkedin'])
+            self.topics.append(topic)
+        ids = tuple(topic.id for topic in self.topics)
+        store_posts([
+            make_post('1', 'Django 5 is out', ids),
+            make_post('2', 'Django 5 adds field groups', ids),
+        ])
+
+    def test_topic_jobs(self):
+        Topics.objects.create(name='no prompt')
+
+        # A page of topics, their posts and the empty next page
+        with self.assertNumQueries(3):
+            jobs = list(topic_prompt_jobs(DAY))
+
+        self.assertEqual([job.topic_id for job in jobs], [
+            topic.id for topic in self.topics
+        ])
+        self.assertEqual(jobs[0].request, PromptRequest(
+            'Summarize', 'Django 5 is out\nDjango 5 adds field groups'
+        ))
+        self.assertEqual(list(topic_prompt_jobs(DAY, max_posts=1))[0]
+                         .request.input, 'Django 5 adds field groups')
+        self.assertEqual(list(topic_prompt_jobs(date(2024, 1, 2))), [])
+
+    def test_inactive_topics_are_skipped(self):
+        Topics.objects.filter(id=self.topics[0].id).update(status='f')
+
+        jobs = list(topic_prompt_jobs(DAY))
+
+        self.assertEqual([job.topic_id for job in jobs], [self.topics[1].id])
+
+    @override_settings(
+        PROMPT_BACKEND='smmart.tests.test_prompts.InstantBackend'
+    )
+    def test_command(self):
+        out = StringIO()
+
+        call_command('run_prompts', '--day=2024-01-01', stdout=out)
+        call_command('run_prompts', '--day=2024-01-01', stdout=out)
+
+        self.assertEqual(PromptResult.objects.count(), 1)
+        runs = TopicPromptRun.objects.filter(day=DAY)
+        self.assertEqual(
+            sorted(runs.values_list('topic_id', flat=True)),
+            [topic.id for topic in self.topics],
+        )
+        self.assertEqual(len({run.result_id for run in runs}), 1)
+        self.assertIn('2 topic prompts, 1 unique, 1 cached', out.getvalue())
+        self.assertEqual(
+            sum(PromptUsage.objects.values_list('cost', flat=True)),
+            PromptResult.objects.get().cost,
+        )
+        self.assertGreater(PromptResult.objects.get().cost, Decimal(0))
+
+
+class InstantBackend(StubBackend):
+
+    def __init__(self):
+        super().__init__(latency=0)
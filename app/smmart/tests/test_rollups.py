@@ -0,0 +1,172 @@
+"""
+Test the topic daily rollups
+"""
+import datetime
+from datetime import timezone
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Keyword,
+    Organization,
+    Platform,
+    TopicDailyRollup,
+    Topics,
+)
+from smmart.collectors import CollectedPost
+from smmart.ingest import store_posts
+from smmart.rollups import Delta, merge_deltas
+
+DAY = datetime.date(2024, 1, 1)
+
+
+def rollups_url(topic_id):
+    return reverse('smmart:topics-rollups', args=[topic_id])
+
+
+def make_post(external_id, topic_ids, day=DAY, platform='linkedin',
+              keyword='django'):
+    return CollectedPost(
+        platform=platform,
+        external_id=external_id,
+        text=f'{keyword} post {external_id}',
+        published_at=datetime.datetime.combine(
+            day, datetime.time(12), tzinfo=timezone.utc
+        ),
+        keyword=keyword,
+        topic_ids=topic_ids,
+    )
+
+
+def counts(topic=None):
+    rows = TopicDailyRollup.objects.all()
+    if topic is not None:
+        rows = rows.filter(topic=topic)
+    return {
+        (row.keyword.name, row.platform.name, row.day): row.mentions
+        for row in rows.select_related('keyword', 'platform')
+    }
+
+
+def create_topic(email='test@example.com'):
+    organization = Organization.objects.create(name=email)
+    user = get_user_model().objects.create(
+        email=email, organization=organization, package=None, role=None,
+    )
+    topic = Topics.objects.create(user=user, name='web')
+    topic.set_terms(['django', 'python'], ['linkedin', 'facebook'])
+    return topic
+
+
+class RollupTests(TestCase):
+    """Test rollups follow ingestion"""
+
+    def setUp(self):
+        self.topic = create_topic()
+
+    def test_merge_adds_to_existing_rows(self):
+        keyword = Keyword.objects.get(name='django')
+        platform = Platform.objects.get(name='linkedin')
+        key = (self.topic.id, keyword.id, platform.id, DAY)
+
+        merge_deltas({key: Delta(mentions=3)})
+        merge_deltas({key: Delta(mentions=2)})
+
+        self.assertEqual(counts(), {('django', 'linkedin', DAY): 5})
+
+    def test_ingest_counts_new_links_once(self):
+        """Test replays and reposts do not inflate the counts"""
+        posts = [
+            make_post('1', (self.topic.id,)),
+            make_post('2', (self.topic.id,)),
+            make_post('3', (self.topic.id,), keyword='python'),
+            make_post('4', (self.topic.id,), platform='facebook'),
+            make_post('5', (self.topic.id,), day=DAY.replace(day=2)),
+        ]
+        store_posts(posts)
+        store_posts(posts)
+
+        self.assertEqual(counts(), {
+            ('django', 'linkedin', DAY): 2,
+            ('python', 'linkedin', DAY): 1,
+            ('django', 'facebook', DAY): 1,
+            ('django', 'linkedin', DAY.replace(day=2)): 1,
+        })
+
+    def test_rebuild_matches_incremental_counts(self):
+        store_posts([
+            make_post(str(i), (self.topic.id,), day=DAY.replace(day=1 + i))
+            for i in range(10)
+        ])
+        expected = counts()
+        TopicDailyRollup.objects.update(mentions=99)
+        out = StringIO()
+
+        call_command(
+            'rebuild_rollups', '--start=2024-01-01', '--end=2024-01-31',
+            '--chunk-days=7', '--workers=1', stdout=out,
+        )
+
+        self.assertEqual(counts(), expected)
+        self.assertIn('Rebuilt 2024-01-29..2024-01-31: 0 rows', out.getvalue())
+        self.assertIn('Rebuilt 10 rollup rows', out.getvalue())
+
+
+class RollupAPITests(TestCase):
+    """Test reading the rollups of a topic"""
+
+    def setUp(self):
+        self.topic = create_topic()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.topic.user)
+        store_posts([
+            make_post('1', (self.topic.id,)),
+            make_post('2', (self.topic.id,), keyword='python'),
+            make_post('3', (self.topic.id,), platform='facebook'),
+            make_post('4', (self.topic.id,), day=DAY.replace(day=5)),
+        ])
+
+    def test_rollups_by_day(self):
+        res = self.client.get(rollups_url(self.topic.id), {
+            'start': '2024-01-01', 'end': '2024-01-04', 'group_by': 'day',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [
+            {'day': DAY, 'mentions': 3, 'positive': 0, 'negative': 0,
+             'sentiment': 0.0},
+        ])
+
+    def test_rollups_filtered_and_grouped(self):
+        res = self.client.get(rollups_url(self.topic.id), {
+            'start': '2024-01-01', 'end': '2024-01-31',
+            'platform': 'LinkedIn', 'group_by': ['keyword'],
+        })
+
+        self.assertEqual(res.data['results'], [
+            {'keyword': 'django', 'mentions': 2, 'positive': 0,
+             'negative': 0, 'sentiment': 0.0},
+            {'keyword': 'python', 'mentions': 1, 'positive': 0,
+             'negative': 0, 'sentiment': 0.0},
+        ])
+
+    def test_invalid_range_is_rejected(self):
+        res = self.client.get(rollups_url(self.topic.id), {
+            'start': '2024-02-01', 'end': '2024-01-01',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_topics_are_hidden(self):
+        other = create_topic('other@example.com')
+
+        res = self.client.get(rollups_url(other.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
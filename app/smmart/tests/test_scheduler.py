@@ -0,0 +1,175 @@
+"""
+Test the rate-limited fair scheduler
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from django.test import SimpleTestCase
+
+from smmart.collectors import CollectJob, Collector, FetchRequest
+from smmart.collectors.scheduler import (
+    FakeClock,
+    FairQueue,
+    Scheduler,
+    TokenBucket,
+)
+from smmart.collectors.stubs import (
+    FacebookStubConnector,
+    LinkedInStubConnector,
+)
+
+SINCE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+UNTIL = datetime(2024, 1, 1, 1, tzinfo=timezone.utc)
+WEIGHTS = {'basic': 1, 'pro': 2, 'premium': 4}
+
+
+def make_job(keyword, platform='linkedin', tier='basic', organization_id=1):
+    return CollectJob(
+        request=FetchRequest(keyword, platform, SINCE, UNTIL),
+        topic_ids=(1,),
+        tier=tier,
+        organization_id=organization_id,
+    )
+
+
+def drain(scheduler):
+    """Return (simulated time, job) for every dispatched job"""
+    async def run():
+        dispatched = []
+        async for job in scheduler:
+            dispatched.append((scheduler.clock.now, job))
+        return dispatched
+    scheduler.close()
+    return asyncio.run(run())
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_bucket_refills_at_rate(self):
+        """Test a drained bucket refills over simulated time"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+
+        self.assertTrue(bucket.try_take())
+        self.assertTrue(bucket.try_take())
+        self.assertFalse(bucket.try_take())
+        self.assertAlmostEqual(bucket.wait_time(), 0.5)
+
+        clock.advance(0.5)
+        self.assertTrue(bucket.try_take())
+
+
+class FairQueueTests(SimpleTestCase):
+
+    def test_tiers_share_by_weight(self):
+        """Test premium gets four dispatches per basic one"""
+        queue = FairQueue(WEIGHTS)
+        for i in range(20):
+            queue.push('basic', 1, i)
+            queue.push('premium', 2, i)
+
+        tiers = [queue.pop()[0] for _ in range(10)]
+
+        self.assertEqual(tiers.count('premium'), 8)
+        self.assertEqual(tiers.count('basic'), 2)
+
+    def test_organizations_take_turns(self):
+        """Test one organization cannot starve another of its tier"""
+        queue = FairQueue(WEIGHTS)
+        for i in range(5):
+            queue.push('pro', 'big', f'big-{i}')
+        queue.push('pro', 'small', 'small-0')
+
+        items = [queue.pop()[1] for _ in range(3)]
+
+        self.assertEqual(items, ['big-0', 'small-0', 'big-1'])
+
+    def test_idle_tier_does_not_bank_credit(self):
+        """Test a tier joining late does not monopolize the queue"""
+        queue = FairQueue(WEIGHTS)
+        for i in range(10):
+            queue.push('premium', 1, i)
+        for _ in range(8):
+            queue.pop()
+        for i in range(10):
+            queue.push('basic', 2, i)
+
+        tiers = [queue.pop()[0] for _ in range(3)]
+
+        self.assertIn('premium', tiers)
+
+
+class SchedulerTests(SimpleTestCase):
+
+    def test_dispatch_respects_platform_limit(self):
+        """Test jobs beyond the burst are paced at the platform rate"""
+        scheduler = Scheduler(
+            rate_limits={'linkedin': (5, 10)}, weights=WEIGHTS,
+            clock=FakeClock(),
+        )
+        scheduler.extend(make_job(f'k{i}') for i in range(30))
+
+        dispatched = drain(scheduler)
+
+        self.assertEqual(len(dispatched), 30)
+        self.assertAlmostEqual(dispatched[-1][0], 4.0)
+        for second in range(1, 5):
+            in_window = [t for t, _ in dispatched if second - 1 < t <= second]
+            self.assertLessEqual(len(in_window), 5)
+
+    def test_throttled_platform_does_not_block_others(self):
+        """Test a platform without tokens leaves the others running"""
+        scheduler = Scheduler(
+            rate_limits={'linkedin': (1, 1), 'facebook': (100, 100)},
+            weights=WEIGHTS, clock=FakeClock(),
+        )
+        scheduler.extend(make_job(f'k{i}') for i in range(3))
+        scheduler.extend(make_job(f'k{i}', 'facebook') for i in range(50))
+
+        dispatched = drain(scheduler)
+
+        facebook = [t for t, job in dispatched
+                    if job.request.platform == 'facebook']
+        self.assertEqual(max(facebook), 0)
+        self.assertAlmostEqual(dispatched[-1][0], 2.0)
+
+    def test_metrics_report_depth_and_wait(self):
+        """Test queue depth and per-tier wait times are exposed"""
+        scheduler = Scheduler(
+            rate_limits={'linkedin': (1, 1)}, weights=WEIGHTS,
+            clock=FakeClock(),
+        )
+        scheduler.extend(make_job(f'k{i}', tier='pro') for i in range(3))
+
+        self.assertEqual(scheduler.metrics()['depth']['linkedin']['pro'], 3)
+
+        drain(scheduler)
+        wait = scheduler.metrics()['wait']['pro']
+
+        self.assertEqual(scheduler.metrics()['depth']['linkedin']['pro'], 0)
+        self.assertEqual(wait['dispatched'], 3)
+        self.assertAlmostEqual(wait['max'], 2.0)
+        self.assertAlmostEqual(wait['mean'], 1.0)
+
+    def test_collector_pulls_from_scheduler(self):
+        """Test the collector runs scheduled jobs against stub platforms"""
+        batches = []
+        scheduler = Scheduler(
+            rate_limits={'linkedin': (2, 2), 'facebook': (2, 2)},
+            weights=WEIGHTS, clock=FakeClock(),
+        )
+        scheduler.extend(make_job(f'k{i}') for i in range(6))
+        scheduler.extend(make_job(f'k{i}', 'facebook') for i in range(6))
+        scheduler.close()
+        connectors = {
+            'linkedin': LinkedInStubConnector(latency=0, posts_per_request=1),
+            'facebook': FacebookStubConnector(latency=0, posts_per_request=1),
+        }
+
+        stats = Collector(
+            connectors, sink=batches.extend, concurrency=4
+            ).collect(scheduler)
+
+        self.assertEqual(stats.succeeded, 12)
+        self.assertEqual(len(batches), 12)
+        self.assertAlmostEqual(scheduler.clock.now, 2.0)
@@ -0,0 +1,153 @@
+"""
+Test batch sentiment scoring
+"""
+from datetime import datetime, timezone
+from io import StringIO
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from core.models import Organization, Post, TopicDailyRollup, Topics
+from smmart.collectors import CollectedPost
+from smmart.ingest import store_posts
+from smmart.matching import tokenize
+from smmart.sentiment import (
+    SEPARATOR,
+    SentimentModel,
+    process_pool,
+    score_texts,
+    tokenize_batch,
+)
+
+PUBLISHED = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+
+
+class SentimentModelTests(SimpleTestCase):
+    """Test the hashed-feature sentiment model"""
+
+    def setUp(self):
+        self.model = SentimentModel.from_lexicon(dimensions=2 ** 16)
+
+    def test_scores_follow_the_lexicon(self):
+        positive, negative, neutral = self.model.score([
+            'Django 5 is great, I love it',
+            'The upgrade was a terrible, buggy mess',
+            'Django 5 was released on Monday',
+        ])
+
+        self.assertGreater(positive, 0.5)
+        self.assertLess(negative, -0.5)
+        self.assertEqual(neutral, 0.0)
+        self.assertLess(positive, 1.0)
+
+    def test_negation_flips_the_next_words(self):
+        good, not_good, later = self.model.score([
+            'this is good',
+            "this isn't good",
+            'not that it matters at all, this is good',
+        ])
+
+        self.assertEqual(not_good, -good)
+        self.assertEqual(later, good)
+
+    def test_batch_matches_single_texts(self):
+        texts = ['great', '', 'not bad', 'bad bad bad', '?!']
+
+        batch = self.model.score(texts)
+
+        self.assertEqual(batch.tolist(), [
+            self.model.score([text])[0] for text in texts
+        ])
+        self.assertEqual(batch[1], 0.0)
+
+    def test_tokenize_batch(self):
+        """Test both tokenizers split texts like smmart.matching"""
+        texts = ["Don't PANIC: it's_fine, 42!", 'x\x00y', '', 'a-b']
+        expected = []
+        for text in texts:
+            expected += tokenize(text.replace(SEPARATOR, ' '))
+            expected.append(SEPARATOR)
+
+        ascii_tokens = [token.decode() for token in tokenize_batch(texts)]
+        unicode_tokens = tokenize_batch(texts + ['Café'])
+
+        self.assertEqual(ascii_tokens, expected[:-1])
+        self.assertEqual(unicode_tokens, expected + ['café'])
+        self.assertEqual(
+            self.model.score(['Café is great', 'great']).tolist(),
+            self.model.score(['great', 'great']).tolist(),
+        )
+
+    def test_trained_weights(self):
+        """Test a model scores with any hashed weight vector"""
+        model = SentimentModel(np.ones(8))
+
+        self.assertGreater(model.score(['any words at all'])[0], 0.7)
+
+    def test_process_pool(self):
+        texts = ['great', 'awful', 'fine'] * 5
+
+        with process_pool(2) as executor:
+            scores = score_texts(texts, executor, chunk_size=4)
+
+        self.assertEqual(scores.tolist(), score_texts(texts).tolist())
+
+
+def make_post(external_id, text, topic_ids):
+    return CollectedPost(
+        platform='linkedin',
+        external_id=external_id,
+        text=text,
+        published_at=PUBLISHED,
+        keyword='django',
+        topic_ids=topic_ids,
+    )
+
+
+class StoredSentimentTests(TestCase):
+    """Test scores are stored with posts and summed in the rollups"""
+
+    def setUp(self):
+        organization = Organization.objects.create(name='test')
+        user = get_user_model().objects.create(
+            email='test@example.com', organization=organization,
+            package=None, role=None,
+        )
+        self.topic = Topics.objects.create(user=user, name='web')
+        self.topic.set_terms(['django'], ['linkedin'])
+
+    def test_ingest_scores_posts(self):
+        store_posts([
+            make_post('1', 'Django 5 is excellent', (self.topic.id,)),
+            make_post('2', 'The Django upgrade failed', (self.topic.id,)),
+            make_post('3', 'Django 5 is out', (self.topic.id,)),
+        ])
+
+        scores = dict(Post.objects.values_list('external_id', 'sentiment'))
+        self.assertGreater(scores['1'], 0)
+        self.assertLess(scores['2'], 0)
+        self.assertEqual(scores['3'], 0)
+        rollup = TopicDailyRollup.objects.get()
+        self.assertEqual(
+            (rollup.mentions, rollup.positive, rollup.negative), (3, 1, 1)
+        )
+        self.assertAlmostEqual(rollup.sentiment, scores['1'] + scores['2'])
+
+    def test_command_scores_missing_posts(self):
+        store_posts([
+            make_post('1', 'Django 5 is excellent', (self.topic.id,)),
+            make_post('2', 'Django 5 is out', (self.topic.id,)),
+        ])
+        expected = dict(Post.objects.values_list('external_id', 'sentiment'))
+        Post.objects.filter(external_id='1').update(sentiment=None)
+        out = StringIO()
+
+        call_command('score_sentiment', '--batch-size=1', stdout=out)
+
+        self.assertEqual(
+            dict(Post.objects.values_list('external_id', 'sentiment')),
+            expected,
+        )
+        self.assertIn('Scored 1 posts', out.getvalue())
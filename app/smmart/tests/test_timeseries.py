@@ -0,0 +1,219 @@
+"""
+Test the topic metric time series
+"""
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone as django_timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Keyword,
+    MetricBlock,
+    Organization,
+    Platform,
+    TopicDailyRollup,
+    Topics,
+)
+from smmart import timeseries
+from smmart.timeseries import DAY, HOURLY, RAW, Block, prune, read, record
+
+NOW = datetime(2024, 1, 10, 12, tzinfo=timezone.utc)
+MIDNIGHT = datetime(2024, 1, 10, tzinfo=timezone.utc)
+
+
+def metrics_url(topic_id):
+    return reverse('smmart:topics-metrics', args=[topic_id])
+
+
+class BlockTests(SimpleTestCase):
+    """Test encoding and merging blocks"""
+
+    def test_round_trip(self):
+        start = 1_704_067_200
+        times = start + np.arange(0, DAY, 300, dtype=np.int64)
+        block = Block(RAW, start, times, [np.arange(len(times)) * 0.5])
+
+        data = block.to_bytes()
+        loaded = Block.from_bytes(RAW, start, data)
+
+        self.assertEqual(loaded.times.tolist(), times.tolist())
+        self.assertEqual(
+            loaded.columns[0].tolist(), (np.arange(len(times)) * 0.5).tolist()
+        )
+        # Regular deltas compress to far less than the 8 bytes a sample
+        self.assertLess(len(data), len(times) * 8 / 2)
+
+    def test_merge_replaces_points_at_the_same_time(self):
+        block = Block(RAW, 0)
+        block.merge(np.array([30, 10]), [np.array([3.0, 1.0])])
+
+        block.merge(np.array([20, 10]), [np.array([2.0, 9.0])])
+
+        self.assertEqual(block.times.tolist(), [10, 20, 30])
+        self.assertEqual(block.columns[0].tolist(), [9.0, 2.0, 3.0])
+
+    def test_aggregate(self):
+        times, (count, total, low, high) = timeseries.aggregate(
+            np.array([0, 600, 3600, 7200, 7300]),
+            np.array([1.0, 3.0, 5.0, 2.0, 4.0]),
+            3600,
+        )
+
+        self.assertEqual(times.tolist(), [0, 3600, 7200])
+        self.assertEqual(count.tolist(), [2, 1, 2])
+        self.assertEqual(total.tolist(), [4.0, 5.0, 6.0])
+        self.assertEqual(low.tolist(), [1.0, 5.0, 2.0])
+        self.assertEqual(high.tolist(), [3.0, 5.0, 4.0])
+
+
+class TimeSeriesTests(TestCase):
+    """Test recording and reading series"""
+
+    def setUp(self):
+        organization = Organization.objects.create(name='test')
+        self.user = get_user_model().objects.create(
+            email='test@example.com', organization=organization,
+            package=None, role=None,
+        )
+        self.topic = Topics.objects.create(user=self.user, name='web')
+
+    def samples(self, start, count, step=timedelta(minutes=5),
+                metric='mentions'):
+        return [
+            (self.topic.id, metric, start + step * i, float(i))
+            for i in range(count)
+        ]
+
+    def test_tiers_are_kept_up_to_date(self):
+        """Test a day of samples lands in one block of each tier"""
+        stored = record(self.samples(MIDNIGHT, 288), now=NOW)
+
+        self.assertEqual(stored, 288)
+        self.assertEqual(
+            sorted(MetricBlock.objects.values_list('tier', 'count')),
+            [('1d', 1), ('1h', 24), ('raw', 288)],
+        )
+        raw = read(self.topic.id, 'mentions', MIDNIGHT,
+                   MIDNIGHT + timedelta(hours=1), tier='raw')
+        self.assertEqual(raw.mean.tolist(), list(range(12)))
+        hourly = read(self.topic.id, 'mentions', MIDNIGHT,
+                      MIDNIGHT + timedelta(days=1), tier='1h')
+        self.assertEqual(hourly.count.tolist(), [12] * 24)
+        self.assertEqual(hourly.mean[1], sum(range(12, 24)) / 12)
+        self.assertEqual((hourly.low[1], hourly.high[1]), (12, 23))
+        daily = read(self.topic.id, 'mentions', MIDNIGHT,
+                     MIDNIGHT + timedelta(days=1), tier='1d')
+        self.assertEqual(daily.count.tolist(), [288])
+        self.assertEqual(daily.high.tolist(), [287])
+
+    def test_late_samples_update_the_aggregates(self):
+        record(self.samples(MIDNIGHT, 2), now=NOW)
+
+        record([
+            (self.topic.id, 'mentions', MIDNIGHT, 10.0),
+            (self.topic.id, 'mentions', MIDNIGHT - timedelta(hours=1), 7.0),
+        ], now=NOW)
+
+        daily = read(self.topic.id, 'mentions', MIDNIGHT - timedelta(days=1),
+                     MIDNIGHT + timedelta(days=1), tier='1d')
+        self.assertEqual(daily.count.tolist(), [1, 2])
+        self.assertEqual(daily.total.tolist(), [7.0, 11.0])
+
+    def test_reads_across_blocks(self):
+        start = MIDNIGHT - timedelta(days=3)
+        record(self.samples(start, 4 * 24, step=timedelta(hours=1)), now=NOW)
+
+        series = read(self.topic.id, 'mentions', start + timedelta(hours=30),
+                      start + timedelta(hours=80), tier='raw')
+
+        self.assertEqual(series.times[0], int(
+            (start + timedelta(hours=30)).timestamp()
+        ))
+        self.assertEqual(series.mean.tolist(), list(range(30, 80)))
+
+    def test_pick_tier(self):
+        self.assertEqual(timeseries.pick_tier(
+            NOW - timedelta(hours=6), NOW, NOW
+        ), RAW)
+        self.assertEqual(timeseries.pick_tier(
+            NOW - timedelta(days=7), NOW, NOW
+        ), HOURLY)
+        self.assertEqual(timeseries.pick_tier(
+            NOW - timedelta(days=30), NOW - timedelta(days=29), NOW
+        ), HOURLY)
+        self.assertEqual(timeseries.pick_tier(
+            NOW - timedelta(days=365), NOW, NOW
+        ).name, '1d')
+
+    @override_settings(
+        TIMESERIES_RAW_RETENTION_DAYS=2, TIMESERIES_HOURLY_RETENTION_DAYS=0
+    )
+    def test_retention(self):
+        start = MIDNIGHT - timedelta(days=1)
+        record(self.samples(start, 2, step=timedelta(days=1)), now=NOW)
+        self.assertEqual(
+            record(self.samples(MIDNIGHT - timedelta(days=5), 1), now=NOW), 0
+        )
+
+        prune(NOW + timedelta(days=2))
+
+        self.assertEqual(
+            list(MetricBlock.objects.filter(tier='raw').values_list(
+                'start', flat=True
+            )),
+            [MIDNIGHT],
+        )
+        self.assertEqual(MetricBlock.objects.filter(tier='1h').count(), 1)
+
+    def test_unknown_metric(self):
+        with self.assertRaises(ValueError):
+            record([(self.topic.id, 'reach', NOW, 1.0)], now=NOW)
+
+    def test_sample_command(self):
+        TopicDailyRollup.objects.create(
+            topic=self.topic,
+            keyword=Keyword.objects.create(name='django'),
+            platform=Platform.objects.create(name='linkedin'),
+            day=django_timezone.now().date(),
+            mentions=4, positive=2, negative=1, sentiment=1.0,
+        )
+        out = StringIO()
+
+        call_command('sample_topic_metrics', stdout=out)
+
+        self.assertIn('Recorded 4 samples', out.getvalue())
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        res = client.get(metrics_url(self.topic.id), {'metric': 'sentiment'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tier'], 'raw')
+        self.assertEqual(
+            [(row['count'], row['mean']) for row in res.data['results']],
+            [(1, 0.25)],
+        )
+
+    def test_metrics_api(self):
+        record(self.samples(MIDNIGHT, 288), now=NOW)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        res = client.get(metrics_url(self.topic.id), {
+            'start': '2024-01-10T00:00:00Z', 'end': '2024-01-10T06:00:00Z',
+            'tier': '1h',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 6)
+        self.assertEqual(res.data['results'][0]['count'], 12)
+        self.assertEqual(res.data['results'][0]['mean'], 5.5)
+
+        res = client.get(metrics_url(self.topic.id), {'metric': 'reach'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,162 @@
+"""
+Test the topics API
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Keyword, Organization, Package, Topics, UserRole
+
+TOPICS_URL = reverse('smmart:topics-list')
+
+
+def detail_url(topic_id):
+    return reverse('smmart:topics-detail', args=[topic_id])
+
+
+def create_topic(user, **params):
+    defaults = {
+        'name': 'Sample topic',
+        'prompt': 'Summarize',
+        'keywords': 'django,python',
+        'platform': 'linkedin,facebook',
+        'status': 't',
+    }
+    defaults.update(params)
+    return Topics.objects.create(user=user, **defaults)
+
+
+class TopicAPITests(TestCase):
+    """Test authenticated topic requests"""
+
+    def setUp(self):
+        organization = Organization.objects.create(name='inseyab')
+        package = Package.objects.create(name='basic')
+        role = UserRole.objects.create(name='admin')
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            organization=organization,
+            package=package,
+            role=role,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_topics_are_keyset_paginated(self):
+        """Test topics are returned newest first, one page at a time"""
+        topics = [
+            create_topic(self.user, name=f'topic {i}') for i in range(5)
+            ]
+
+        res = self.client.get(TOPICS_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', res.data)
+        self.assertEqual(
+            [topic['topic_id'] for topic in res.data['results']],
+            [topics[4].id, topics[3].id],
+        )
+
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual(
+            [topic['topic_id'] for topic in res.data['results']],
+            [topics[2].id, topics[1].id],
+        )
+
+    def test_topics_limited_to_user(self):
+        """Test only the authenticated user's topics are listed"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            organization=self.user.organization,
+        )
+        create_topic(other)
+        topic = create_topic(self.user)
+
+        res = self.client.get(TOPICS_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['topic_id'], topic.id)
+        self.assertEqual(
+            res.data['results'][0]['keywords'], ['django', 'python']
+            )
+
+    def test_create_topic_stores_normalized_terms(self):
+        """Test keywords and platforms are linked as deduplicated rows"""
+        payload = {
+            'name': 'Brands',
+            'keywords': ['Django', ' django ', 'Python'],
+            'platform': ['LinkedIn', 'facebook'],
+        }
+
+        res = self.client.post(TOPICS_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['keywords'], payload['keywords'])
+        topic = Topics.objects.get(id=res.data['topic_id'])
+        self.assertEqual(
+            sorted(topic.keyword_terms.values_list('name', flat=True)),
+            ['django', 'python'],
+        )
+        self.assertEqual(
+            sorted(topic.platform_terms.values_list('name', flat=True)),
+            ['facebook', 'linkedin'],
+        )
+        self.assertEqual(Keyword.objects.count(), 2)
+
+    def test_create_topic_rejects_overlong_terms(self):
+        """Test keywords and platforms must fit their term rows"""
+        payload = {
+            'name': 'Brands',
+            'keywords': ['django', 'k' * 256],
+            'platform': ['p' * 51],
+        }
+
+        res = self.client.post(TOPICS_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(res.data), {'keywords', 'platform'})
+        self.assertIn(1, res.data['keywords'])
+        self.assertFalse(Topics.objects.exists())
+
+    def test_filter_topics_by_keyword_and_platform(self):
+        """Test ?keyword= and ?platform= narrow the topic list"""
+        django_topic = create_topic(self.user)
+        django_topic.set_terms(['django'], ['linkedin'])
+        python_topic = create_topic(self.user)
+        python_topic.set_terms(['python'], ['linkedin', 'facebook'])
+
+        res = self.client.get(TOPICS_URL, {'keyword': 'Django'})
+        self.assertEqual(
+            [topic['topic_id'] for topic in res.data['results']],
+            [django_topic.id],
+        )
+
+        res = self.client.get(
+            TOPICS_URL, {'keyword': 'python', 'platform': 'facebook'}
+            )
+        self.assertEqual(
+            [topic['topic_id'] for topic in res.data['results']],
+            [python_topic.id],
+        )
+
+        res = self.client.get(TOPICS_URL, {'platform': 'instagram'})
+        self.assertEqual(res.data['results'], [])
+
+    def test_partial_update_keeps_keywords(self):
+        """Test patching the name leaves keywords untouched"""
+        topic = create_topic(self.user)
+        topic.set_terms(['django', 'python'], ['linkedin', 'facebook'])
+
+        res = self.client.patch(
+            detail_url(topic.id), {'name': 'Renamed'}, format='json'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        topic.refresh_from_db()
+        self.assertEqual(topic.keywords, 'django,python')
+        self.assertEqual(topic.keyword_terms.count(), 2)
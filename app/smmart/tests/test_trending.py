@@ -0,0 +1,168 @@
+"""
+Test trending terms from streaming sketches
+"""
+import datetime
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Organization, TopicSketch, Topics
+from smmart.collectors import CollectedPost
+from smmart.ingest import store_posts
+from smmart.trending import (
+    CountMinSketch,
+    TermSketch,
+    record,
+    trending_terms,
+)
+
+NOW = datetime.datetime(2024, 1, 2, 12, 30, tzinfo=datetime.timezone.utc)
+HOUR = datetime.timedelta(hours=1)
+
+
+def trending_url(topic_id):
+    return reverse('smmart:topics-trending', args=[topic_id])
+
+
+def create_topic(email='test@example.com'):
+    organization = Organization.objects.create(name=email)
+    user = get_user_model().objects.create(
+        email=email, organization=organization, package=None, role=None,
+    )
+    return Topics.objects.create(user=user, name='web')
+
+
+class SketchTests(SimpleTestCase):
+
+    def test_estimates_never_undercount(self):
+        counts = Counter({f'term{i}': i % 7 + 1 for i in range(5000)})
+        sketch = CountMinSketch(width=512, depth=4)
+        sketch.add(counts)
+
+        estimates = sketch.estimate(list(counts))
+
+        self.assertTrue(all(
+            estimate >= counts[name]
+            for name, estimate in zip(counts, estimates)
+        ))
+
+    def test_merged_sketches_equal_one_sketch(self):
+        """Test worker sketches merge into the same counts"""
+        first, second, both = TermSketch(), TermSketch(), TermSketch()
+        first.add_texts(['django release notes', 'django tips'])
+        second.add_texts(['python release'])
+        both.add_texts(
+            ['django release notes', 'django tips', 'python release']
+            )
+
+        first.merge(second)
+
+        self.assertTrue((first.cms.table == both.cms.table).all())
+        self.assertEqual(first.hitters, both.hitters)
+        self.assertEqual(first.posts, 3)
+
+    def test_bytes_round_trip_is_compact(self):
+        sketch = TermSketch(capacity=3)
+        sketch.add_texts(['alpha beta gamma delta'] * 3 + ['alpha beta'])
+
+        data = sketch.to_bytes()
+        loaded = TermSketch.from_bytes(data, posts=4)
+
+        self.assertTrue((loaded.cms.table == sketch.cms.table).all())
+        self.assertEqual(loaded.hitters, {'alpha': 4, 'beta': 4, 'delta': 3})
+        self.assertLess(len(data), sketch.cms.table.nbytes // 10)
+
+
+class TrendingTests(TestCase):
+    """Test trending terms of stored sketches"""
+
+    def setUp(self):
+        self.topic = create_topic()
+
+    def test_spiking_terms_rank_first(self):
+        items = []
+        for hour in range(3, 24):
+            items += [
+                (self.topic.id, NOW - hour * HOUR, 'python django tips')
+            ] * 10
+        for hour in range(3):
+            items += [(self.topic.id, NOW - hour * HOUR, 'python')] * 10
+            items += [
+                (self.topic.id, NOW - hour * HOUR, 'django launch event')
+            ] * 8
+        record(items, now=NOW)
+
+        results = trending_terms(self.topic.id, now=NOW)
+
+        self.assertEqual(
+            [result['term'] for result in results[:2]], ['event', 'launch']
+            )
+        python = next(r for r in results if r['term'] == 'python')
+        self.assertEqual((python['mentions'], python['score']), (30, 1.0))
+
+    def test_batches_merge_into_stored_buckets(self):
+        record([(self.topic.id, NOW, 'django launch')] * 3, now=NOW)
+        record([(self.topic.id, NOW, 'django launch')] * 4, now=NOW)
+
+        sketch = TopicSketch.objects.get()
+
+        self.assertEqual(sketch.posts, 7)
+        self.assertEqual(
+            TermSketch.from_bytes(sketch.data).hitters,
+            {'django': 7, 'launch': 7},
+        )
+
+    def test_old_buckets_are_dropped(self):
+        record([(self.topic.id, NOW - 2 * HOUR, 'django')], now=NOW)
+        record([(self.topic.id, NOW - 48 * HOUR, 'django')], now=NOW)
+
+        later = NOW + 24 * HOUR
+        record([(self.topic.id, later, 'django')], now=later)
+
+        self.assertEqual(
+            list(TopicSketch.objects.values_list('bucket_start', flat=True)),
+            [later.replace(minute=0)],
+        )
+
+    def test_ingested_posts_are_sketched(self):
+        """Test only links new to the topic are counted"""
+        post = CollectedPost(
+            platform='linkedin', external_id='1', text='Django launch',
+            published_at=timezone.now(), keyword='django',
+            topic_ids=(self.topic.id,),
+        )
+        store_posts([post])
+        store_posts([post])
+
+        self.assertEqual(TopicSketch.objects.get().posts, 1)
+
+
+class TrendingAPITests(TestCase):
+
+    def setUp(self):
+        self.topic = create_topic()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.topic.user)
+
+    def test_trending_terms(self):
+        now = timezone.now()
+        record([(self.topic.id, now, 'Django launch!')] * 6, now=now)
+
+        res = self.client.get(trending_url(self.topic.id), {'limit': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['mentions'], 6)
+
+    def test_other_users_topics_are_hidden(self):
+        other = create_topic('other@example.com')
+
+        res = self.client.get(trending_url(other.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
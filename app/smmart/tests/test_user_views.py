@@ -0,0 +1,97 @@
+"""
+Test the organization user endpoints
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Organization, Package, UserRole
+
+USERS_URL = reverse('smmart:user-list')
+EDIT_USER_URL = reverse('smmart:edit-user')
+
+
+def detail_url(user_id):
+    return reverse('smmart:user-detail', args=[user_id])
+
+
+class UserViewTests(TestCase):
+    """Test the organization user endpoints"""
+
+    def setUp(self):
+        self.organization = Organization.objects.create(name='inseyab')
+        self.package = Package.objects.create(name='basic')
+        self.role = UserRole.objects.create(id=1, name='admin')
+        self.admin = self.create_user('admin@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def create_user(self, email):
+        return get_user_model().objects.create_user(
+            email=email,
+            password='testpass123',
+            name=email,
+            organization=self.organization,
+            package=self.package,
+            role=self.role,
+        )
+
+    def test_list_users_query_budget(self):
+        """Test listing users does not grow with the user count"""
+        for i in range(10):
+            self.create_user(f'user{i}@example.com')
+
+        with self.assertNumQueries(1):
+            res = self.client.get(USERS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        results = res.data['results']
+        self.assertEqual(len(results), 11)
+        self.assertEqual(results[0]['organization']['name'], 'inseyab')
+        self.assertEqual(results[0]['package']['name'], 'basic')
+        self.assertEqual(results[0]['role']['name'], 'admin')
+
+    def test_retrieve_user_query_budget(self):
+        """Test retrieving one user fetches relations in one query"""
+        user = self.create_user('user@example.com')
+
+        with self.assertNumQueries(1):
+            res = self.client.get(detail_url(user.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], user.email)
+
+    def test_manage_admin_user_query_budget(self):
+        """Test the admin profile fetches relations in one query"""
+        with self.assertNumQueries(1):
+            res = self.client.get(EDIT_USER_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['role']['name'], 'admin')
+
+    def test_pages_follow_cursor(self):
+        """Test walking the cursor returns every user once"""
+        for i in range(4):
+            self.create_user(f'user{i}@example.com')
+        other = Organization.objects.create(name='other')
+        get_user_model().objects.create_user(
+            email='other@example.com', organization=other,
+            package=self.package, role=self.role,
+        )
+
+        emails = []
+        url = f'{USERS_URL}?page_size=2'
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', res.data)
+            self.assertLessEqual(len(res.data['results']), 2)
+            emails.extend(user['email'] for user in res.data['results'])
+            url = res.data['next']
+
+        self.assertEqual(len(emails), 5)
+        self.assertEqual(len(set(emails)), 5)
+        self.assertNotIn('other@example.com', emails)
@@ -0,0 +1,158 @@
+"""
+Test the memory-mapped vector index
+"""
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from smmart.vectors import MIN_CAPACITY, VectorIndex
+
+
+def unit_vectors(count, dimensions, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dimensions))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)) \
+        .astype(np.float32)
+
+
+class VectorIndexTests(SimpleTestCase):
+    """Test adding, removing and searching vectors"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = f'{self.directory.name}/index'
+        self.index = VectorIndex(self.path, 8)
+
+    def test_empty_index(self):
+        self.assertEqual(self.index.search(np.ones(8)), [])
+        self.assertEqual(len(self.index), 0)
+
+    def test_search_ranks_by_similarity(self):
+        vectors = unit_vectors(20, 8)
+        self.index.add(range(100, 120), vectors)
+
+        results = self.index.search(vectors[3], k=3)
+
+        self.assertEqual(results[0][0], 103)
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+        self.assertEqual(len(results), 3)
+        self.assertGreaterEqual(results[1][1], results[2][1])
+
+    def test_add_replaces_and_remove_hides(self):
+        vectors = unit_vectors(3, 8)
+        self.index.add([1, 2, 3], vectors)
+
+        self.index.add([1], vectors[2:])
+        self.index.remove([3, 42])
+
+        self.assertEqual(len(self.index), 2)
+        self.assertNotIn(3, self.index)
+        self.assertEqual(
+            [vector_id for vector_id, _ in self.index.search(vectors[2])],
+            [1, 2],
+        )
+
+    def test_exclude(self):
+        vectors = unit_vectors(5, 8)
+        self.index.add(range(5), vectors)
+
+        results = self.index.search(vectors[0], k=2, exclude={0})
+
+        self.assertNotIn(0, [vector_id for vector_id, _ in results])
+
+    def test_changes_reach_other_instances(self):
+        """Test an index opened elsewhere sees adds, growth and removals"""
+        reader = VectorIndex(self.path, 8)
+        vectors = unit_vectors(MIN_CAPACITY + 10, 8)
+        self.index.add([0], vectors[:1])
+        self.assertIn(0, reader)
+
+        self.index.add(range(1, len(vectors)), vectors[1:])
+        self.index.remove([0])
+
+        self.assertEqual(len(reader), len(vectors) - 1)
+        self.assertEqual(reader.search(vectors[-1], k=1)[0][0],
+                         len(vectors) - 1)
+        self.assertNotIn(0, reader)
+
+    def test_dimension_mismatch(self):
+        self.index.add([1], unit_vectors(1, 8))
+
+        with self.assertRaises(ValueError):
+            len(VectorIndex(self.path, 16))
+
+    def test_trained_index_recall(self):
+        """Test searching a few lists finds most exhaustive neighbours"""
+        centers = unit_vectors(50, 16, seed=1)
+        noise = unit_vectors(5000, 16, seed=2) * 0.3
+        vectors = centers[np.arange(5000) % 50] + noise
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        queries = vectors[:50]
+        self.index = VectorIndex(self.path, 16)
+        self.index.add(range(5000), vectors)
+        exact = [
+            {vector_id for vector_id, _ in self.index.search(query)}
+            for query in queries
+        ]
+
+        self.index.train(lists=50)
+        self.index.add([5000], queries[:1])
+        found = [
+            {vector_id for vector_id, _ in self.index.search(query, nprobe=4)}
+            for query in queries
+        ]
+
+        recall = np.mean([
+            len(hits & truth) / len(truth)
+            for hits, truth in zip(found, exact)
+        ])
+        self.assertGreater(recall, 0.9)
+        self.assertIn(5000, found[0])
+
+    def test_ids_are_resolved_through_sorted_keys(self):
+        """Test ids are found in the keys and in the rows added since"""
+        vectors = unit_vectors(3 * MIN_CAPACITY, 8)
+        reader = VectorIndex(self.path, 8)
+        for first in range(0, len(vectors), 256):
+            self.index.add(
+                range(first, first + 256), vectors[first:first + 256]
+            )
+        self.index.remove([5])
+        self.index.add([7], vectors[:1])
+        self.index.add([5], vectors[5:6])
+        self.index.remove([len(vectors) - 1])
+
+        self.assertIn(0, reader)
+        self.assertIsInstance(reader.keys, np.memmap)
+        self.assertLess(reader._keyed, reader.count)
+        self.assertEqual(
+            reader._find([0, 5, 7, len(vectors) - 1, -3, 10**9]).tolist(),
+            [0, reader.count - 1, 7, -1, -1, -1],
+        )
+        self.assertEqual(len(reader), len(vectors) - 1)
+        self.assertEqual(reader.search(vectors[0], k=2)[1][0], 7)
+
+    def test_replaced_vectors_move_to_their_new_list(self):
+        """Test a vector replaced after train() is scanned under its list"""
+        centers = unit_vectors(20, 16, seed=1)
+        vectors = centers[np.arange(2000) % 20] \
+            + unit_vectors(2000, 16, seed=2) * 0.1
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.index = VectorIndex(self.path, 16)
+        self.index.add(range(2000), vectors)
+        self.index.train(lists=20)
+        reader = VectorIndex(self.path, 16)
+        # Sorts the lists in both processes
+        self.index.search(centers[0], nprobe=1)
+        reader.search(centers[0], nprobe=1)
+
+        self.index.add([0], centers[1:2])
+
+        for index in [self.index, reader]:
+            found = index.search(centers[1], k=1, nprobe=1)
+            self.assertEqual(found[0][0], 0)
+            self.assertNotIn(
+                0, [i for i, _ in index.search(centers[0], nprobe=1)]
+            )
+        self.assertEqual(len(reader), 2000)
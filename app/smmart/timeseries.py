@@ -0,0 +1,353 @@
+"""
+Topic metric time series stored as compressed array blocks
+"""
+import datetime
+import math
+import struct
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.bulk import MAX_PARAMS, chunked, insert_ignore
+from core.models import MetricBlock, TopicDailyRollup
+
+FORMAT_VERSION = 1
+# version, points
+HEADER = struct.Struct('<BI')
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+METRICS = ('mentions', 'positive', 'negative', 'sentiment')
+
+
+@dataclass(frozen=True)
+class Tier:
+    """A resolution of the series: raw samples or aggregates of step"""
+    name: str
+    # Seconds per point, 0 for raw samples
+    step: int
+    # Seconds per block; a multiple of DAY so every raw block falls in
+    # one block of each tier
+    span: int
+    retention_setting: str
+
+    @property
+    def retention(self):
+        """Seconds the tier is kept, 0 for ever"""
+        return getattr(settings, self.retention_setting) * DAY
+
+    @property
+    def columns(self):
+        # Raw blocks hold a value per sample; aggregates hold the count,
+        # sum, min and max of the samples of each step
+        if not self.step:
+            return ['<f4']
+        return ['<u4', '<f8', '<f4', '<f4']
+
+
+RAW = Tier('raw', 0, DAY, 'TIMESERIES_RAW_RETENTION_DAYS')
+HOURLY = Tier('1h', HOUR, 30 * DAY, 'TIMESERIES_HOURLY_RETENTION_DAYS')
+DAILY = Tier('1d', DAY, 360 * DAY, 'TIMESERIES_DAILY_RETENTION_DAYS')
+TIERS = {tier.name: tier for tier in (RAW, HOURLY, DAILY)}
+
+
+def _moment(epoch):
+    return datetime.datetime.fromtimestamp(epoch, tz=datetime.timezone.utc)
+
+
+def _epoch(moment):
+    return int(moment.timestamp())
+
+
+class Block:
+    """
+    The decoded points of one MetricBlock.
+
+    Times are epoch seconds, stored as deltas from the previous point
+    (from start for the first one), which regular sampling turns into
+    runs of one value that zlib shrinks to almost nothing.
+    """
+
+    def __init__(self, tier, start, times=None, columns=None):
+        self.tier = tier
+        self.start = start
+        if times is None:
+            times = np.zeros(0, dtype=np.int64)
+            columns = [np.zeros(0, dtype=dtype) for dtype in tier.columns]
+        self.times = times
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.times)
+
+    def to_bytes(self):
+        deltas = np.diff(self.times, prepend=self.start).astype('<u4')
+        return zlib.compress(
+            HEADER.pack(FORMAT_VERSION, len(self))
+            + deltas.tobytes()
+            + b''.join(
+                column.astype(dtype, copy=False).tobytes()
+                for column, dtype in zip(self.columns, self.tier.columns)
+            )
+        )
+
+    @classmethod
+    def from_bytes(cls, tier, start, data):
+        """Load a block written by to_bytes(); empty data is a new one"""
+        if not data:
+            return cls(tier, start)
+        raw = zlib.decompress(bytes(data))
+        version, count = HEADER.unpack_from(raw)
+        if version != FORMAT_VERSION:
+            raise ValueError(f'Unknown block format {version}')
+        offset = HEADER.size
+        deltas = np.frombuffer(raw, dtype='<u4', count=count, offset=offset)
+        times = start + np.cumsum(deltas, dtype=np.int64)
+        offset += deltas.nbytes
+        columns = []
+        for dtype in tier.columns:
+            column = np.frombuffer(raw, dtype=dtype, count=count,
+                                   offset=offset)
+            columns.append(column)
+            offset += column.nbytes
+        return cls(tier, start, times, columns)
+
+    def merge(self, times, columns):
+        """Add points; a point at the time of an older one replaces it"""
+        times = np.concatenate([self.times, times])
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        last = np.append(times[1:] != times[:-1], True)
+        self.times = times[last]
+        self.columns = [
+            np.concatenate([old, new])[order][last]
+            for old, new in zip(self.columns, columns)
+        ]
+
+    def replace(self, lower, upper, times, columns):
+        """Replace the points in [lower, upper) with times and columns"""
+        keep = (self.times < lower) | (self.times >= upper)
+        self.times = self.times[keep]
+        self.columns = [column[keep] for column in self.columns]
+        self.merge(times, columns)
+
+
+def aggregate(times, values, step):
+    """(bucket starts, count, sum, min, max) of sorted samples by step"""
+    buckets = times // step * step
+    firsts = np.flatnonzero(np.append(True, buckets[1:] != buckets[:-1]))
+    values = values.astype(np.float64)
+    return buckets[firsts], [
+        np.diff(np.append(firsts, len(times))).astype(np.uint32),
+        np.add.reduceat(values, firsts),
+        np.minimum.reduceat(values, firsts),
+        np.maximum.reduceat(values, firsts),
+    ]
+
+
+def _lock_blocks(keys):
+    """{(topic_id, metric, tier, start epoch): MetricBlock}, locked"""
+    insert_ignore(MetricBlock, [
+        MetricBlock(
+            topic_id=topic_id, metric=metric, tier=tier, start=_moment(start)
+        )
+        for topic_id, metric, tier, start in keys
+    ], ['topic', 'metric', 'tier', 'start'])
+
+    rows = {}
+    for chunk in chunked(keys, MAX_PARAMS // 2):
+        for row in MetricBlock.objects.select_for_update().filter(
+            topic_id__in={key[0] for key in chunk},
+            tier__in={key[2] for key in chunk},
+            start__in={_moment(key[3]) for key in chunk},
+        ):
+            key = (row.topic_id, row.metric, row.tier, _epoch(row.start))
+            if key in keys:
+                rows[key] = row
+    return rows
+
+
+def record(samples, now=None):
+    """
+    Store (topic id, metric, moment, value) samples.
+
+    Samples are merged into the raw block of their day, and the hourly
+    and daily aggregates of the days they touch are recomputed from it,
+    so the tiers are always consistent. Samples older than the raw
+    retention are dropped, since their day can no longer be
+    aggregated. Returns the number of samples stored.
+    """
+    now = _epoch(now or timezone.now())
+    oldest = (now - RAW.retention) // DAY * DAY if RAW.retention else 0
+    days = defaultdict(lambda: ([], []))
+    for topic_id, metric, moment, value in samples:
+        if metric not in METRICS:
+            raise ValueError(f'Unknown metric {metric!r}')
+        epoch = _epoch(moment)
+        if epoch < oldest:
+            continue
+        times, values = days[topic_id, metric, epoch // DAY * DAY]
+        times.append(epoch)
+        values.append(value)
+    if not days:
+        return 0
+
+    keys = set()
+    for topic_id, metric, day in days:
+        for tier in TIERS.values():
+            start = day // tier.span * tier.span
+            keys.add((topic_id, metric, tier.name, start))
+
+    stored = 0
+    with transaction.atomic():
+        rows = _lock_blocks(keys)
+        blocks = {
+            key: Block.from_bytes(TIERS[key[2]], key[3], row.data)
+            for key, row in rows.items()
+        }
+        for (topic_id, metric, day), (times, values) in days.items():
+            raw = blocks[topic_id, metric, RAW.name, day]
+            raw.merge(
+                np.array(times, dtype=np.int64),
+                [np.array(values, dtype=np.float32)],
+            )
+            stored += len(times)
+            for tier in (HOURLY, DAILY):
+                start = day // tier.span * tier.span
+                blocks[topic_id, metric, tier.name, start].replace(
+                    day, day + DAY,
+                    *aggregate(raw.times, raw.columns[0], tier.step),
+                )
+        for key, row in rows.items():
+            row.data = blocks[key].to_bytes()
+            row.count = len(blocks[key])
+        MetricBlock.objects.bulk_update(
+            rows.values(), ['data', 'count'], batch_size=500
+        )
+    return stored
+
+
+def prune(now=None):
+    """Delete the blocks past their tier's retention"""
+    now = _epoch(now or timezone.now())
+    deleted = 0
+    for tier in TIERS.values():
+        if tier.retention:
+            cutoff = now - tier.retention - tier.span
+            deleted += MetricBlock.objects.filter(
+                tier=tier.name, start__lt=_moment(cutoff)
+            ).delete()[0]
+    return deleted
+
+
+def pick_tier(start, end, now=None):
+    """
+    The finest tier kept for start that answers the range in a few
+    hundred points
+    """
+    age = _epoch(now or timezone.now()) - _epoch(start)
+    span = _epoch(end) - _epoch(start)
+    for tier, longest in [(RAW, 2 * DAY), (HOURLY, 31 * DAY)]:
+        if span <= longest and (not tier.retention or age <= tier.retention):
+            return tier
+    return DAILY
+
+
+@dataclass
+class Series:
+    """Points of a series in [start, end) as arrays"""
+    tier: str
+    times: np.ndarray
+    count: np.ndarray
+    total: np.ndarray
+    low: np.ndarray
+    high: np.ndarray
+
+    @property
+    def mean(self):
+        return self.total / np.maximum(self.count, 1)
+
+    def rows(self):
+        return [
+            {
+                'time': _moment(time),
+                'count': count,
+                'mean': round(mean, 4),
+                'min': round(low, 4),
+                'max': round(high, 4),
+            }
+            for time, count, mean, low, high in zip(
+                self.times.tolist(), self.count.tolist(),
+                self.mean.tolist(), self.low.tolist(), self.high.tolist(),
+            )
+        ]
+
+
+def read(topic_id, metric, start, end, tier=None):
+    """
+    The points of a topic metric in [start, end), from tier or the tier
+    pick_tier() chooses. Every block overlapping the range is read in
+    one query and the range is cut out of the decoded arrays.
+    """
+    tier = TIERS[tier] if tier else pick_tier(start, end)
+    # Samples are stored to the second; one taken earlier in the second
+    # of end is before it
+    lower, upper = _epoch(start), math.ceil(end.timestamp())
+    rows = MetricBlock.objects.filter(
+        topic_id=topic_id, metric=metric, tier=tier.name,
+        start__gte=_moment(lower // tier.span * tier.span),
+        start__lt=end,
+    ).order_by('start').values_list('start', 'data')
+    blocks = [
+        Block.from_bytes(tier, _epoch(block_start), data)
+        for block_start, data in rows
+    ]
+    blocks.append(Block(tier, lower))
+    times = np.concatenate([block.times for block in blocks])
+    columns = [
+        np.concatenate([block.columns[i] for block in blocks])
+        for i in range(len(tier.columns))
+    ]
+    inside = (times >= lower) & (times < upper)
+    times = times[inside]
+    columns = [column[inside] for column in columns]
+    if not tier.step:
+        values = columns[0].astype(np.float64)
+        columns = [np.ones(len(times), dtype=np.uint32), values,
+                   values, values]
+    return Series(tier.name, times, *columns)
+
+
+def sample_topics(now=None):
+    """
+    Record each topic's running totals for the day from its rollups:
+    mentions, positive and negative posts, and the mean sentiment
+    """
+    now = now or timezone.now()
+    totals = TopicDailyRollup.objects.filter(day=now.date()).values(
+        'topic_id'
+    ).annotate(
+        mentions=Sum('mentions'),
+        positive=Sum('positive'),
+        negative=Sum('negative'),
+        sentiment=Sum('sentiment'),
+    ).order_by()
+    samples = []
+    for total in totals:
+        mentions = total['mentions'] or 0
+        sentiment = total['sentiment'] / mentions if mentions else 0.0
+        for metric, value in [
+            ('mentions', mentions),
+            ('positive', total['positive']),
+            ('negative', total['negative']),
+            ('sentiment', sentiment),
+        ]:
+            samples.append((total['topic_id'], metric, now, value))
+    return record(samples, now)
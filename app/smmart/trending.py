@@ -0,0 +1,288 @@
+"""
+Trending terms of a topic from streaming sketches
+"""
+import datetime
+import hashlib
+import struct
+import zlib
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.bulk import MAX_PARAMS, chunked, insert_ignore
+from core.models import TopicSketch
+from smmart.matching import tokenize
+
+FORMAT_VERSION = 1
+# version, width, depth, length of the hitter names
+HEADER = struct.Struct('<BIHI')
+
+STOPWORDS = frozenset(
+    'about after all also and are because been but can could did does '
+    'for from had has have her his how into its just like more not now '
+    'our out over she than that the their them then there these they '
+    'this was were what when which who will with would you your'.split()
+)
+
+
+def terms(text):
+    """The distinct tokens of text worth counting"""
+    return {
+        token for token in tokenize(text)
+        if len(token) > 2 and not token.isdigit() and token not in STOPWORDS
+    }
+
+
+def _hashes(names):
+    """Two independent 64-bit hashes per name, stable across processes"""
+    digests = b''.join(
+        hashlib.blake2b(name.encode(), digest_size=16).digest()
+        for name in names
+    )
+    pairs = np.frombuffer(digests, dtype='<u8').reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1] | np.uint64(1)
+
+
+class CountMinSketch:
+    """
+    depth rows of width counters.
+
+    A term adds to one counter per row and its estimate is the smallest
+    of them, so it never undercounts. Sketches of the same shape merge by
+    adding their tables, which is what lets every worker count on its
+    own.
+    """
+
+    def __init__(self, width, depth, table=None):
+        self.width = width
+        self.depth = depth
+        if table is None:
+            table = np.zeros((depth, width), dtype=np.uint32)
+        self.table = table
+
+    def _columns(self, names):
+        # Kirsch-Mitzenmacher: row i uses h1 + i * h2
+        h1, h2 = _hashes(names)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        columns = (h1[None, :] + rows * h2[None, :]) % np.uint64(self.width)
+        return columns.astype(np.intp)
+
+    def add(self, counts):
+        """Add a {term: count} mapping"""
+        if not counts:
+            return
+        columns = self._columns(list(counts))
+        values = np.fromiter(
+            counts.values(), dtype=np.uint32, count=len(counts)
+        )
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], values)
+
+    def estimate(self, names):
+        if not names:
+            return np.zeros(0, dtype=np.uint32)
+        columns = self._columns(names)
+        rows = np.arange(self.depth)[:, None]
+        return self.table[rows, columns].min(axis=0)
+
+    def merge(self, other):
+        if self.table.shape != other.table.shape:
+            raise ValueError('Sketches of different shapes cannot merge')
+        self.table += other.table
+
+
+class TermSketch:
+    """
+    Term counts of the posts of one time bucket.
+
+    A count-min sketch holds every term in a fixed width x depth table;
+    the capacity terms with the highest estimates are kept by name as
+    the heavy hitters, the only candidates for trending. Terms are
+    counted once per post.
+    """
+
+    def __init__(self, width=None, depth=None, capacity=None, posts=0):
+        self.cms = CountMinSketch(
+            width or settings.TRENDING_SKETCH_WIDTH,
+            depth or settings.TRENDING_SKETCH_DEPTH,
+        )
+        self.capacity = capacity or settings.TRENDING_HITTERS
+        self.hitters = {}
+        self.posts = posts
+
+    @property
+    def shape(self):
+        return self.cms.table.shape
+
+    def add_texts(self, texts):
+        counts = Counter()
+        for text in texts:
+            counts.update(terms(text))
+            self.posts += 1
+        self.cms.add(counts)
+        self._refresh(counts)
+
+    def merge(self, other):
+        self.cms.merge(other.cms)
+        self.posts += other.posts
+        self._refresh(other.hitters)
+
+    def _refresh(self, candidates):
+        names = list(set(self.hitters).union(candidates))
+        ranked = sorted(
+            zip(names, self.cms.estimate(names).tolist()),
+            key=lambda item: (-item[1], item[0]),
+        )
+        self.hitters = dict(ranked[:self.capacity])
+
+    def to_bytes(self):
+        names = '\n'.join(self.hitters).encode()
+        width, depth = self.cms.width, self.cms.depth
+        return zlib.compress(
+            HEADER.pack(FORMAT_VERSION, width, depth, len(names))
+            + self.cms.table.astype('<u4', copy=False).tobytes()
+            + names
+        )
+
+    @classmethod
+    def from_bytes(cls, data, posts=0):
+        """Load a sketch written by to_bytes(); empty data is a new one"""
+        if not data:
+            return cls(posts=posts)
+        raw = zlib.decompress(bytes(data))
+        version, width, depth, length = HEADER.unpack_from(raw)
+        if version != FORMAT_VERSION:
+            raise ValueError(f'Unknown sketch format {version}')
+        offset = HEADER.size
+        size = width * depth * 4
+        table = np.frombuffer(
+            raw[offset:offset + size], dtype='<u4'
+        ).astype(np.uint32).reshape(depth, width)
+        names = raw[offset + size:offset + size + length].decode()
+        sketch = cls(width=width, depth=depth, posts=posts)
+        sketch.cms.table = table
+        sketch._refresh(names.split('\n') if names else ())
+        return sketch
+
+
+def bucket_start(moment):
+    """Start of the TRENDING_BUCKET_MINUTES bucket holding moment"""
+    seconds = settings.TRENDING_BUCKET_MINUTES * 60
+    epoch = int(moment.timestamp()) // seconds * seconds
+    return datetime.datetime.fromtimestamp(epoch, tz=datetime.timezone.utc)
+
+
+def window(now=None):
+    """(oldest bucket, first recent bucket, current bucket) at now"""
+    current = bucket_start(now or timezone.now())
+    bucket = datetime.timedelta(minutes=settings.TRENDING_BUCKET_MINUTES)
+    recent = current - bucket * (settings.TRENDING_RECENT_BUCKETS - 1)
+    oldest = current - bucket * (settings.TRENDING_BUCKETS - 1)
+    return oldest, recent, current
+
+
+def record(items, now=None):
+    """
+    Count the terms of (topic id, published at, text) items.
+
+    Items are sketched locally per topic and bucket, then merged into the
+    stored sketches under a row lock, a few statements per batch. Items
+    older than the window are ignored and buckets that left the window
+    are dropped.
+    """
+    now = now or timezone.now()
+    oldest = window(now)[0]
+    texts = defaultdict(list)
+    for topic_id, published_at, text in items:
+        start = bucket_start(min(published_at or now, now))
+        if start >= oldest:
+            texts[topic_id, start].append(text)
+    if not texts:
+        return
+
+    sketches = {}
+    for key, bucket_texts in texts.items():
+        sketches[key] = sketch = TermSketch()
+        sketch.add_texts(bucket_texts)
+
+    with transaction.atomic():
+        insert_ignore(TopicSketch, [
+            TopicSketch(topic_id=topic_id, bucket_start=start)
+            for topic_id, start in sketches
+        ], ['topic', 'bucket_start'])
+
+        rows = []
+        for chunk in chunked(sketches, MAX_PARAMS // 2):
+            stored_rows = TopicSketch.objects.select_for_update().filter(
+                topic_id__in={topic_id for topic_id, _ in chunk},
+                bucket_start__in={start for _, start in chunk},
+            )
+            for row in stored_rows:
+                delta = sketches.get((row.topic_id, row.bucket_start))
+                if delta is None:
+                    continue
+                stored = TermSketch.from_bytes(row.data, row.posts)
+                if stored.shape == delta.shape:
+                    stored.merge(delta)
+                else:
+                    # The sketch settings changed; start the bucket over
+                    stored = delta
+                row.data = stored.to_bytes()
+                row.posts = stored.posts
+                rows.append(row)
+        TopicSketch.objects.bulk_update(rows, ['data', 'posts'])
+
+        TopicSketch.objects.filter(
+            topic_id__in={topic_id for topic_id, _ in sketches},
+            bucket_start__lt=oldest,
+        ).delete()
+
+
+def trending_terms(topic_id, limit=20, now=None):
+    """
+    Terms of the topic's recent buckets mentioned more than usual.
+
+    The score compares the mentions per bucket in the last
+    TRENDING_RECENT_BUCKETS buckets with the rest of the window, with
+    add-one smoothing so new terms do not divide by zero.
+    """
+    oldest, recent_start, current = window(now)
+    recent, baseline = TermSketch(), TermSketch()
+    rows = TopicSketch.objects.filter(
+        topic_id=topic_id, bucket_start__range=(oldest, current)
+    )
+    for row in rows:
+        sketch = TermSketch.from_bytes(row.data, row.posts)
+        if sketch.shape != recent.shape:
+            continue
+        if row.bucket_start >= recent_start:
+            recent.merge(sketch)
+        else:
+            baseline.cms.merge(sketch.cms)
+            baseline.posts += sketch.posts
+
+    names = list(recent.hitters)
+    if not names:
+        return []
+    recent_buckets = settings.TRENDING_RECENT_BUCKETS
+    baseline_buckets = settings.TRENDING_BUCKETS - recent_buckets
+    mentions = recent.cms.estimate(names).astype(np.float64)
+    usual = baseline.cms.estimate(names).astype(np.float64)
+    scores = (mentions / recent_buckets + 1) / \
+        (usual / max(baseline_buckets, 1) + 1)
+
+    results = [
+        {
+            'term': name,
+            'mentions': int(count),
+            'baseline': int(base),
+            'score': round(float(score), 3),
+        }
+        for name, count, base, score in zip(names, mentions, usual, scores)
+        if count >= settings.TRENDING_MIN_MENTIONS
+    ]
+    results.sort(key=lambda result: (-result['score'], -result['mentions']))
+    return results[:limit]
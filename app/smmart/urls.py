@@ -35,6 +35,11 @@ urlpatterns = [
         views.UpdatePackage.as_view(),
         name='assign-package'
     ),
+    path(
+        'posts/ingest',
+        views.PostIngestAPIView.as_view(),
+        name='ingest-posts'
+    ),
     # path(
     #     'admin/assign/role/<int:pk>', views.ManageUserRoleAPIView.as_view(),
     #     name='update-role'
@@ -0,0 +1,379 @@
+"""
+Memory-mapped nearest-neighbour index of float32 vectors
+"""
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+MIN_CAPACITY = 1024
+# Rows per block when scanning or assigning a whole index
+BLOCK = 65536
+
+
+def nearest(vectors, centroids):
+    """Index of the closest centroid of each vector, block by block"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    step = max(1, BLOCK * 64 // max(len(centroids), 1))
+    for start in range(0, len(vectors), step):
+        block = np.asarray(vectors[start:start + step])
+        labels[start:start + step] = (block @ centroids.T).argmax(axis=1)
+    return labels
+
+
+class VectorIndex:
+    """
+    Unit vectors keyed by integer id, ranked by dot product.
+
+    The rows live in .npy files opened with np.memmap, so an index is
+    shared by every process on the host through the page cache and opens
+    without reading it. Vectors are added, replaced and removed in place;
+    growing the files or training replaces them and bumps the generation
+    in meta.json, which tells the other processes to reopen.
+
+    Ids are resolved through keys.npy, the sorted ids of the rows, and
+    slots.npy, their rows, so no process builds a map of every id. Rows
+    added since the keys were last sorted are searched directly, and
+    the keys are sorted again once those are a tenth of the index.
+
+    Until train() is called a query scans every row. A trained index
+    also keeps the row's nearest of its centroids (IVF), and a query only
+    scans the rows of the nprobe lists closest to it, plus the rows added
+    since the lists were last sorted. A vector replaced with one nearer
+    another centroid moves to a new row, since processes that sorted the
+    lists would keep scanning its old row under the old list.
+    """
+
+    def __init__(self, path, dimensions):
+        self.path = Path(path)
+        self.dimensions = dimensions
+        self._stamp = None
+        self._generation = None
+        self._key = None
+        self.count = 0
+        self.vectors = self.ids = self.lists = self.centroids = None
+        self.keys = self.slots = np.empty(0, dtype=np.int64)
+        self._keyed = 0
+        self._tail = None
+        self._order = self._bounds = None
+        self._sorted = 0
+
+    # Files
+
+    def _file(self, name):
+        return self.path / name
+
+    def _read_meta(self):
+        try:
+            with open(self._file('meta.json')) as meta:
+                return json.load(meta)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, **changes):
+        meta = {
+            'dimensions': self.dimensions,
+            'count': self.count,
+            'generation': self._generation or 0,
+            # Rows covered by keys.npy
+            'keyed': self._keyed,
+            # Tells apart an index rebuilt under the same path
+            'key': self._key or os.urandom(8).hex(),
+            **changes,
+        }
+        temp = self._file('meta.json.tmp')
+        with open(temp, 'w') as out:
+            json.dump(meta, out)
+        os.replace(temp, self._file('meta.json'))
+        self._generation = meta['generation']
+        self._key = meta['key']
+
+    def _meta_stamp(self):
+        # meta.json is replaced on every write, so its inode changes even
+        # when two writes share a timestamp
+        stat = os.stat(self._file('meta.json'))
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _open(self, meta):
+        if meta['dimensions'] != self.dimensions:
+            raise ValueError(
+                f'{self.path} holds {meta["dimensions"]}-dimensional '
+                f'vectors, not {self.dimensions}'
+            )
+        self.vectors = np.load(self._file('vectors.npy'), mmap_mode='r+')
+        self.ids = np.load(self._file('ids.npy'), mmap_mode='r+')
+        self.lists = np.load(self._file('lists.npy'), mmap_mode='r+')
+        try:
+            self.centroids = np.load(self._file('centroids.npy'))
+        except FileNotFoundError:
+            self.centroids = None
+        try:
+            self.keys = np.load(self._file('keys.npy'), mmap_mode='r')
+            self.slots = np.load(self._file('slots.npy'), mmap_mode='r')
+        except FileNotFoundError:
+            self.keys = self.slots = np.empty(0, dtype=np.int64)
+        self._generation = meta['generation']
+        self._key = meta['key']
+        self._keyed = meta.get('keyed', 0)
+        self._tail = None
+        self.count = 0
+        self._order = self._bounds = None
+        self._sorted = 0
+
+    def refresh(self):
+        """Pick up the changes made by other processes"""
+        try:
+            stamp = self._meta_stamp()
+        except FileNotFoundError:
+            return
+        if stamp == self._stamp:
+            return
+        meta = self._read_meta()
+        if meta is None:
+            return
+        self._stamp = stamp
+        count = meta['count']
+        if (meta['key'], meta['generation']) != \
+                (self._key, self._generation) or count < self.count:
+            self._open(meta)
+        self.count = count
+
+    @contextmanager
+    def _writing(self):
+        """Serialize writers across processes and create the files"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self._file('lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                if self.vectors is None:
+                    self._resize(MIN_CAPACITY)
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _replace(self, name, array):
+        """Swap in a new file; processes mapping the old one keep it"""
+        temp = self._file(name.replace('.npy', '.tmp.npy'))
+        np.save(temp, array)
+        os.replace(temp, self._file(name))
+
+    def _resize(self, capacity):
+        """Copy the rows into files of capacity rows"""
+        def grown(old, shape, dtype, fill):
+            new = np.full(shape, fill, dtype=dtype)
+            if old is not None:
+                new[:self.count] = old[:self.count]
+            return new
+
+        self._replace('vectors.npy', grown(
+            self.vectors, (capacity, self.dimensions), np.float32, 0
+        ))
+        self._replace('ids.npy', grown(self.ids, capacity, np.int64, -1))
+        self._replace('lists.npy', grown(self.lists, capacity, np.int32, -1))
+        self._write_meta(generation=(self._generation or 0) + 1)
+        self._stamp = None
+        self._open(self._read_meta())
+        self.refresh()
+
+    def _rekey(self):
+        """Sort the ids of the live rows into new keys files"""
+        live = np.flatnonzero(self.ids[:self.count] >= 0)
+        ids = np.asarray(self.ids[live])
+        order = np.argsort(ids, kind='stable')
+        self._replace('keys.npy', ids[order])
+        self._replace('slots.npy', live[order].astype(np.int64))
+        self._keyed = self.count
+        self._write_meta(generation=self._generation + 1)
+        self._stamp = None
+        self._open(self._read_meta())
+        self.refresh()
+
+    def _commit(self):
+        self.vectors.flush()
+        self.ids.flush()
+        self.lists.flush()
+        self._write_meta()
+        self._stamp = self._meta_stamp()
+
+    # Updates
+
+    def _find(self, ids):
+        """The row of each of ids, or -1 where it is not in the index"""
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.full(len(ids), -1, dtype=np.int64)
+        if not self.count:
+            return rows
+        if len(self.keys):
+            at = np.searchsorted(self.keys, ids)
+            at[at == len(self.keys)] = 0
+            found = self.keys[at] == ids
+            rows[found] = self.slots[at[found]]
+        # Rows added since the keys were sorted. Their ids only change to
+        # -1 in place, which the check below catches, so the sorted copy
+        # holds until rows are added.
+        if self._tail is None or self._tail[0] != self.count:
+            tail = np.asarray(self.ids[self._keyed:self.count])
+            order = np.argsort(tail, kind='stable')
+            self._tail = (self.count, tail[order], order)
+        _, tail, order = self._tail
+        if len(tail):
+            at = np.searchsorted(tail, ids)
+            at[at == len(tail)] = 0
+            found = tail[at] == ids
+            rows[found] = self._keyed + order[at[found]]
+        stale = rows >= 0
+        stale[stale] = self.ids[rows[stale]] != ids[stale]
+        rows[stale] = -1
+        return rows
+
+    def _assign(self, vectors):
+        if self.centroids is None:
+            return np.full(len(vectors), -1, dtype=np.int32)
+        return nearest(vectors, self.centroids)
+
+    def add(self, ids, vectors):
+        """Insert or replace the vectors of ids"""
+        ids = [int(vector_id) for vector_id in ids]
+        if not ids:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(
+            len(ids), self.dimensions
+        )
+        with self._writing():
+            lists = self._assign(vectors)
+            found = self._find(ids)
+            count = self.count
+            placed = {}
+            rows = []
+            moved = []
+            for vector_id, row, list_id in zip(
+                ids, found.tolist(), lists.tolist()
+            ):
+                if vector_id in placed:
+                    row = placed[vector_id]
+                elif row < 0 or self.lists[row] != list_id:
+                    if row >= 0:
+                        moved.append(row)
+                    row = count
+                    count += 1
+                placed[vector_id] = row
+                rows.append(row)
+            if count > len(self.ids):
+                self._resize(max(2 * len(self.ids), count))
+            self.ids[moved] = -1
+            self.vectors[rows] = vectors
+            self.ids[rows] = ids
+            self.lists[rows] = lists
+            self.count = count
+            self._commit()
+            if count - self._keyed > max(MIN_CAPACITY, count // 10):
+                self._rekey()
+
+    def remove(self, ids):
+        with self._writing():
+            rows = self._find([int(vector_id) for vector_id in ids])
+            rows = rows[rows >= 0]
+            if len(rows):
+                self.ids[rows] = -1
+                self._commit()
+
+    def __len__(self):
+        self.refresh()
+        if not self.count:
+            return 0
+        return int(np.count_nonzero(self.ids[:self.count] >= 0))
+
+    def __contains__(self, vector_id):
+        self.refresh()
+        return bool(self._find([vector_id])[0] >= 0)
+
+    def train(self, lists, iterations=10, sample=100_000, seed=0):
+        """
+        Cluster the vectors into lists with spherical k-means and assign
+        every row to its nearest centroid.
+        """
+        with self._writing():
+            live = np.flatnonzero(self.ids[:self.count] >= 0)
+            if len(live) < lists:
+                raise ValueError(
+                    f'{len(live)} vectors cannot be split into {lists} lists'
+                )
+            rng = np.random.default_rng(seed)
+            picked = np.sort(
+                rng.choice(live, min(sample, len(live)), replace=False)
+            )
+            points = np.asarray(self.vectors[picked])
+            centroids = points[rng.choice(len(points), lists, replace=False)]
+            for _ in range(iterations):
+                labels = nearest(points, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, points)
+                norms = np.linalg.norm(sums, axis=1, keepdims=True)
+                empty = norms[:, 0] == 0
+                centroids = np.where(
+                    empty[:, None], centroids, sums / np.maximum(norms, 1e-12)
+                )
+            self.centroids = centroids.astype(np.float32)
+            self.lists[:self.count] = nearest(
+                self.vectors[:self.count], self.centroids
+            )
+            self._replace('centroids.npy', self.centroids)
+            self.lists.flush()
+            self._write_meta(generation=self._generation + 1)
+            self._stamp = None
+            self._order = self._bounds = None
+            self._sorted = 0
+
+    # Queries
+
+    def _candidates(self, query, nprobe):
+        """Rows to scan: the nprobe nearest lists and the unsorted rows"""
+        if self.centroids is None:
+            return None
+        if self.count - self._sorted > max(MIN_CAPACITY, self.count // 10):
+            lists = np.asarray(self.lists[:self.count])
+            self._order = np.argsort(lists, kind='stable').astype(np.int64)
+            self._bounds = np.searchsorted(
+                lists[self._order], np.arange(len(self.centroids) + 1)
+            )
+            self._sorted = self.count
+        nearest = np.argsort(-(self.centroids @ query))[:nprobe]
+        parts = [np.arange(self._sorted, self.count)]
+        if self._order is not None:
+            parts += [
+                self._order[self._bounds[i]:self._bounds[i + 1]]
+                for i in nearest
+            ]
+        return np.concatenate(parts)
+
+    def search(self, query, k=10, nprobe=8, exclude=()):
+        """The k (id, score) pairs closest to query, best first"""
+        self.refresh()
+        if not self.count:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        rows = self._candidates(query, nprobe)
+        if rows is None:
+            scores = np.concatenate([
+                self.vectors[start:min(start + BLOCK, self.count)] @ query
+                for start in range(0, self.count, BLOCK)
+            ])
+            ids = np.asarray(self.ids[:self.count])
+        else:
+            rows.sort()
+            scores = self.vectors[rows] @ query
+            ids = self.ids[rows]
+        scores[ids < 0] = -np.inf
+        if exclude:
+            scores[np.isin(ids, list(exclude))] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [
+            (int(ids[i]), float(scores[i])) for i in top
+            if scores[i] > -np.inf
+        ]
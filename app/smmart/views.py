@@ -1,6 +1,5 @@
 from rest_framework import (
     generics,
-    authentication,
     viewsets,
     status
 )
@@ -8,41 +7,69 @@ from rest_framework.generics import GenericAPIView
 
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
+from rest_framework.decorators import action, api_view
 
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from core.authentication import CachedTokenAuthentication, evict_organization
+from core.bulk import MAX_PARAMS, chunked
+from core.catalog import catalog
+from core.entitlements import active_package_status
 from core.permissions import IsAdminUser
 from django.contrib.auth import get_user_model
 from user.serializers import (
     AdminUserCreateSerializer, AdminUserUpdateSerializer,
     PackageSerializer
     )
+from .embeddings import remove_topic, similar_topics, suggest_keywords
+from .exports import (
+    CONTENT_TYPES,
+    database_safe,
+    export_chunks,
+    topic_rows,
+)
+from .ingest import store_posts
+from .pagination import TopicPagination, UserPagination
+from .parsers import NDJSONParser
 from .serializers import (
+    ExportQuerySerializer,
+    IngestPostSerializer,
+    MetricQuerySerializer,
+    RollupQuerySerializer,
+    SimilarQuerySerializer,
+    TrendingQuerySerializer,
     TopicSerializer,
     # GetDataSerializer,
     OrganizationSerializer,
     PackageStatusSerializer
 )
+from .timeseries import read as read_metric
+from .trending import trending_terms, window
 from core.models import (
     Topics,
     Organization,
     User,
     Package,
     # UserRole,
-    PackageStatus
+    PackageStatus,
+    TopicDailyRollup,
+    normalize_term
     )
 
 
 class AdminUserCreateAPIView(generics.CreateAPIView):
     serializer_class = AdminUserCreateSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsAdminUser]
 
 
 class ManageOrganizationAPIView(generics.RetrieveUpdateDestroyAPIView):
     """manage the Organization created by admin user"""
     serializer_class = OrganizationSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     def get_object(self):
@@ -52,7 +79,7 @@ class ManageOrganizationAPIView(generics.RetrieveUpdateDestroyAPIView):
 
 class TopicCreationAPIView(generics.CreateAPIView):
     serializer_class = TopicSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
 
@@ -60,21 +87,199 @@ class TopicViewSet(viewsets.ModelViewSet):
     """manage the topics created by user"""
     serializer_class = TopicSerializer
     queryset = Topics.objects.all()
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = TopicPagination
 
     def get_queryset(self):
         """Return all topics created by the user"""
         user = self.request.user
         topics = Topics.objects.filter(user=user)
-        # Serialize the queryset using TopicSerializer
+
+        keyword = self.request.query_params.get('keyword')
+        if keyword:
+            topics = topics.filter(
+                keyword_terms__name=normalize_term(keyword)
+                )
+
+        platform = self.request.query_params.get('platform')
+        if platform:
+            topics = topics.filter(
+                platform_terms__name=normalize_term(platform)
+                )
 
         return topics
 
+    def create(self, request, *args, **kwargs):
+        """Create the topic and suggest keywords and similar topics"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        topic = serializer.save()
+        return Response({
+            **serializer.data,
+            'suggested_keywords': suggest_keywords(topic),
+            'similar_topics': similar_topics(topic),
+        }, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        topic_id = instance.id
+        organization_id = self.request.user.organization_id
+        with transaction.atomic():
+            instance.delete()
+            transaction.on_commit(
+                lambda: remove_topic(topic_id, organization_id)
+                )
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Topics of the organization most like this one"""
+        topic = self.get_object()
+        query = SimilarQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        return Response({'results': similar_topics(
+            topic, limit=query.validated_data['limit']
+            )})
+
+    @action(detail=True, methods=['get'])
+    def suggestions(self, request, pk=None):
+        """Known keywords related to the topic that it does not track"""
+        topic = self.get_object()
+        query = SimilarQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        return Response({'results': suggest_keywords(
+            topic, limit=query.validated_data['limit']
+            )})
+
+    @action(detail=True, methods=['get'])
+    def rollups(self, request, pk=None):
+        """Daily mentions and sentiment of the topic over a date range"""
+        topic = self.get_object()
+        query = RollupQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        rows = TopicDailyRollup.objects.filter(
+            topic=topic, day__range=(params['start'], params['end'])
+        )
+        if params.get('keyword'):
+            rows = rows.filter(keyword__name=normalize_term(params['keyword']))
+        if params.get('platform'):
+            rows = rows.filter(
+                platform__name=normalize_term(params['platform'])
+                )
+
+        columns = {
+            'day': 'day',
+            'keyword': 'keyword__name',
+            'platform': 'platform__name',
+        }
+        fields = [columns[group] for group in params['group_by']]
+        rows = rows.values(*fields).annotate(
+            mentions=Sum('mentions'),
+            positive=Sum('positive'),
+            negative=Sum('negative'),
+            sentiment=Sum('sentiment'),
+        ).order_by(*fields)
+
+        return Response({
+            'start': params['start'],
+            'end': params['end'],
+            'results': [
+                {
+                    **{group: row[columns[group]]
+                       for group in params['group_by']},
+                    'mentions': row['mentions'],
+                    'positive': row['positive'],
+                    'negative': row['negative'],
+                    'sentiment': round(
+                        row['sentiment'] / row['mentions'], 3
+                    ) if row['mentions'] else None,
+                }
+                for row in rows
+            ],
+        })
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """
+        Download the topic's posts as CSV or NDJSON, optionally gzipped.
+
+        The file is streamed as rows are read, so exports of any size
+        use the same memory.
+        """
+        topic = self.get_object()
+        query = ExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        file_format = params['type']
+        rows = topic_rows(topic.id, params.get('start'), params.get('end'))
+        filename = f'topic-{topic.id}.{file_format}'
+        content_type = CONTENT_TYPES[file_format]
+        if params['gzip']:
+            filename += '.gz'
+            content_type = 'application/gzip'
+
+        # Served by the WSGI workers: under ASGI, Django 4.0 reads every
+        # chunk on the event loop (see database_safe)
+        response = StreamingHttpResponse(
+            database_safe(
+                export_chunks(rows, file_format, compress=params['gzip'])
+            ),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="{filename}"'
+        # Keep the proxy from buffering the whole file before sending it
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @action(detail=True, methods=['get'])
+    def metrics(self, request, pk=None):
+        """
+        A metric of the topic over a time range, as raw samples or
+        hourly or daily aggregates
+        """
+        topic = self.get_object()
+        query = MetricQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        series = read_metric(
+            topic.id, params['metric'], params['start'], params['end'],
+            tier=params.get('tier'),
+        )
+        return Response({
+            'metric': params['metric'],
+            'tier': series.tier,
+            'start': params['start'],
+            'end': params['end'],
+            'results': series.rows(),
+        })
+
+    @action(detail=True, methods=['get'])
+    def trending(self, request, pk=None):
+        """Terms spiking in the topic's recent posts"""
+        topic = self.get_object()
+        query = TrendingQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        now = timezone.now()
+        oldest, recent, _ = window(now)
+        return Response({
+            'window_start': oldest,
+            'recent_start': recent,
+            'results': trending_terms(
+                topic.id, limit=query.validated_data['limit'], now=now
+                ),
+        })
+
 
 # class GetDataAPIView(generics.CreateAPIView):
 #     serializer_class = GetDataSerializer
-#     authentication_classes = [authentication.TokenAuthentication]
+#     authentication_classes = [CachedTokenAuthentication]
 #     permission_classes = [IsAuthenticated]
 
 #     def post(self, request, *args, **kwargs):
@@ -128,12 +333,14 @@ class TopicViewSet(viewsets.ModelViewSet):
 class ManageAdminUserAPIView(generics.RetrieveUpdateDestroyAPIView):
     """manage the authenticated user"""
     serializer_class = AdminUserCreateSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
         """Return authenticated admin user"""
-        return self.request.user
+        return get_user_model().objects.with_profile().get(
+            pk=self.request.user.pk
+            )
 
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
@@ -144,14 +351,15 @@ class ManageAdminUserAPIView(generics.RetrieveUpdateDestroyAPIView):
 class UserViewSet(viewsets.ModelViewSet):
     serializer_class = AdminUserCreateSerializer
     queryset = get_user_model().objects.all()
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsAdminUser]
+    pagination_class = UserPagination
 
     def get_queryset(self):
         """Return all users created by the admin user"""
         admin_user = self.request.user
         organization_id = admin_user.organization_id
-        queryset = get_user_model().objects.filter(
+        queryset = get_user_model().objects.with_profile().filter(
             organization_id=organization_id
             )
         return queryset
@@ -160,15 +368,12 @@ class UserViewSet(viewsets.ModelViewSet):
 class ManageOrganizationPackageAPIView(generics.RetrieveAPIView):
     serializer_class = PackageStatusSerializer
     queryset = PackageStatus.objects.all()
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     def retrieve(self, request, *args, **kwargs):
         user_organization_id = request.user.organization_id
-        instance = PackageStatus.objects.filter(
-            organization_id=user_organization_id,
-            status='y'
-            ).first()
+        instance = active_package_status(user_organization_id)
 
         if not instance:
             return Response(
@@ -183,7 +388,7 @@ class UpdatePackage(GenericAPIView):
 
     serializer_class = PackageSerializer
     permission_classes = [IsAuthenticated, IsAdminUser]
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
     def put(self, request):
 
@@ -191,44 +396,143 @@ class UpdatePackage(GenericAPIView):
 
         user_organization_id = request.user.organization_id
 
-        current_package = PackageStatus.objects.filter(
-            organization=user_organization_id, status='y'
-        ).first()
-
         try:
-            selected_package = Package.objects.get(name=package_name)
+            selected_package = catalog.package(package_name)
         except Package.DoesNotExist:
             return Response(
                 {'error': 'Package does not exist'},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        if selected_package.id == current_package.package_id:
-            current_package.start_date = timezone.now()
-            current_package.end_date = current_package.start_date + timezone.timedelta(days=30)
-            current_package.save()
-            new_package_status = current_package
-        else:
-            current_package.status = 'n'
-            current_package.save()
-
-            start_date = timezone.now()
-            end_date = start_date + timezone.timedelta(days=30)
-            status_value = 'y'
-
-            new_package_status = PackageStatus.objects.create(
-                organization_id=user_organization_id,
-                package=selected_package,
-                start_date=start_date,
-                end_date=end_date,
-                status=status_value,
-                created_by=request.user.id
-            )
+        start_date = timezone.now()
+        end_date = start_date + timezone.timedelta(days=30)
+
+        with transaction.atomic():
+            # The organization row serializes concurrent switches, so there
+            # is never more than one active PackageStatus.
+            Organization.objects.select_for_update().filter(
+                id=user_organization_id
+            ).exists()
+            current_package = PackageStatus.objects.select_for_update().filter(
+                organization_id=user_organization_id, status='y'
+            ).first()
 
-            users_to_update = get_user_model().objects.filter(organization_id=user_organization_id)
-            for user in users_to_update:
-                user.package_id = selected_package.id
-                user.save()
+            if current_package and \
+                    selected_package.id == current_package.package_id:
+                current_package.start_date = start_date
+                current_package.end_date = end_date
+                current_package.save()
+                new_package_status = current_package
+            else:
+                PackageStatus.objects.filter(
+                    organization_id=user_organization_id, status='y'
+                ).update(status='n')
+
+                new_package_status = PackageStatus.objects.create(
+                    organization_id=user_organization_id,
+                    package=selected_package,
+                    start_date=start_date,
+                    end_date=end_date,
+                    status='y',
+                    created_by=request.user.id
+                )
+
+                get_user_model().objects.filter(
+                    organization_id=user_organization_id
+                ).update(package_id=selected_package.id)
+                transaction.on_commit(
+                    lambda: evict_organization(user_organization_id)
+                )
 
         serializer = PackageStatusSerializer(new_package_status)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class PostIngestAPIView(GenericAPIView):
+    """
+    Ingest collected posts sent as newline-delimited JSON.
+
+    Each line is one post. The body is read from the request stream and
+    stored every INGEST_BATCH_SIZE lines, so memory use does not depend
+    on the payload size. topic_ids must name topics of the user's
+    organization. The response has the accept/reject counts of the
+    whole stream and its first max_errors errors, so its size does not
+    depend on the payload either.
+    """
+    serializer_class = IngestPostSerializer
+    parser_classes = [NDJSONParser]
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    max_errors = 20
+
+    def post(self, request):
+        totals = dict.fromkeys(
+            ['accepted', 'rejected', 'stored', 'duplicates',
+             'near_duplicates', 'batches'], 0
+        )
+        errors = []
+        lines = []
+        for line in request.data:
+            lines.append(line)
+            if len(lines) >= settings.INGEST_BATCH_SIZE:
+                self.add_batch(totals, errors, lines)
+                lines = []
+        if lines:
+            self.add_batch(totals, errors, lines)
+
+        return Response(
+            {**totals, 'errors': errors}, status=status.HTTP_200_OK
+        )
+
+    def add_batch(self, totals, errors, lines):
+        batch_errors, counts = self.ingest_batch(lines)
+        for name, count in counts.items():
+            totals[name] += count
+        totals['batches'] += 1
+        errors.extend(batch_errors[:self.max_errors - len(errors)])
+
+    def ingest_batch(self, lines):
+        errors = []
+        posts = []
+        for number, record in lines:
+            if isinstance(record, ValueError):
+                errors.append({'line': number, 'errors': str(record)})
+                continue
+            serializer = self.get_serializer(data=record)
+            if serializer.is_valid():
+                posts.append((number, serializer.to_post()))
+            else:
+                errors.append({'line': number, 'errors': serializer.errors})
+
+        topic_ids = {i for _, post in posts for i in post.topic_ids}
+        allowed = set()
+        for chunk in chunked(topic_ids, MAX_PARAMS):
+            allowed.update(Topics.objects.filter(
+                id__in=chunk,
+                user__organization_id=self.request.user.organization_id,
+            ).values_list('id', flat=True))
+
+        accepted = []
+        for number, post in posts:
+            unknown = set(post.topic_ids) - allowed
+            if unknown:
+                errors.append({
+                    'line': number,
+                    'errors': {'topic_ids': [
+                        f'Unknown topic {topic_id}'
+                        for topic_id in sorted(unknown)
+                    ]},
+                })
+            else:
+                accepted.append(post)
+
+        stats = store_posts(accepted)
+        errors.sort(key=lambda error: error['line'])
+        return errors, {
+            'accepted': len(accepted),
+            'rejected': len(errors),
+            'stored': stats.stored,
+            'duplicates': stats.duplicates,
+            'near_duplicates': stats.near_duplicates,
+        }
@@ -9,10 +9,9 @@ from django.utils.translation import gettext as _
 
 from rest_framework import serializers
 from django.utils import timezone
+from core.catalog import catalog
 from core.models import (
     Organization,
-    Package,
-    UserRole,
     PackageStatus
     )
 
@@ -55,8 +54,8 @@ class UserSerializer(serializers.ModelSerializer):
         organization_data = validated_data.pop('organization', None)
         organization = Organization.objects.create(**organization_data)
 
-        package = Package.objects.get(name='basic')
-        role = UserRole.objects.get(name='admin')
+        package = catalog.package('basic')
+        role = catalog.role('admin')
 
         user = get_user_model().objects.create_user(
             organization=organization,
@@ -131,7 +130,7 @@ class AdminUserCreateSerializer(UserSerializer):
         role_data = validated_data.pop('role')
 
         if role_data['name'] in ROLES:
-            role, _ = UserRole.objects.get_or_create(name=role_data['name'])
+            role, _ = catalog.get_or_create_role(role_data['name'])
         else:
             raise ValueError('Invalid Role Name')
 
@@ -163,7 +162,7 @@ class AdminUserUpdateSerializer(serializers.ModelSerializer):
         role_data = validated_data.pop('role')
 
         if role_data['name'] in ROLES:
-            role, _ = UserRole.objects.get_or_create(name=role_data['name'])
+            role, _ = catalog.get_or_create_role(role_data['name'])
         else:
             raise ValueError('Invalid Role Name')
 
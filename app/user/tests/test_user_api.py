@@ -166,6 +166,15 @@ class PrivateUserAPITests(TestCase):
         self.assertEqual(res.data["name"], self.user.name)
         self.assertEqual(res.data["email"], self.user.email)
 
+    def test_retrieve_profile_query_budget(self):
+        """Test profile relations are fetched in one query"""
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["organization"]["name"],
+                         self.user.organization.name)
+        self.assertEqual(res.data["package"]["name"], 'basic')
+
     def test_post_me_not_allowed(self):
         """Test POST not allowed for me endpoint"""
         me_url = reverse('user:me')  
@@ -1,8 +1,10 @@
 """
 Views for the User API
 """
-from rest_framework import generics, authentication, permissions
+from drf_spectacular.utils import extend_schema
+from rest_framework import generics, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
 from user.serializers import (
@@ -13,6 +15,8 @@ from user.serializers import (
 
 from django.contrib.auth import get_user_model
 
+from core.authentication import CachedTokenAuthentication
+
 
 class CreateUserView(generics.CreateAPIView):
     """
@@ -34,15 +38,29 @@ class CreateTokenView(ObtainAuthToken):
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         """Retrieve and return the authneticated user"""
-        return self.request.user
+        return get_user_model().objects.with_profile().get(
+            pk=self.request.user.pk
+            )
 
     def get_serializer_class(self):
         # Use UserUpdateSerializer for PUT and PATCH requests
         if self.request.method in ['PUT', 'PATCH']:
             return UserUpdateSerializer
         return UserSerializer
+
+
+class LogoutView(generics.GenericAPIView):
+    """Delete the auth token of the authenticated user"""
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(request=None, responses={204: None})
+    def post(self, request):
+        if request.auth is not None:
+            request.auth.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
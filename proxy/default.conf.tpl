@@ -5,6 +5,17 @@ server {
         alias /vol/static;
     }
 
+    # Posts are streamed to the app as they arrive instead of being
+    # buffered whole; the app stores them in batches. The limit still
+    # bounds how long one upload can hold a uwsgi worker.
+    location /api/django/smmart/posts/ingest {
+        uwsgi_pass              ${APP_HOST}:${APP_PORT};
+        include                 /etc/nginx/uwsgi_params;
+        client_max_body_size    ${INGEST_MAX_BODY_SIZE};
+        uwsgi_request_buffering off;
+        uwsgi_read_timeout      300s;
+    }
+
     location / {
         uwsgi_pass              ${APP_HOST}:${APP_PORT};
         include                 /etc/nginx/uwsgi_params;